@@ -0,0 +1,317 @@
+"""
+Local stand-in for the Graph API insights edge and batch endpoint and the Google Ads search endpoints.
+
+Responses are generated up front, so the server adds little work of its own
+to a benchmark. Run it directly to point a source at it by hand:
+
+    python benchmarks/mock_ads_server.py --pages 20 --page-size 500
+"""
+from typing import Dict, Any, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+import time
+
+FACEBOOK_PREFIX = '/facebook'
+GOOGLE_PREFIX = '/google'
+
+class MockAdsConfig:
+    """Shape of the data served and the faults injected"""
+
+    def __init__(self,
+                 pages: int = 10,
+                 page_size: int = 500,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 rate_limit_every: int = 0,
+                 rate_limit_delay: float = 0.05,
+                 seed: int = 0):
+        self.pages = pages
+        self.page_size = page_size
+        # Seconds added to every response
+        self.latency = latency
+        # Fraction of data requests answered with HTTP 500
+        self.error_rate = error_rate
+        # Every Nth data request is rejected as rate limited (0 disables)
+        self.rate_limit_every = rate_limit_every
+        # Retry delay advertised by the rate-limit responses, in seconds
+        self.rate_limit_delay = rate_limit_delay
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+def _facebook_rows(page: int, page_size: int) -> List[Dict[str, Any]]:
+    rows = []
+    for index in range(page_size):
+        row_id = page * page_size + index
+        rows.append({
+            'date_start': f"2023-01-{row_id % 28 + 1:02d}",
+            'date_stop': f"2023-01-{row_id % 28 + 1:02d}",
+            'campaign_id': str(1000 + row_id % 50),
+            'campaign_name': f"Campaign {row_id % 50}",
+            'adset_id': str(20000 + row_id % 400),
+            'ad_id': str(300000 + row_id),
+            'impressions': str(1000 + row_id % 9000),
+            'clicks': str(row_id % 300),
+            'spend': f"{(row_id % 5000) / 100:.2f}",
+        })
+    return rows
+
+def _google_rows(page: int, page_size: int) -> List[Dict[str, Any]]:
+    rows = []
+    for index in range(page_size):
+        row_id = page * page_size + index
+        rows.append({
+            'campaign': {'id': str(1000 + row_id % 50), 'name': f"Campaign {row_id % 50}"},
+            'adGroup': {'id': str(20000 + row_id % 400)},
+            'segments': {'date': f"2023-01-{row_id % 28 + 1:02d}"},
+            'metrics': {
+                'impressions': str(1000 + row_id % 9000),
+                'clicks': str(row_id % 300),
+                'costMicros': str((row_id % 5000) * 10000),
+            },
+        })
+    return rows
+
+class MockAdsServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding pre-rendered pages and request counters"""
+
+    daemon_threads = True
+
+    def __init__(self, config: MockAdsConfig, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), MockAdsHandler)
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0}
+        # Only the paging block depends on the request, so rows are rendered once
+        self.facebook_pages = [
+            json.dumps(_facebook_rows(page, config.page_size)).encode('utf-8')
+            for page in range(config.pages)
+        ]
+        google_pages = [_google_rows(page, config.page_size) for page in range(config.pages)]
+        self.google_pages = [
+            json.dumps(dict(
+                {'results': rows},
+                **({'nextPageToken': str(page + 1)} if page + 1 < config.pages else {})
+            )).encode('utf-8')
+            for page, rows in enumerate(google_pages)
+        ]
+        self.google_stream = json.dumps([{'results': rows} for rows in google_pages]).encode('utf-8')
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_fault(self) -> Optional[str]:
+        """Count a data request and decide whether it fails: 'error', 'rate_limit' or None"""
+        with self.lock:
+            self.stats['requests'] += 1
+            count = self.stats['requests']
+            if self.config.rate_limit_every and count % self.config.rate_limit_every == 0:
+                self.stats['rate_limited'] += 1
+                return 'rate_limit'
+            if self.config.error_rate and self.random.random() < self.config.error_rate:
+                self.stats['errors'] += 1
+                return 'error'
+        return None
+
+class MockAdsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, a kept-alive
+    # connection stalls ~40ms per response waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        if self.server.config.latency:
+            time.sleep(self.server.config.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None):
+        self._send(status, json.dumps(data).encode('utf-8'), headers)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        if path == '/__stats':
+            with self.server.lock:
+                self._send_json(200, self.server.stats)
+        elif path == f"{FACEBOOK_PREFIX}/me":
+            self._send_json(200, {'id': '1', 'name': 'Benchmark'})
+        elif path.startswith(FACEBOOK_PREFIX) and path.endswith('/insights'):
+            self._facebook_insights(path, parse_qs(parts.query))
+        elif path.startswith(f"{GOOGLE_PREFIX}/customers/"):
+            self._send_json(200, {'resourceName': path[len(GOOGLE_PREFIX) + 1:]})
+        else:
+            self._send_json(404, {'error': {'message': f"Unknown path: {path}"}})
+
+    def do_POST(self):
+        body = self._read_body()
+        path = urlsplit(self.path).path
+        if path.rstrip('/') == FACEBOOK_PREFIX:
+            self._facebook_batch(parse_qs(body.decode('utf-8')))
+        elif path.startswith(GOOGLE_PREFIX) and path.endswith('googleAds:search'):
+            self._google_search(json.loads(body or b'{}'))
+        elif path.startswith(GOOGLE_PREFIX) and path.endswith('googleAds:searchStream'):
+            self._google_stream()
+        else:
+            self._send_json(404, {'error': {'message': f"Unknown path: {path}"}})
+
+    def _facebook_insights(self, path: str, query: Dict[str, List[str]]):
+        fault = self.server.next_fault()
+        usage = {'call_count': 10, 'total_time': 10, 'total_cputime': 10}
+        if fault == 'error':
+            self._send_json(500, {'error': {'message': 'Internal error', 'code': 1}})
+            return
+        if fault == 'rate_limit':
+            self._send_json(400, {'error': {'message': 'User request limit reached', 'code': 17}},
+                            {'X-App-Usage': json.dumps(dict(usage, call_count=100))})
+            return
+
+        self._send(200, self._facebook_page(path, query), {'X-App-Usage': json.dumps(usage)})
+
+    def _facebook_page(self, path: str, query: Dict[str, List[str]]) -> bytes:
+        page = int(query.get('after', ['0'])[0])
+        paging = {}
+        if page + 1 < self.server.config.pages:
+            paging = {
+                'cursors': {'after': str(page + 1)},
+                'next': f"{self.server.url}{path}?after={page + 1}",
+            }
+        return b'{"data": ' + self.server.facebook_pages[page] + b', "paging": ' + json.dumps(paging).encode('utf-8') + b'}'
+
+    def _facebook_batch(self, form: Dict[str, List[str]]):
+        """Answer a batch call; faults apply to the whole call"""
+        fault = self.server.next_fault()
+        usage = {'call_count': 10, 'total_time': 10, 'total_cputime': 10}
+        if fault == 'error':
+            self._send_json(500, {'error': {'message': 'Internal error', 'code': 1}})
+            return
+        if fault == 'rate_limit':
+            self._send_json(400, {'error': {'message': 'User request limit reached', 'code': 17}},
+                            {'X-App-Usage': json.dumps(dict(usage, call_count=100))})
+            return
+
+        results = []
+        for item in json.loads(form.get('batch', ['[]'])[0]):
+            parts = urlsplit('/' + item['relative_url'])
+            if not parts.path.endswith('/insights'):
+                results.append({'code': 404, 'body': json.dumps({'error': {'message': 'Unknown path', 'code': 100}})})
+                continue
+            body = self._facebook_page(FACEBOOK_PREFIX + parts.path, parse_qs(parts.query))
+            results.append({'code': 200, 'body': body.decode('utf-8')})
+        self._send_json(200, results, {'X-App-Usage': json.dumps(usage)})
+
+    def _google_fault_response(self, fault: str):
+        if fault == 'error':
+            self._send_json(500, {'error': {'code': 500, 'status': 'INTERNAL'}})
+            return
+        self._send_json(429, {'error': {
+            'code': 429,
+            'status': 'RESOURCE_EXHAUSTED',
+            'details': [{'errors': [{'details': {'quotaErrorDetails': {
+                'retryDelay': f"{self.server.config.rate_limit_delay}s"
+            }}}]}],
+        }})
+
+    def _google_search(self, body: Dict[str, Any]):
+        fault = self.server.next_fault()
+        if fault:
+            self._google_fault_response(fault)
+            return
+        page = int(body.get('pageToken') or 0)
+        self._send(200, self.server.google_pages[page])
+
+    def _google_stream(self):
+        fault = self.server.next_fault()
+        if fault:
+            self._google_fault_response(fault)
+            return
+        self._send(200, self.server.google_stream)
+
+def serve(config: MockAdsConfig, port: int = 0, ready=None):
+    """Serve until interrupted, reporting the bound URL through ``ready`` if given"""
+    server = MockAdsServer(config, port=port)
+    if ready is not None:
+        ready.put(server.url)
+    else:
+        print(f"Mock ads API listening on {server.url} "
+              f"(Facebook base_url {server.url}{FACEBOOK_PREFIX}, Google base_url {server.url}{GOOGLE_PREFIX})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+class MockAdsProcess:
+    """Run the mock server in a child process so it does not compete for the benchmark's GIL"""
+
+    def __init__(self, config: MockAdsConfig):
+        self.config = config
+        self.url = None
+        self._process = None
+
+    def __enter__(self) -> 'MockAdsProcess':
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=serve, args=(self.config, 0, ready), daemon=True)
+        self._process.start()
+        self.url = ready.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        self._process.join()
+
+    def stats(self) -> Dict[str, int]:
+        """Request counters kept by the server"""
+        import urllib.request
+        with urllib.request.urlopen(f"{self.url}/__stats") as response:
+            return json.loads(response.read())
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10, help='pages per report')
+    parser.add_argument('--page-size', type=int, default=500, help='rows per page')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='reject every Nth request as rate limited')
+    parser.add_argument('--rate-limit-delay', type=float, default=0.05, help='advertised retry delay in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+def config_from_args(args: argparse.Namespace) -> MockAdsConfig:
+    return MockAdsConfig(
+        pages=args.pages,
+        page_size=args.page_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_every=args.rate_limit_every,
+        rate_limit_delay=args.rate_limit_delay,
+        seed=args.seed
+    )
+
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    serve(config_from_args(args), port=args.port)
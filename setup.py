@@ -5,7 +5,22 @@ setup(
     version="0.1.0",
     packages=find_packages(where="src"),
     package_dir={"": "src"},
+    python_requires=">=3.8",
     install_requires=[
         # Add dependencies from requirements.txt if needed
     ],
+    extras_require={
+        'columnar': ['numpy', 'pyarrow'],
+        'fastjson': ['orjson'],
+    },
+    entry_points={
+        'console_scripts': [
+            'datahub = datahub.cli:main',
+        ],
+        # Data source plugins, imported by DataSourceFactory on first use
+        'datahub.sources': [
+            'google_ads = datahub.sources.google_ads:GoogleAdsSource',
+            'facebook_ads = datahub.sources.facebook_ads:FacebookAdsSource',
+        ],
+    },
 )
@@ -0,0 +1,221 @@
+"""
+Command line interface: ``datahub sync`` pulls configured sources into sinks
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence
+import argparse
+import os
+import sys
+import threading
+import time
+from .core.checkpoint import CheckpointStore
+from .core.config_manager import ConfigManager
+from .core.scheduler import SyncJob, SyncScheduler
+from .core.storage import SqliteDatabase
+from .core.throttle import RateLimiter
+from .core.transport import HttpTransport
+from .sinks import SINK_FORMATS, create_sink
+
+DATE_FORMAT = '%Y-%m-%d'
+
+def job_label(job: SyncJob) -> str:
+    return f"{job.source_id} {job.start_date.strftime(DATE_FORMAT)}..{job.end_date.strftime(DATE_FORMAT)}"
+
+# ConfigManager of the worker process, opened by the first job it runs
+_worker_config: Dict[tuple, ConfigManager] = {}
+
+def _init_worker():
+    """Drop state a forked worker inherited from the parent.
+
+    HTTP sessions, SQLite connections and the locks guarding shared
+    registries must not be used from two processes, so each worker starts
+    with empty registries and builds its own transport (one pooled session
+    per worker) on first use. Inherited objects are dropped, not closed,
+    since closing them would act on the parent's sockets and files.
+    """
+    HttpTransport._shared = {}
+    HttpTransport._shared_lock = threading.Lock()
+    RateLimiter._shared = {}
+    RateLimiter._shared_lock = threading.Lock()
+    CheckpointStore._shared = {}
+    CheckpointStore._shared_lock = threading.Lock()
+    SqliteDatabase._local = threading.local()
+    SqliteDatabase._connections = {}
+    SqliteDatabase._connections_lock = threading.Lock()
+    _worker_config.clear()
+
+def run_job(job: SyncJob, config_path: str, storage: str, sink_format: str, output: str,
+            sink_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Pull one job into its own sink; return a summary instead of raising.
+
+    Each job commits its files when it finishes, so a failed job leaves no
+    partial output and the other jobs are unaffected.
+    """
+    started = time.perf_counter()
+    summary = {'label': job_label(job), 'rows': 0, 'error': None}
+    try:
+        config_manager = _worker_config.get((config_path, storage))
+        if config_manager is None:
+            config_manager = _worker_config[(config_path, storage)] = ConfigManager(config_path, storage)
+        source = config_manager.get_data_source(job.source_type, job.source_id)
+        if source is None:
+            raise RuntimeError(f"Unknown data source: {job.source_id}")
+        if not source.connect():
+            raise RuntimeError(f"Could not connect to {job.source_id}")
+        options = dict(sink_options or {})
+        if sink_format == 'parquet':
+            # Keep ids such as '00123' as strings rather than inferring int64
+            options.setdefault('dimensions', job.dimensions)
+        with create_sink(sink_format, output, **options) as sink:
+            summary['rows'] = source.export(job.start_date, job.end_date, job.metrics, job.dimensions,
+                                            sink, source_label=job.source_id)
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+def _split_fields(value: Optional[str]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+def _parse_date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date as YYYY-MM-DD, got {value!r}")
+
+def _parse_window(value: str):
+    """'day', 'week' or a number of days, passed on to split_date_range"""
+    return int(value) if value.isdigit() else value
+
+def _date_range(args) -> tuple:
+    """Dates from --start/--end, else the --days days ending yesterday"""
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    end_date = args.end or today - timedelta(days=1)
+    start_date = args.start or end_date - timedelta(days=args.days - 1)
+    return start_date, end_date
+
+def plan_jobs(config_manager: ConfigManager,
+              start_date: datetime,
+              end_date: datetime,
+              window: str,
+              source_ids: Optional[Sequence[str]] = None,
+              metrics: Optional[List[str]] = None,
+              dimensions: Optional[List[str]] = None) -> List[SyncJob]:
+    """One job per configured source and date window, as SyncScheduler.build_jobs plans them.
+
+    Metrics and dimensions come from each source's ``metrics`` and
+    ``dimensions`` settings unless given explicitly.
+    """
+    if source_ids:
+        sources = config_manager.list_sources()
+        missing = [source_id for source_id in source_ids if source_id not in sources]
+        if missing:
+            raise ValueError(f"Unknown data sources: {', '.join(missing)}")
+    jobs = SyncScheduler(config_manager).build_jobs(start_date, end_date, window=window,
+                                                    source_ids=list(source_ids) if source_ids else None)
+    for job in jobs:
+        if metrics is not None:
+            job.metrics = list(metrics)
+        if dimensions is not None:
+            job.dimensions = list(dimensions)
+        if not job.metrics:
+            raise ValueError(f"No metrics for {job.source_id}: set its metrics setting or pass --metrics")
+    return jobs
+
+def sync(args) -> int:
+    start_date, end_date = _date_range(args)
+    if start_date > end_date:
+        print("error: --start is after --end", file=sys.stderr)
+        return 2
+    config_path = os.path.abspath(args.config)
+    try:
+        config_manager = ConfigManager(config_path, args.storage)
+        # Each worker process throttles on its own, so the limits are applied when jobs are submitted
+        scheduler = SyncScheduler(config_manager, default_platform_limit=args.platform_limit,
+                                  account_limit=args.account_limit)
+        jobs = plan_jobs(config_manager, start_date, end_date, args.window,
+                         _split_fields(args.sources), _split_fields(args.metrics),
+                         _split_fields(args.dimensions))
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if not jobs:
+        print("error: no data sources configured", file=sys.stderr)
+        return 2
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(jobs)))
+    sink_options = {'chunk_rows': args.chunk_rows} if args.chunk_rows else {}
+    print(f"Syncing {len(jobs)} jobs ({start_date.strftime(DATE_FORMAT)}..{end_date.strftime(DATE_FORMAT)}) "
+          f"with {workers} workers into {args.output}", file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        def submit(job: SyncJob):
+            return executor.submit(run_job, job, config_path, args.storage, args.format, args.output,
+                                   sink_options)
+
+        for job, future in scheduler.dispatch(jobs, submit, workers):
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. killed for memory); its jobs cannot be retried in this pool
+                result = {'label': job_label(job), 'rows': 0, 'seconds': 0.0,
+                          'error': f"worker process failed: {e}"}
+            results.append(result)
+            status = 'FAILED ' + result['error'] if result['error'] else 'ok'
+            print(f"[{len(results)}/{len(jobs)}] {result['label']}: {result['rows']} rows "
+                  f"in {result['seconds']:.1f}s {status}", file=sys.stderr, flush=True)
+
+    elapsed = time.perf_counter() - started
+    failed = [result for result in results if result['error']]
+    rows = sum(result['rows'] for result in results)
+    print(f"Done: {len(results) - len(failed)}/{len(jobs)} jobs succeeded, {rows} rows "
+          f"in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+    for result in failed:
+        print(f"  failed: {result['label']}: {result['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='datahub', description='DataHub data integration')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = commands.add_parser(
+        'sync', help='pull configured sources into partitioned files',
+        description='Pull every configured source (or --sources) over a date range, one job per '
+                    'source and window, spread across worker processes.'
+    )
+    sync_parser.add_argument('--config', required=True, help='path to config.json')
+    sync_parser.add_argument('--storage', choices=('json', 'sqlite'), default='json',
+                             help='ConfigManager storage (default: json)')
+    sync_parser.add_argument('--sources', help='comma-separated source ids (default: all)')
+    sync_parser.add_argument('--start', type=_parse_date, help='first day, YYYY-MM-DD')
+    sync_parser.add_argument('--end', type=_parse_date, help='last day, YYYY-MM-DD (default: yesterday)')
+    sync_parser.add_argument('--days', type=int, default=1,
+                             help='days ending at --end when --start is not given (default: 1)')
+    sync_parser.add_argument('--window', type=_parse_window, default='day',
+                             help="job size: 'day', 'week' or a number of days (default: day)")
+    sync_parser.add_argument('--metrics', help="comma-separated metrics, overriding each source's metrics setting")
+    sync_parser.add_argument('--dimensions',
+                             help="comma-separated dimensions, overriding each source's dimensions setting")
+    sync_parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    sync_parser.add_argument('--account-limit', type=int, default=1,
+                             help='jobs of one ad account running at once (default: 1)')
+    sync_parser.add_argument('--platform-limit', type=int, default=4,
+                             help='jobs of one platform running at once (default: 4)')
+    sync_parser.add_argument('--format', choices=SINK_FORMATS, default='jsonl', help='output format')
+    sync_parser.add_argument('--output', required=True, help='output root directory')
+    sync_parser.add_argument('--chunk-rows', type=int, help='rows buffered per partition before a flush')
+    sync_parser.set_defaults(handler=sync)
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+from typing import Dict, Any, List, Optional
+from datetime import date, datetime
+from decimal import Decimal
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_SUFFIX = '.json'
+DECIMAL_TAG = '__decimal__'
+
+def _encode_value(value: Any) -> Any:
+    """JSON fallback that keeps Decimal currency values exact"""
+    if isinstance(value, Decimal):
+        return {DECIMAL_TAG: str(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and DECIMAL_TAG in obj:
+        return Decimal(obj[DECIMAL_TAG])
+    return obj
+
+class ResponseCache:
+    """Disk-backed cache of fetched rows, one entry per reporting day.
+
+    Days older than ``finalized_after_days`` (the attribution window) are final
+    and their entries never expire. Entries stored while a day was still
+    recent expire after ``recent_ttl`` seconds. When the cache grows beyond
+    ``max_bytes`` the least recently used entries are evicted; file mtimes
+    record use, so the cache directory can be shared between processes.
+    """
+
+    _shared: Dict[str, 'ResponseCache'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 cache_dir: str,
+                 recent_ttl: float = 3600,
+                 finalized_after_days: int = 28,
+                 max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.recent_ttl = recent_ttl
+        self.finalized_after_days = finalized_after_days
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> Optional['ResponseCache']:
+        """Return the shared cache configured by ``cache_dir``, or None when caching is off"""
+        cache_dir = settings.get('cache_dir')
+        if not cache_dir:
+            return None
+        cache_dir = os.path.abspath(cache_dir)
+        with cls._shared_lock:
+            cache = cls._shared.get(cache_dir)
+            if cache is None:
+                options = {}
+                if 'cache_recent_ttl' in settings:
+                    options['recent_ttl'] = settings['cache_recent_ttl']
+                if 'cache_finalized_after_days' in settings:
+                    options['finalized_after_days'] = settings['cache_finalized_after_days']
+                if 'cache_max_bytes' in settings:
+                    options['max_bytes'] = settings['cache_max_bytes']
+                cache = cls(cache_dir, **options)
+                cls._shared[cache_dir] = cache
+            return cache
+
+    @staticmethod
+    def make_key(source_type: str,
+                 scope: Dict[str, Any],
+                 metrics: List[str],
+                 dimensions: List[str],
+                 day: datetime,
+                 end_day: Optional[datetime] = None) -> str:
+        """Build the cache key for one day of a query, or for the range day..end_day.
+
+        ``scope`` holds the source-specific parts of the key, such as the
+        account and the reporting level.
+        """
+        key_data = {
+            'source_type': source_type,
+            'scope': scope,
+            'metrics': list(metrics),
+            'dimensions': list(dimensions),
+            'day': day.strftime('%Y-%m-%d')
+        }
+        if end_day is not None:
+            key_data['end_day'] = end_day.strftime('%Y-%m-%d')
+        material = json.dumps(key_data, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def is_finalized(self, day: datetime) -> bool:
+        """Whether a reporting day is older than the attribution window"""
+        day = day.date() if isinstance(day, datetime) else day
+        return (date.today() - day).days > self.finalized_after_days
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached rows for a key, or None when missing or expired"""
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f, object_hook=_decode_object)
+        except (OSError, ValueError):
+            return None
+
+        if not entry['final'] and time.time() - entry['stored_at'] > self.recent_ttl:
+            self._remove(path)
+            return None
+
+        try:
+            # Mark the entry as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['rows']
+
+    def put(self, key: str, day: datetime, rows: List[Dict[str, Any]]):
+        """Store the rows for one day, evicting old entries if needed.
+
+        For a range entry pass its last day, so the entry only becomes final
+        once the whole range is.
+        """
+        entry = {
+            'day': day.strftime('%Y-%m-%d'),
+            'final': self.is_finalized(day),
+            'stored_at': time.time(),
+            'rows': rows
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f, default=_encode_value)
+        size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            if os.path.exists(path):
+                self._total_bytes -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            for path, _, _ in self._entries():
+                self._remove(path)
+            self._total_bytes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def _entries(self):
+        """List (path, mtime, size) for every cache file"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        # Recount from disk so that writes from other processes are included
+        self._total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            self._total_bytes -= size
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,195 @@
+from typing import Dict, Any, Callable, Iterator, List, Optional
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from .cache import _encode_value, _decode_object
+from .storage import create_backend
+
+SPOOL_SUFFIX = '.jsonl'
+
+class FetchSession:
+    """Progress of one paginated pull over one date window.
+
+    Every page handed to the caller is first appended to a spool file and
+    fsynced, then the cursor that follows it is saved, so after a crash the
+    session replays the spooled pages and the source continues from the last
+    committed cursor.
+    """
+
+    def __init__(self, store: 'CheckpointStore', key: str, start_date: datetime, end_date: datetime,
+                 record: Optional[Dict[str, Any]] = None):
+        record = record or {}
+        self.store = store
+        self.key = key
+        self.start_date = start_date
+        self.end_date = end_date
+        self.spool_path = store.spool_path(key)
+        # Where the source continues; None means from the first page
+        self.resume_cursor: Optional[Dict[str, Any]] = record.get('cursor')
+        self.cursor = self.resume_cursor
+        self.pages = record.get('pages', 0)
+        self.rows = record.get('rows', 0)
+        self.spool_bytes = record.get('spool_bytes', 0)
+        # Cursor following the page the source is about to yield
+        self.pending_cursor: Optional[Dict[str, Any]] = None
+        self.resumable = True
+
+    @property
+    def resumed(self) -> bool:
+        return self.resume_cursor is not None
+
+    def replay(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the pages committed before the interruption"""
+        if not self.pages:
+            return
+        with open(self.spool_path, 'rb') as f:
+            for _ in range(self.pages):
+                yield json.loads(f.readline(), object_hook=_decode_object)
+
+    def commit(self, page: List[Dict[str, Any]]):
+        """Spool a page and save the cursor the source reported for it"""
+        if not self.resumable:
+            return
+        if self.pending_cursor is None:
+            # The source cannot resume mid-window, so there is nothing worth keeping
+            self.resumable = False
+            self.store.discard(self.key)
+            return
+        line = json.dumps(page, default=_encode_value, separators=(',', ':')).encode('utf-8') + b'\n'
+        with open(self.spool_path, 'ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            self.spool_bytes = f.tell()
+        self.cursor = self.pending_cursor
+        self.pending_cursor = None
+        self.pages += 1
+        self.rows += len(page)
+        self.store.save(self)
+
+    def mark(self, cursor: Dict[str, Any]):
+        """Save progress that produced no page yet, e.g. a submitted report job"""
+        if not self.resumable:
+            return
+        self.cursor = cursor
+        self.store.save(self)
+
+    def complete(self):
+        """The window was fetched in full; drop its checkpoint and spool"""
+        self.store.discard(self.key)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            'window': [self.start_date.strftime('%Y-%m-%d'), self.end_date.strftime('%Y-%m-%d')],
+            'cursor': self.cursor,
+            'pages': self.pages,
+            'rows': self.rows,
+            'spool_bytes': self.spool_bytes,
+        }
+
+class CheckpointStore:
+    """Checkpoints of interrupted pulls, one per source, query and date window.
+
+    Records go to a storage backend (``checkpoints.json``, or the
+    ``checkpoints`` table of ``datahub.db``, which several processes can
+    share); spooled pages go to ``spool/`` next to it. Checkpoints older than
+    ``max_age`` seconds are discarded, since platform cursors expire.
+    """
+
+    _shared: Dict[tuple, 'CheckpointStore'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 directory: str,
+                 storage: str = 'json',
+                 max_age: float = 86400,
+                 clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'spool'), exist_ok=True)
+        self.backend = create_backend(storage, directory, 'checkpoints',
+                                      os.path.join(directory, 'checkpoints.json'))
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> Optional['CheckpointStore']:
+        """Return the shared store configured by ``checkpoint_dir``, or None when checkpointing is off"""
+        directory = settings.get('checkpoint_dir')
+        if not directory:
+            return None
+        directory = os.path.abspath(directory)
+        storage = settings.get('checkpoint_storage', 'json')
+        with cls._shared_lock:
+            store = cls._shared.get((directory, storage))
+            if store is None:
+                options = {'storage': storage}
+                if 'checkpoint_max_age' in settings:
+                    options['max_age'] = settings['checkpoint_max_age']
+                store = cls(directory, **options)
+                cls._shared[(directory, storage)] = store
+            return store
+
+    @staticmethod
+    def make_key(source_type: str,
+                 scope: Dict[str, Any],
+                 metrics: List[str],
+                 dimensions: List[str],
+                 start_date: datetime,
+                 end_date: datetime) -> str:
+        """Build the checkpoint key of one pull: the source, its scope, the query and the window"""
+        key_data = json.dumps({
+            'source_type': source_type,
+            'scope': scope,
+            'metrics': list(metrics),
+            'dimensions': list(dimensions),
+            'window': [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')],
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def spool_path(self, key: str) -> str:
+        return os.path.join(self.directory, 'spool', key + SPOOL_SUFFIX)
+
+    def open(self, key: str, start_date: datetime, end_date: datetime) -> FetchSession:
+        """Resume the pull's checkpoint if a fresh one exists, else start a new session"""
+        with self._lock:
+            record = self.backend.get(key)
+            if record is not None and self._clock() - record.get('updated_at', 0) > self.max_age:
+                self._discard(key)
+                record = None
+            spool_path = self.spool_path(key)
+            spooled = os.path.getsize(spool_path) if os.path.exists(spool_path) else 0
+            if record is not None and spooled < record['spool_bytes']:
+                # The spool lost pages the checkpoint counts on; start over
+                record = None
+            if record is None:
+                self._discard(key)
+            elif spooled > record['spool_bytes']:
+                # Drop a page written after the last saved checkpoint
+                with open(spool_path, 'r+b') as f:
+                    f.truncate(record['spool_bytes'])
+            return FetchSession(self, key, start_date, end_date, record)
+
+    def save(self, session: FetchSession):
+        record = session.to_record()
+        record['updated_at'] = self._clock()
+        with self._lock:
+            self.backend.put(session.key, record)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: str):
+        self.backend.delete(key)
+        spool_path = self.spool_path(key)
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+
+    def pending(self) -> Dict[str, Dict[str, Any]]:
+        """Checkpoints of pulls that have not finished, keyed by checkpoint key"""
+        with self._lock:
+            return self.backend.items()
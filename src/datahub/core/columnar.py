@@ -0,0 +1,271 @@
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+from array import array
+from decimal import Decimal
+import json
+import math
+import sys
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+INT64 = 'int64'
+FLOAT64 = 'float64'
+STRING = 'string'
+
+def _typed_array(type_code: str, values: List[Any]):
+    """Build a typed array, using NumPy when it is installed"""
+    if np is not None:
+        return np.array(values, dtype=np.int64 if type_code == 'q' else np.float64)
+    return array(type_code, values)
+
+def _infer_numeric(values: List[Any]) -> Optional[str]:
+    """Return INT64 or FLOAT64 when every non-null value is numeric, else None.
+
+    Numeric strings count as numbers, since the Graph API returns metrics such
+    as ``impressions`` and ``spend`` as strings.
+    """
+    kind = INT64
+    seen = False
+    for value in values:
+        if value is None:
+            continue
+        seen = True
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            continue
+        if isinstance(value, (float, Decimal)):
+            kind = FLOAT64
+            continue
+        if isinstance(value, str):
+            try:
+                int(value)
+                continue
+            except ValueError:
+                pass
+            try:
+                float(value)
+            except ValueError:
+                return None
+            kind = FLOAT64
+            continue
+        return None
+    if not seen:
+        return None
+    # Nulls have no int64 representation, so they widen the column to float64 NaN
+    if kind == INT64 and any(value is None for value in values):
+        return FLOAT64
+    return kind
+
+class DictionaryColumn:
+    """String column stored as int32 codes into a list of interned categories.
+
+    A code of -1 marks a null value.
+    """
+
+    def __init__(self, codes, categories: List[str]):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def encode(cls, values: Iterable[Any]) -> 'DictionaryColumn':
+        """Dictionary-encode values, interning each distinct string once.
+
+        Lists and dicts, such as Facebook's ``actions`` field, are stored as
+        canonical JSON strings.
+        """
+        lookup: Dict[Any, int] = {}
+        categories: List[str] = []
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+            code = lookup.get(value)
+            if code is None:
+                code = len(categories)
+                lookup[value] = code
+                categories.append(sys.intern(str(value)))
+            codes.append(code)
+        if np is not None:
+            codes = np.array(codes, dtype=np.int32)
+        else:
+            codes = array('i', codes)
+        return cls(codes, categories)
+
+    @classmethod
+    def concat(cls, columns: Sequence['DictionaryColumn']) -> 'DictionaryColumn':
+        """Concatenate columns by remapping their codes onto merged categories"""
+        lookup: Dict[str, int] = {}
+        categories: List[str] = []
+        parts = []
+        for column in columns:
+            mapping = []
+            for category in column.categories:
+                code = lookup.get(category)
+                if code is None:
+                    code = len(categories)
+                    lookup[category] = code
+                    categories.append(category)
+                mapping.append(code)
+            if np is not None:
+                # The trailing -1 makes null codes (-1) map to themselves
+                parts.append(np.array(mapping + [-1], dtype=np.int32)[column.codes])
+            else:
+                parts.append(array('i', (mapping[code] if code >= 0 else -1 for code in column.codes)))
+        if np is not None:
+            codes = np.concatenate(parts) if parts else np.array([], dtype=np.int32)
+        else:
+            codes = array('i')
+            for part in parts:
+                codes.extend(part)
+        return cls(codes, categories)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def to_list(self) -> List[Optional[str]]:
+        categories = self.categories
+        return [categories[code] if code >= 0 else None for code in self.codes]
+
+class ColumnarBatch:
+    """A page of rows held as one typed array per field.
+
+    Numeric fields are int64 or float64 arrays (NumPy arrays when available,
+    ``array.array`` otherwise); every other field, and every field named as a
+    dimension, is a DictionaryColumn.
+    """
+
+    def __init__(self, columns: Dict[str, Any], num_rows: int):
+        self.columns = columns
+        self.num_rows = num_rows
+
+    @classmethod
+    def from_rows(cls,
+                  rows: Sequence[Dict[str, Any]],
+                  fields: Optional[Sequence[str]] = None,
+                  dimensions: Iterable[str] = ()) -> 'ColumnarBatch':
+        """Build a batch from row dicts.
+
+        ``fields`` defaults to every key seen, in order of first appearance.
+        Fields listed in ``dimensions`` are always stored as strings.
+        """
+        if fields is None:
+            seen: Dict[str, None] = {}
+            for row in rows:
+                for key in row:
+                    if key not in seen:
+                        seen[key] = None
+            fields = list(seen)
+        dimensions = set(dimensions)
+
+        columns = {}
+        for field in fields:
+            values = [row.get(field) for row in rows]
+            kind = None if field in dimensions else _infer_numeric(values)
+            if kind == INT64:
+                columns[field] = _typed_array('q', [int(value) for value in values])
+            elif kind == FLOAT64:
+                columns[field] = _typed_array(
+                    'd', [math.nan if value is None else float(value) for value in values]
+                )
+            else:
+                columns[field] = DictionaryColumn.encode(values)
+        return cls(columns, len(rows))
+
+    @classmethod
+    def concat(cls, batches: Sequence['ColumnarBatch']) -> 'ColumnarBatch':
+        """Concatenate batches, merging the categories of string columns"""
+        fields: Dict[str, None] = {}
+        for batch in batches:
+            for field in batch.columns:
+                fields[field] = None
+
+        columns = {}
+        for field in fields:
+            kinds = {batch.field_type(field) for batch in batches if field in batch.columns}
+            if kinds <= {INT64, FLOAT64} and all(field in batch.columns for batch in batches):
+                type_code = 'q' if kinds == {INT64} else 'd'
+                if np is not None:
+                    columns[field] = np.concatenate(
+                        [batch.columns[field] for batch in batches]
+                    ).astype(np.int64 if type_code == 'q' else np.float64)
+                else:
+                    merged = array(type_code)
+                    for batch in batches:
+                        merged.extend(array(type_code, batch.columns[field]))
+                    columns[field] = merged
+            elif kinds == {STRING} and all(field in batch.columns for batch in batches):
+                columns[field] = DictionaryColumn.concat([batch.columns[field] for batch in batches])
+            else:
+                values = []
+                for batch in batches:
+                    values.extend(batch.column(field) if field in batch.columns else [None] * len(batch))
+                columns[field] = DictionaryColumn.encode(values)
+        return cls(columns, sum(len(batch) for batch in batches))
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def field_names(self) -> List[str]:
+        return list(self.columns)
+
+    def field_type(self, field: str) -> str:
+        """Return INT64, FLOAT64 or STRING for a field"""
+        column = self.columns[field]
+        if isinstance(column, DictionaryColumn):
+            return STRING
+        if np is not None and isinstance(column, np.ndarray):
+            return INT64 if column.dtype == np.int64 else FLOAT64
+        return INT64 if column.typecode == 'q' else FLOAT64
+
+    def column(self, field: str) -> List[Any]:
+        """Return a field's values as a Python list"""
+        column = self.columns[field]
+        if isinstance(column, DictionaryColumn):
+            return column.to_list()
+        return column.tolist()
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Convert back to row dicts"""
+        names = self.field_names
+        values = [self.column(name) for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def to_pandas(self):
+        """Convert to a pandas DataFrame; string columns become categoricals"""
+        import pandas as pd
+        data = {}
+        for field, column in self.columns.items():
+            if isinstance(column, DictionaryColumn):
+                data[field] = pd.Categorical.from_codes(column.codes, categories=column.categories)
+            else:
+                data[field] = column
+        return pd.DataFrame(data)
+
+    def to_arrow(self):
+        """Convert to a pyarrow Table; string columns become dictionary arrays"""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for to_arrow()")
+        arrays = []
+        for field, column in self.columns.items():
+            if isinstance(column, DictionaryColumn):
+                if np is not None:
+                    indices = pa.array(column.codes, type=pa.int32(), mask=column.codes < 0)
+                else:
+                    indices = pa.array([code if code >= 0 else None for code in column.codes], type=pa.int32())
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    indices, pa.array(column.categories, type=pa.string())
+                ))
+            elif self.field_type(field) == INT64:
+                arrays.append(pa.array(column, type=pa.int64()))
+            else:
+                arrays.append(pa.array(column, type=pa.float64(), from_pandas=True))
+        return pa.Table.from_arrays(arrays, names=self.field_names)
@@ -1,80 +1,133 @@
-from typing import Dict, Any, Optional
-import json
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional
 import os
 from .token_manager import TokenManager
+from .sync_state import SyncStateManager
+from .storage import create_backend
 from .data_source import DataSourceConfig, DataSourceFactory
 
 class ConfigManager:
-    """Manages system-wide configuration and data source settings"""
-    
-    def __init__(self, config_path: str):
+    """Manages system-wide configuration and data source settings.
+
+    ``storage`` selects where source configs and tokens live: ``'json'``
+    (config.json and tokens.json, the default) or ``'sqlite'`` (tables in
+    datahub.db next to the config path), which suits thousands of sources and
+    concurrent workers.
+    """
+
+    def __init__(self, config_path: str, storage: str = 'json'):
         self.config_path = config_path
-        self.token_manager = TokenManager(os.path.join(os.path.dirname(config_path), 'tokens.json'))
-        self.config: Dict[str, Any] = {}
-        self._load_config()
-    
-    def _load_config(self):
-        """Load configuration from file"""
-        if os.path.exists(self.config_path):
-            with open(self.config_path, 'r') as f:
-                self.config = json.load(f)
-    
-    def _save_config(self):
-        """Save configuration to file"""
-        os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
-        with open(self.config_path, 'w') as f:
-            json.dump(self.config, f, indent=2)
-    
-    def get_data_source(self, source_type: str, source_id: str) -> Optional[Any]:
-        """Get a configured data source instance"""
-        source_config = self.config.get('sources', {}).get(source_id)
+        self.storage = storage
+        config_dir = os.path.dirname(config_path)
+        self.sources = create_backend(storage, config_dir, 'sources', config_path,
+                                      section='sources', indent=2)
+        self.token_manager = TokenManager(
+            os.path.join(config_dir, 'tokens.json'),
+            backend=create_backend(storage, config_dir, 'tokens', os.path.join(config_dir, 'tokens.json'))
+        )
+        self.sync_state = SyncStateManager(
+            os.path.join(config_dir, 'sync_state.json'),
+            backend=create_backend(storage, config_dir, 'sync_state',
+                                   os.path.join(config_dir, 'sync_state.json'), indent=2)
+        )
+
+    @property
+    def config(self) -> Mapping[str, Any]:
+        """Read-only snapshot of the configuration in the config.json layout.
+
+        This used to be the mutable dict behind config.json. Sources now live
+        in a storage backend, so change them with add_data_source,
+        update_source_credentials and remove_data_source; assigning into the
+        snapshot raises TypeError instead of being silently lost.
+        """
+        return MappingProxyType({'sources': MappingProxyType(self.sources.items())})
+
+    @contextmanager
+    def batch(self):
+        """Group several changes into one transaction per store.
+
+        Bulk onboarding inside a batch writes each store once instead of once
+        per source.
+        """
+        with self.sources.transaction(), self.token_manager.backend.transaction():
+            yield self
+
+    def get_resolved_config(self, source_id: str) -> Optional[Dict[str, Any]]:
+        """Get a source's configuration with its stored token merged into a copy of the credentials"""
+        source_config = self.sources.get(source_id)
         if not source_config:
             return None
-        
+
         # Get token from token manager
+        credentials = dict(source_config.get('credentials', {}))
         token_data = self.token_manager.get_token(source_id)
         if token_data:
-            source_config['credentials'].update(token_data)
-        
+            credentials.update(token_data)
+        return dict(source_config, credentials=credentials)
+
+    def get_data_source(self, source_type: str, source_id: str) -> Optional[Any]:
+        """Get a configured data source instance"""
+        source_config = self.get_resolved_config(source_id)
+        if not source_config:
+            return None
+
         config = DataSourceConfig(
             credentials=source_config.get('credentials', {}),
             settings=source_config.get('settings', {})
         )
-        
+
         return DataSourceFactory.create(source_type, config)
-    
-    def add_data_source(self, source_id: str, source_type: str, 
+
+    def add_data_source(self, source_id: str, source_type: str,
                        credentials: Dict[str, Any], settings: Dict[str, Any]):
         """Add or update a data source configuration"""
-        if 'sources' not in self.config:
-            self.config['sources'] = {}
-        
-        self.config['sources'][source_id] = {
+        self.sources.put(source_id, {
             'type': source_type,
             'credentials': credentials,
             'settings': settings
-        }
-        self._save_config()
-    
+        })
+
+    def add_data_sources(self, sources: Dict[str, Dict[str, Any]]):
+        """Add or update many data sources in one write.
+
+        ``sources`` maps source id to a dict with ``type``, ``credentials`` and
+        ``settings``, as stored in config.json.
+        """
+        self.sources.put_many(
+            (source_id, {
+                'type': source_config['type'],
+                'credentials': source_config.get('credentials', {}),
+                'settings': source_config.get('settings', {})
+            })
+            for source_id, source_config in sources.items()
+        )
+
     def remove_data_source(self, source_id: str):
         """Remove a data source configuration"""
-        if source_id in self.config.get('sources', {}):
-            del self.config['sources'][source_id]
-            self._save_config()
+        if self.sources.delete(source_id):
             self.token_manager.remove_token(source_id)
-    
+            self.sync_state.remove_source(source_id)
+
     def update_source_credentials(self, source_id: str, credentials: Dict[str, Any]):
         """Update credentials for a data source"""
-        if source_id in self.config.get('sources', {}):
-            self.config['sources'][source_id]['credentials'].update(credentials)
-            self._save_config()
-            
-            # Update token if present in credentials
-            if 'access_token' in credentials:
-                self.token_manager.store_token(source_id, {
-                    'access_token': credentials['access_token']
-                })
-    
+        with self.sources.transaction():
+            source_config = self.sources.get(source_id)
+            if source_config is None:
+                return
+            source_config['credentials'].update(credentials)
+            self.sources.put(source_id, source_config)
+
+        # Update token if present in credentials
+        if 'access_token' in credentials:
+            self.token_manager.store_token(source_id, {
+                'access_token': credentials['access_token']
+            })
+
     def get_source_config(self, source_id: str) -> Optional[Dict[str, Any]]:
         """Get configuration for a specific data source"""
-        return self.config.get('sources', {}).get(source_id)
+        return self.sources.get(source_id)
+
+    def list_sources(self) -> Dict[str, Dict[str, Any]]:
+        """Get the configuration of every data source, keyed by source id"""
+        return self.sources.items()
@@ -1,12 +1,97 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+from datetime import datetime, timedelta
+import hashlib
+import importlib
+import json
+import threading
+import time
+from .transport import HttpTransport
+from .cache import ResponseCache
+from .checkpoint import CheckpointStore
+from .decoding import get_decoder, iter_json_object_array
+from .throttle import RateLimiter, parse_duration
+from .instrumentation import InstrumentationHooks, endpoint_name, get_default_hooks
+
+if TYPE_CHECKING:
+    from .columnar import ColumnarBatch
+
+# Built-in sources, imported the first time their type is requested
+BUILTIN_SOURCES = {
+    'google_ads': 'datahub.sources.google_ads:GoogleAdsSource',
+    'facebook_ads': 'datahub.sources.facebook_ads:FacebookAdsSource',
+}
+
+# Entry point group under which installed packages register extra sources
+ENTRY_POINT_GROUP = 'datahub.sources'
+
+SHARD_WINDOWS = {
+    'day': timedelta(days=1),
+    'week': timedelta(days=7),
+}
+
+def split_date_range(start_date: datetime,
+                     end_date: datetime,
+                     window: Union[str, int, timedelta] = 'day') -> List[Tuple[datetime, datetime]]:
+    """Split the inclusive range [start_date, end_date] into consecutive windows.
+
+    ``window`` is 'day', 'week', a number of days or a timedelta. Each returned
+    tuple is an inclusive (start, end) pair, the last one clipped to end_date.
+    """
+    if isinstance(window, str):
+        if window not in SHARD_WINDOWS:
+            raise ValueError(f"Unknown shard window: {window}")
+        step = SHARD_WINDOWS[window]
+    elif isinstance(window, timedelta):
+        step = window
+    else:
+        step = timedelta(days=int(window))
+    if step < timedelta(days=1):
+        raise ValueError("Shard window must be at least one day")
+    if end_date < start_date:
+        raise ValueError("end_date must not be before start_date")
+
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + step - timedelta(days=1), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
 
 class DataSource(ABC):
     """Abstract base class for all data sources"""
     
-    def __init__(self, config):
+    # Name the source is registered under; used in cache keys
+    source_type: str = None
+    # Field holding the reporting day of each row; used to key and window stored rows
+    date_field: Optional[str] = None
+    # Field holding the last day a row covers, for sources whose rows can span a range
+    date_end_field: Optional[str] = None
+    
+    def __init__(self, config, transport: HttpTransport = None):
         self.config = config
+        # An explicit transport wins over one placed in settings; otherwise
+        # sources with the same HTTP settings share a pooled transport
+        self.transport = (transport
+                          or config.settings.get('transport')
+                          or HttpTransport.from_settings(config.settings))
+        self.cache = ResponseCache.from_settings(config.settings)
+        self.checkpoints = CheckpointStore.from_settings(config.settings)
+        # Fetch session of the window whose pages the current thread is producing
+        self._checkpoint_local = threading.local()
+        self.throttle = RateLimiter.from_settings(self.source_type or type(self).__name__, config.settings)
+        # Set by SourcePool so that connect() skips re-validating known-good credentials
+        self.validation_cache = None
+        self._hooks = config.settings.get('instrumentation')
+        # orjson or msgspec when installed, else the standard library
+        self.decoder = get_decoder(config.settings.get('json_decoder', 'auto'))
+    
+    @property
+    def hooks(self) -> InstrumentationHooks:
+        """Instrumentation hooks from the ``instrumentation`` setting, else the process default"""
+        return self._hooks or get_default_hooks()
     
     @abstractmethod
     def connect(self) -> bool:
@@ -27,6 +112,442 @@ class DataSource(ABC):
         """Validate the authentication credentials"""
         pass
 
+    def _check_credentials(self) -> bool:
+        """Validate credentials for connect(), consulting the validation cache when pooled"""
+        if self.validation_cache is None:
+            return self.validate_credentials()
+        return self.validation_cache.validate(self)
+
+    def iter_pages(self,
+                   start_date: datetime,
+                   end_date: datetime,
+                   metrics: List[str],
+                   dimensions: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        """Yield result pages as soon as each one is decoded.
+
+        Unlike fetch_data this raises on failure. When a ``cache_dir`` is
+        configured and the query returns one row per day (see
+        ``_daily_rows``), the range is cached day by day: cached days are
+        served from disk and each run of consecutive missing days is fetched
+        in one pull, then split by ``date_field`` into per-day entries. Other
+        queries are cached per range.
+        """
+        hooks = self.hooks
+        labels = self._metric_labels()
+        if self.cache is None:
+            for page in self._iter_timed_pages(start_date, end_date, metrics, dimensions, hooks, labels):
+                hooks.rows_emitted(labels, len(page), False)
+                yield page
+            return
+        
+        source_type = self.source_type or type(self).__name__
+        scope = self._cache_scope()
+        if not self._daily_rows(metrics, dimensions):
+            # Rows aggregate the whole range, so splitting it would change the result
+            key = self.cache.make_key(source_type, scope, metrics, dimensions, start_date, end_date)
+            yield from self._iter_cached(key, start_date, end_date, metrics, dimensions, hooks, labels)
+            return
+        days = [day for day, _ in split_date_range(start_date, end_date, 'day')]
+        keys = [self.cache.make_key(source_type, scope, metrics, dimensions, day) for day in days]
+        index = 0
+        # Rows of days[index] when the scan for the end of a run already read them
+        pending = None
+        while index < len(days):
+            rows = pending if pending is not None else self.cache.get(keys[index])
+            pending = None
+            if rows is not None:
+                hooks.rows_emitted(labels, len(rows), True)
+                yield rows
+                index += 1
+                continue
+            run_end = index + 1
+            while run_end < len(days):
+                pending = self.cache.get(keys[run_end])
+                if pending is not None:
+                    break
+                run_end += 1
+            yield from self._iter_missing_days(days[index:run_end], keys[index:run_end],
+                                               metrics, dimensions, hooks, labels)
+            index = run_end
+
+    def export(self,
+               start_date: datetime,
+               end_date: datetime,
+               metrics: List[str],
+               dimensions: List[str],
+               sink,
+               source_label: Optional[str] = None) -> int:
+        """Stream every page into a sink (see datahub.sinks); return the number of rows.
+
+        Rows are partitioned under ``source_label``, by default the source
+        type. The sink is not closed, so several sources can share it.
+        """
+        label = source_label or self.source_type or type(self).__name__
+        return sink.write_pages(self.iter_pages(start_date, end_date, metrics, dimensions), label)
+
+    def _iter_cached(self, key: str, start_date: datetime, end_date: datetime, metrics, dimensions,
+                     hooks: InstrumentationHooks, labels: Dict[str, str]) -> Iterator[List[Dict[str, Any]]]:
+        """Serve one cache entry, fetching and storing it when missing"""
+        rows = self.cache.get(key)
+        if rows is not None:
+            hooks.rows_emitted(labels, len(rows), True)
+            yield rows
+            return
+
+        rows = []
+        for page in self._iter_timed_pages(start_date, end_date, metrics, dimensions, hooks, labels):
+            rows.extend(page)
+            hooks.rows_emitted(labels, len(page), False)
+            yield page
+        self.cache.put(key, end_date, rows)
+
+    def _iter_missing_days(self, days: List[datetime], keys: List[str], metrics, dimensions,
+                           hooks: InstrumentationHooks, labels: Dict[str, str]) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch consecutive uncached days in one pull and store each day's rows under its own key"""
+        by_day: Dict[str, List[Dict[str, Any]]] = {day.strftime('%Y-%m-%d'): [] for day in days}
+        complete = True
+        for page in self._iter_timed_pages(days[0], days[-1], metrics, dimensions, hooks, labels):
+            for row in page:
+                rows = by_day.get(str(row.get(self.date_field))[:10])
+                if rows is None:
+                    # A row that cannot be placed on a day would be lost from the cache
+                    complete = False
+                else:
+                    rows.append(row)
+            hooks.rows_emitted(labels, len(page), False)
+            yield page
+        if complete:
+            for day, key in zip(days, keys):
+                self.cache.put(key, day, by_day[day.strftime('%Y-%m-%d')])
+
+    def natural_key(self, metrics: List[str], dimensions: List[str]) -> List[str]:
+        """Fields that identify a row of this query; the date field plus every dimension by default"""
+        fields = [self.date_field] if self.date_field and self.date_field not in dimensions else []
+        return fields + list(dimensions)
+
+    def fetch_changes(self,
+                      store,
+                      start_date: datetime,
+                      end_date: datetime,
+                      metrics: List[str],
+                      dimensions: List[str],
+                      namespace: Optional[str] = None):
+        """Pull a window and reconcile it with a KeyedRowStore; return its UpsertResult.
+
+        Meant for lookback windows fetched again to pick up late
+        attribution: only rows that are new or whose values changed are in
+        ``changed``, and stored rows of the window that the platform no
+        longer returns are in ``deleted``. ``namespace`` defaults to one per
+        source, scope and query. The query must return one row per day (see
+        ``_daily_rows``), since rows summed over the window would be stored
+        as the values of its first day.
+        """
+        if not self._daily_rows(metrics, dimensions):
+            raise ValueError(f"fetch_changes needs one row per day, but this "
+                             f"{self.source_type or type(self).__name__} query aggregates the whole range")
+        if namespace is None:
+            source_type = self.source_type or type(self).__name__
+            namespace = source_type + ':' + hashlib.sha256(json.dumps({
+                'scope': self._cache_scope(),
+                'metrics': list(metrics),
+                'dimensions': list(dimensions),
+            }, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+        return store.upsert_pages(namespace, self.iter_pages(start_date, end_date, metrics, dimensions),
+                                  self.natural_key(metrics, dimensions), self.date_field,
+                                  (start_date, end_date))
+
+    def _iter_timed_pages(self, start_date, end_date, metrics, dimensions,
+                          hooks: InstrumentationHooks, labels: Dict[str, str]) -> Iterator[List[Dict[str, Any]]]:
+        """_iter_api_pages, reporting the time spent producing each page (not consuming it)"""
+        started = time.perf_counter()
+        for page in self._iter_resumable_pages(start_date, end_date, metrics, dimensions):
+            hooks.page_decoded(labels, len(page), time.perf_counter() - started)
+            yield page
+            started = time.perf_counter()
+
+    def _iter_resumable_pages(self, start_date, end_date, metrics, dimensions) -> Iterator[List[Dict[str, Any]]]:
+        """_iter_api_pages, checkpointed after every page when ``checkpoint_dir`` is set.
+
+        An interrupted pull of the same window replays its committed pages
+        from the spool, then the source continues from the saved cursor.
+        """
+        if self.checkpoints is None:
+            yield from self._iter_api_pages(start_date, end_date, metrics, dimensions)
+            return
+        
+        key = self.checkpoints.make_key(self.source_type or type(self).__name__, self._checkpoint_scope(),
+                                        metrics, dimensions, start_date, end_date)
+        session = self.checkpoints.open(key, start_date, end_date)
+        yield from session.replay()
+        pages = self._iter_api_pages(start_date, end_date, metrics, dimensions)
+        while True:
+            # The source's code only runs inside next(), so interleaved pulls on one thread stay apart
+            self._checkpoint_local.session = session
+            try:
+                page = next(pages)
+            except StopIteration:
+                break
+            finally:
+                self._checkpoint_local.session = None
+            session.commit(page)
+            yield page
+        session.complete()
+    
+    def _resume_cursor(self) -> Optional[Dict[str, Any]]:
+        """Cursor saved by an interrupted pull of the current window, or None to start from the first page"""
+        session = getattr(self._checkpoint_local, 'session', None)
+        return session.resume_cursor if session is not None else None
+    
+    def _next_cursor(self, cursor: Dict[str, Any]):
+        """Report where pagination continues after the page about to be yielded.
+
+        Sources call this before each yield; pages yielded without a cursor
+        make the window non-resumable.
+        """
+        session = getattr(self._checkpoint_local, 'session', None)
+        if session is not None:
+            session.pending_cursor = cursor
+    
+    def _save_cursor(self, cursor: Dict[str, Any]):
+        """Checkpoint progress made before any page, such as a submitted report job"""
+        session = getattr(self._checkpoint_local, 'session', None)
+        if session is not None:
+            session.mark(cursor)
+    
+    def iter_rows(self,
+                  start_date: datetime,
+                  end_date: datetime,
+                  metrics: List[str],
+                  dimensions: List[str]) -> Iterator[Dict[str, Any]]:
+        """Yield result rows one at a time"""
+        for page in self.iter_pages(start_date, end_date, metrics, dimensions):
+            yield from page
+
+    def iter_batches(self,
+                     start_date: datetime,
+                     end_date: datetime,
+                     metrics: List[str],
+                     dimensions: List[str]) -> Iterator['ColumnarBatch']:
+        """Yield each page as a ColumnarBatch, raising on failure"""
+        from .columnar import ColumnarBatch
+        for page in self.iter_pages(start_date, end_date, metrics, dimensions):
+            yield ColumnarBatch.from_rows(page, dimensions=dimensions)
+
+    def fetch_columnar(self,
+                       start_date: datetime,
+                       end_date: datetime,
+                       metrics: List[str],
+                       dimensions: List[str]) -> 'ColumnarBatch':
+        """Fetch the whole range as a single ColumnarBatch, raising on failure"""
+        from .columnar import ColumnarBatch
+        return ColumnarBatch.concat(list(self.iter_batches(start_date, end_date, metrics, dimensions)))
+
+    def iter_normalized_batches(self,
+                                start_date: datetime,
+                                end_date: datetime,
+                                metrics: List[str],
+                                dimensions: List[str]) -> Iterator['ColumnarBatch']:
+        """Yield each page mapped onto the canonical cross-source schema"""
+        from .normalization import SchemaNormalizer
+        for batch in self.iter_batches(start_date, end_date, metrics, dimensions):
+            yield SchemaNormalizer.normalize_batch(self.source_type, batch)
+
+    def _iter_api_pages(self,
+                        start_date: datetime,
+                        end_date: datetime,
+                        metrics: List[str],
+                        dimensions: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages straight from the API, raising on failure.
+
+        The default yields the whole fetch_data result as one page; sources
+        that paginate override it so only one page is held in memory at a time.
+        """
+        yield self.fetch_data(start_date, end_date, metrics, dimensions)
+
+    def _cache_scope(self) -> Dict[str, Any]:
+        """Source-specific parts of the cache key, such as account and level"""
+        return {}
+
+    def _daily_rows(self, metrics: List[str], dimensions: List[str]) -> bool:
+        """Whether the query returns rows for single days, so a range equals the union of its days"""
+        return self.date_field is not None and self.date_field in dimensions
+
+    def _checkpoint_scope(self) -> Dict[str, Any]:
+        """Source-specific part of checkpoint keys; include settings that change the cursor format"""
+        return self._cache_scope()
+
+    def _account_id(self) -> str:
+        """Identifier of the ad account behind this source, used to scope throttling"""
+        return ''
+
+    def _app_id(self) -> str:
+        """Identifier of the API app, used to scope throttling"""
+        return self.config.credentials.get('app_id') or self.source_type or type(self).__name__
+
+    def _metric_labels(self) -> Dict[str, str]:
+        """Labels attached to every instrumentation event of this source"""
+        return {'source': self.source_type or type(self).__name__, 'account': self._account_id()}
+
+    def _get(self, url: str, **kwargs):
+        """Send a throttled GET request through the transport"""
+        return self._throttled('GET', self.transport.get, url, **kwargs)
+
+    def _post(self, url: str, **kwargs):
+        """Send a throttled POST request through the transport"""
+        return self._throttled('POST', self.transport.post, url, **kwargs)
+
+    def _throttled(self, method: str, send, url: str, **kwargs):
+        """Wait for the app and account throttles, send, and retry when rate limited.
+
+        After ``throttle_max_retries`` rate-limited attempts the last response
+        is returned, so the caller's raise_for_status reports the failure.
+        """
+        max_retries = self.config.settings.get('throttle_max_retries', 3)
+        hooks = self.hooks
+        labels = self._metric_labels()
+        endpoint = endpoint_name(url, getattr(self, 'base_url', ''))
+        attempt = 0
+        while True:
+            waited = self.throttle.acquire(self._app_id(), self._account_id())
+            if waited:
+                hooks.throttle(labels, 'wait', waited)
+            response = self._send_instrumented(hooks, labels, method, endpoint, send, url, **kwargs)
+            delay = self._observe_response(response)
+            if delay is None or attempt >= max_retries:
+                return response
+            self.throttle.pause('account', self._account_id(), delay)
+            attempt += 1
+            hooks.throttle(labels, 'pause', delay)
+            hooks.retry(labels, 'rate_limit', attempt)
+
+    def _decode_json(self, response) -> Any:
+        """Decode a response body with the configured decoder.
+
+        Responses that do not expose their raw body as bytes fall back to
+        their own json() method.
+        """
+        content = getattr(response, 'content', None)
+        if isinstance(content, (bytes, bytearray)):
+            return self.decoder.loads(content)
+        return response.json()
+
+    def _incremental_decoding(self) -> bool:
+        """Whether pages are decoded row by row from the byte stream (``decode_mode: incremental``)"""
+        return self.config.settings.get('decode_mode', 'document') == 'incremental'
+
+    def _decode_rows(self, response, key: str, rest: Dict[str, Any], convert=None) -> List[Any]:
+        """Decode the rows under ``key`` of a streamed response as they arrive.
+
+        Each row is passed through ``convert`` as soon as it is decoded, so
+        the page never exists as a full document; the other members of the
+        body land in ``rest``. Error statuses raise; the response is closed
+        afterwards either way.
+        """
+        chunk_size = self.config.settings.get('stream_chunk_size', 64 * 1024)
+        try:
+            response.raise_for_status()
+            rows = iter_json_object_array(response.iter_content(chunk_size=chunk_size), key, rest)
+            if convert is None:
+                return list(rows)
+            return [convert(row) for row in rows]
+        finally:
+            response.close()
+
+    @staticmethod
+    def _send_instrumented(hooks: InstrumentationHooks, labels: Dict[str, str], method: str,
+                           endpoint: str, send, url: str, **kwargs):
+        """Send one request, reporting its duration, status, size and transport retries"""
+        context = hooks.request_start(labels, method, endpoint)
+        started = time.perf_counter()
+        try:
+            response = send(url, **kwargs)
+        except Exception:
+            hooks.request_end(context, labels, method, endpoint, 'error', time.perf_counter() - started, None)
+            raise
+        content_length = response.headers.get('Content-Length') if hasattr(response, 'headers') else None
+        hooks.request_end(context, labels, method, endpoint, str(response.status_code),
+                          time.perf_counter() - started,
+                          int(content_length) if isinstance(content_length, str) and content_length.isdigit() else None)
+        # Retries made inside the transport (urllib3) on 5xx responses
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        history = getattr(retries, 'history', None)
+        if isinstance(history, tuple):
+            for attempt, entry in enumerate(history, 1):
+                hooks.retry(labels, f"http_{entry.status}" if entry.status else 'connection', attempt)
+        return response
+
+    def _observe_response(self, response) -> Optional[float]:
+        """Feed a response's rate-limit signals into the throttle.
+
+        Returns the number of seconds to wait before retrying when the request
+        was rejected for rate limiting, otherwise None.
+        """
+        if response.status_code != 429:
+            return None
+        retry_after = parse_duration(response.headers.get('Retry-After'))
+        return retry_after if retry_after is not None else self.config.settings.get('throttle_pause', 10.0)
+
+    def fetch_data_sharded(self,
+                           start_date: datetime,
+                           end_date: datetime,
+                           metrics: List[str],
+                           dimensions: List[str],
+                           window: Union[str, int, timedelta, None] = None,
+                           max_workers: int = None,
+                           max_retries: int = None) -> List[Dict[str, Any]]:
+        """Fetch data by splitting the date range into windows fetched in parallel.
+
+        Defaults come from the ``shard_window``, ``shard_max_workers`` and
+        ``shard_max_retries`` settings. Results are merged in window order; a
+        window that still fails after its retries raises. The query must
+        return one row per day (see ``_daily_rows``), since rows summed over
+        each window could not be told apart once merged.
+        """
+        if not self._daily_rows(metrics, dimensions):
+            raise ValueError(f"fetch_data_sharded needs one row per day, but this "
+                             f"{self.source_type or type(self).__name__} query aggregates the whole range")
+        settings = self.config.settings
+        if window is None:
+            window = settings.get('shard_window', 'day')
+        if max_workers is None:
+            max_workers = settings.get('shard_max_workers', 4)
+        if max_retries is None:
+            max_retries = settings.get('shard_max_retries', 2)
+
+        windows = split_date_range(start_date, end_date, window)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+            futures = [
+                executor.submit(self._fetch_window_with_retry,
+                                window_start, window_end, metrics, dimensions, max_retries)
+                for window_start, window_end in windows
+            ]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+        return results
+
+    def _fetch_window_with_retry(self, start_date, end_date, metrics, dimensions, max_retries):
+        """Fetch one window, retrying it with exponential backoff"""
+        backoff = self.config.settings.get('shard_retry_backoff', 1.0)
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_window(start_date, end_date, metrics, dimensions)
+            except Exception:
+                if attempt >= max_retries:
+                    raise
+                time.sleep(backoff * (2 ** attempt))
+                attempt += 1
+                self.hooks.retry(self._metric_labels(), 'shard', attempt)
+
+    def _fetch_window(self,
+                      start_date: datetime,
+                      end_date: datetime,
+                      metrics: List[str],
+                      dimensions: List[str]) -> List[Dict[str, Any]]:
+        """Fetch a single date window, raising on failure so it can be retried"""
+        return list(self.iter_rows(start_date, end_date, metrics, dimensions))
+
 class DataSourceConfig:
     """Configuration class for data sources"""
     
@@ -39,9 +560,19 @@ class DataSourceConfig:
         return True
 
 class DataSourceFactory:
-    """Factory class for creating data source instances"""
+    """Factory class for creating data source instances.
+
+    Besides classes registered directly, the factory knows lazy targets
+    ('module:Class' strings): the built-in sources, sources added with
+    register_lazy(), and those installed packages declare under the
+    ``datahub.sources`` entry point group. A lazy target's module is imported
+    the first time its type is requested, so importing the factory stays cheap.
+    """
     
     _sources: Dict[str, type] = {}
+    _lazy: Dict[str, str] = dict(BUILTIN_SOURCES)
+    _entry_points_loaded = False
+    _lock = threading.RLock()
     
     @classmethod
     def register(cls, source_type: str, source_class: type):
@@ -49,9 +580,57 @@ class DataSourceFactory:
         cls._sources[source_type] = source_class
     
     @classmethod
-    def create(cls, source_type: str, config: DataSourceConfig) -> DataSource:
-        """Create a new data source instance"""
-        if source_type not in cls._sources:
-            raise ValueError(f"Unknown data source type: {source_type}")
+    def register_lazy(cls, source_type: str, target: str):
+        """Register a data source type by 'module:Class', imported on first use"""
+        with cls._lock:
+            cls._lazy[source_type] = target
+    
+    @classmethod
+    def get_source_class(cls, source_type: str) -> type:
+        """Return the class of a data source type, importing its module if needed"""
+        source_class = cls._sources.get(source_type)
+        if source_class is not None:
+            return source_class
         
-        return cls._sources[source_type](config)
+        with cls._lock:
+            if source_type not in cls._sources:
+                if source_type not in cls._lazy:
+                    cls._load_entry_points()
+                if source_type not in cls._lazy:
+                    raise ValueError(f"Unknown data source type: {source_type}")
+                module_name, _, class_name = cls._lazy[source_type].partition(':')
+                module = importlib.import_module(module_name)
+                cls._sources[source_type] = getattr(module, class_name)
+            return cls._sources[source_type]
+    
+    @classmethod
+    def available_types(cls) -> List[str]:
+        """List every known data source type without importing any source module"""
+        with cls._lock:
+            cls._load_entry_points()
+            return sorted(set(cls._sources) | set(cls._lazy))
+    
+    @classmethod
+    def _load_entry_points(cls):
+        """Read the datahub.sources entry points once; explicit registrations win"""
+        if cls._entry_points_loaded:
+            return
+        cls._entry_points_loaded = True
+        from importlib.metadata import entry_points
+        try:
+            found = entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:
+            # Before Python 3.10 entry_points() takes no arguments and returns a dict of groups
+            found = entry_points().get(ENTRY_POINT_GROUP, [])
+        for entry_point in found:
+            if entry_point.name not in cls._sources:
+                cls._lazy.setdefault(entry_point.name, entry_point.value)
+    
+    @classmethod
+    def create(cls, source_type: str, config: DataSourceConfig,
+               transport: HttpTransport = None) -> DataSource:
+        """Create a new data source instance, optionally on a given transport"""
+        source = cls.get_source_class(source_type)(config)
+        if transport is not None:
+            source.transport = transport
+        return source
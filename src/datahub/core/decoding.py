@@ -0,0 +1,191 @@
+from typing import Any, Dict, Iterable, Iterator, Optional
+import codecs
+import json
+import threading
+
+_WHITESPACE = ' \t\n\r'
+
+class JsonDecoder:
+    """Decodes whole JSON documents with the standard library"""
+
+    name = 'json'
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+class OrjsonDecoder(JsonDecoder):
+    """Decodes with orjson, several times faster than the standard library"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+
+class MsgspecDecoder(JsonDecoder):
+    """Decodes with msgspec's untyped JSON decoder"""
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self.loads = msgspec.json.Decoder().decode
+
+# Tried in this order by get_decoder('auto')
+DECODERS = {
+    'orjson': OrjsonDecoder,
+    'msgspec': MsgspecDecoder,
+    'json': JsonDecoder,
+}
+
+_decoders: Dict[str, JsonDecoder] = {}
+_decoders_lock = threading.Lock()
+
+def get_decoder(name: str = 'auto') -> JsonDecoder:
+    """Return the shared decoder called ``name``.
+
+    'auto' picks the first of orjson, msgspec and the standard library that
+    is installed. Naming a library that is not installed raises ImportError.
+    """
+    with _decoders_lock:
+        decoder = _decoders.get(name)
+        if decoder is not None:
+            return decoder
+        if name == 'auto':
+            for candidate in DECODERS.values():
+                try:
+                    decoder = candidate()
+                    break
+                except ImportError:
+                    continue
+        elif name in DECODERS:
+            decoder = DECODERS[name]()
+        else:
+            raise ValueError(f"Unknown JSON decoder: {name}")
+        _decoders[name] = decoder
+        return decoder
+
+class _IncrementalParser:
+    """Resumable parser for a JSON array, or an object holding one array member.
+
+    Elements of the array are decoded one by one as their text arrives; with
+    ``array_key`` set, the other members of the enclosing object are decoded
+    whole into ``rest``.
+    """
+
+    def __init__(self, array_key: Optional[str] = None, rest: Optional[Dict[str, Any]] = None):
+        self.array_key = array_key
+        self.rest = rest if rest is not None else {}
+        self.state = 'array_start' if array_key is None else 'object_start'
+        self.member = None
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        # After a failed decode, wait for the pending text to double before trying
+        # again so large elements split over many chunks are not re-parsed per chunk
+        self.retry_length = 0
+
+    def feed(self, text: str, final: bool) -> Iterator[Any]:
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        while True:
+            buffer = self.buffer
+            while self.position < len(buffer) and buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position >= len(buffer):
+                if final and self.state != 'done':
+                    raise ValueError("Truncated JSON: the body ended before the array was closed")
+                return
+            char = buffer[self.position]
+            if self.state == 'done':
+                raise ValueError(f"Unexpected data after the JSON value: {buffer[self.position:self.position + 20]!r}")
+
+            if self.state in ('array_start', 'object_start'):
+                expected = '[' if self.state == 'array_start' else '{'
+                if char != expected:
+                    raise ValueError(f"Expected a JSON {'array' if expected == '[' else 'object'}")
+                self.position += 1
+                self.state = 'array' if expected == '[' else 'member'
+            elif self.state == 'array':
+                if char == ',':
+                    self.position += 1
+                elif char == ']':
+                    self.position += 1
+                    self.state = 'done' if self.array_key is None else 'member'
+                else:
+                    found, element = self._decode(final)
+                    if not found:
+                        return
+                    yield element
+            elif self.state == 'member':
+                if char == ',':
+                    self.position += 1
+                elif char == '}':
+                    self.position += 1
+                    self.state = 'done'
+                else:
+                    found, self.member = self._decode(final)
+                    if not found:
+                        return
+                    self.state = 'colon'
+            elif self.state == 'colon':
+                if char != ':':
+                    raise ValueError("Expected ':' after an object key")
+                self.position += 1
+                self.state = 'value'
+            elif self.state == 'value':
+                if self.member == self.array_key and char == '[':
+                    self.position += 1
+                    self.state = 'array'
+                    continue
+                found, value = self._decode(final)
+                if not found:
+                    return
+                self.rest[self.member] = value
+                self.state = 'member'
+
+    def _decode(self, final: bool):
+        """Decode the value at the current position; (False, None) when more text is needed"""
+        if not final and len(self.buffer) - self.position < self.retry_length:
+            return False, None
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            self.retry_length = 2 * (len(self.buffer) - self.position)
+            return False, None
+        self.retry_length = 0
+        if not final and end == len(self.buffer):
+            # A number split across chunks would decode as a shorter number
+            return False, None
+        self.position = end
+        return True, value
+
+def _iter_parsed(chunks: Iterable[bytes], parser: _IncrementalParser) -> Iterator[Any]:
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(text_decoder.decode(chunk), final=False)
+    yield from parser.feed(text_decoder.decode(b'', final=True), final=True)
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Incrementally decode the elements of a top-level JSON array.
+
+    ``chunks`` is any iterable of raw bytes, such as ``response.iter_content()``.
+    Each element is yielded as soon as it has been fully received, so only one
+    element plus the unread tail of the stream is ever held in memory. A body
+    that ends before the array is closed, or has data after it, raises
+    ValueError once the stream is exhausted.
+    """
+    return _iter_parsed(chunks, _IncrementalParser())
+
+def iter_json_object_array(chunks: Iterable[bytes], key: str,
+                           rest: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """Incrementally decode the elements of the array under ``key`` of a top-level JSON object.
+
+    Used for result pages such as ``{"data": [...], "paging": {...}}``: rows
+    are yielded as they arrive, so a page is never held as a full document.
+    The object's other members are stored in ``rest`` as they are read.
+    """
+    return _iter_parsed(chunks, _IncrementalParser(key, rest))
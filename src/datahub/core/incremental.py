@@ -0,0 +1,103 @@
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta
+from .config_manager import ConfigManager
+from .data_source import DataSource
+from .sync_state import metric_set_key
+
+DEFAULT_LOOKBACK_DAYS = 7
+
+def _to_day(value: datetime) -> datetime:
+    """Truncate a datetime to midnight"""
+    return datetime(value.year, value.month, value.day)
+
+class IncrementalSync:
+    """Fetches only the dates after a source's watermark, plus a lookback window.
+
+    Watermarks are kept per source_id and metric set in the ConfigManager's
+    sync state, and only advance once every page of a run has been consumed.
+    The lookback re-fetches the last few synced days so that late-arriving
+    conversions are picked up.
+    """
+    
+    def __init__(self, config_manager: ConfigManager, lookback_days: Optional[int] = None):
+        self.config_manager = config_manager
+        self.lookback_days = lookback_days
+    
+    def _lookback_days(self, source_id: str) -> int:
+        """Resolve the lookback for a source: constructor, then settings, then default"""
+        if self.lookback_days is not None:
+            return self.lookback_days
+        source_config = self.config_manager.get_source_config(source_id) or {}
+        return source_config.get('settings', {}).get('lookback_days', DEFAULT_LOOKBACK_DAYS)
+    
+    def plan_range(self,
+                   source_id: str,
+                   metrics: List[str],
+                   dimensions: List[str],
+                   end_date: datetime,
+                   initial_start_date: Optional[datetime] = None) -> Optional[Tuple[datetime, datetime]]:
+        """Return the (start, end) range to fetch, or None when already up to date"""
+        end_date = _to_day(end_date)
+        watermark = self.config_manager.sync_state.get_watermark(
+            source_id, metric_set_key(metrics, dimensions)
+        )
+        
+        if watermark is None:
+            if initial_start_date is None:
+                raise ValueError(f"No sync watermark for {source_id}; initial_start_date is required")
+            start_date = _to_day(initial_start_date)
+        else:
+            start_date = watermark + timedelta(days=1) - timedelta(days=self._lookback_days(source_id))
+            if initial_start_date is not None:
+                start_date = max(start_date, _to_day(initial_start_date))
+        
+        if start_date > end_date:
+            return None
+        return start_date, end_date
+    
+    def iter_pages(self,
+                   source: DataSource,
+                   source_id: str,
+                   metrics: List[str],
+                   dimensions: List[str],
+                   end_date: datetime,
+                   initial_start_date: Optional[datetime] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the pages of an incremental run, then advance the watermark"""
+        date_range = self.plan_range(source_id, metrics, dimensions, end_date, initial_start_date)
+        if date_range is None:
+            return
+        
+        start_date, end_date = date_range
+        yield from source.iter_pages(start_date, end_date, metrics, dimensions)
+        
+        metric_set = metric_set_key(metrics, dimensions)
+        watermark = self.config_manager.sync_state.get_watermark(source_id, metric_set)
+        if watermark is None or end_date > watermark:
+            self.config_manager.sync_state.set_watermark(source_id, metric_set, end_date)
+    
+    def run(self,
+            source_id: str,
+            metrics: List[str],
+            dimensions: List[str],
+            end_date: Optional[datetime] = None,
+            initial_start_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Connect to a configured source and return the rows of an incremental run.
+
+        ``end_date`` defaults to yesterday. Errors propagate and leave the
+        watermark untouched.
+        """
+        source_config = self.config_manager.get_source_config(source_id)
+        if not source_config:
+            raise ValueError(f"Unknown source: {source_id}")
+        
+        source = self.config_manager.get_data_source(source_config['type'], source_id)
+        if not source.connect():
+            raise ConnectionError(f"Failed to connect to source: {source_id}")
+        
+        if end_date is None:
+            end_date = datetime.now() - timedelta(days=1)
+        
+        rows = []
+        for page in self.iter_pages(source, source_id, metrics, dimensions, end_date, initial_start_date):
+            rows.extend(page)
+        return rows
@@ -0,0 +1,290 @@
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import re
+import threading
+
+Labels = Dict[str, str]
+
+# Path segments that name one object (ad accounts, customers, report runs)
+_ID_SEGMENT = re.compile(r'^(act_)?\d+$')
+
+def endpoint_name(url: str, base_url: str = '') -> str:
+    """Low-cardinality endpoint label: the URL path below base_url with ids replaced by {id}"""
+    if base_url and url.startswith(base_url):
+        path = url[len(base_url):]
+    else:
+        path = urlsplit(url).path
+    path = path.split('?', 1)[0]
+    segments = ['{id}' if _ID_SEGMENT.match(segment) else segment
+                for segment in path.split('/') if segment]
+    return '/' + '/'.join(segments)
+
+class InstrumentationHooks:
+    """Hook surface called on the fetch hot path; every hook is a no-op here.
+
+    ``labels`` always holds ``source`` (the source type) and ``account``.
+    Subclasses override the hooks they need; they must be cheap and
+    thread-safe, since they run inline with every request and page.
+    """
+
+    def request_start(self, labels: Labels, method: str, endpoint: str) -> Any:
+        """Called before a request is sent; the return value is passed to request_end"""
+        return None
+
+    def request_end(self, context: Any, labels: Labels, method: str, endpoint: str,
+                    status: str, seconds: float, response_bytes: Optional[int]):
+        """Called when a response arrived, or with status 'error' when the request raised"""
+        pass
+
+    def page_decoded(self, labels: Labels, rows: int, seconds: float):
+        """Called for each page fetched from the API, with the time taken to produce it"""
+        pass
+
+    def rows_emitted(self, labels: Labels, rows: int, cached: bool):
+        """Called for each page handed to the caller, including pages served from cache"""
+        pass
+
+    def retry(self, labels: Labels, reason: str, attempt: int):
+        """Called when a request or a shard is retried"""
+        pass
+
+    def throttle(self, labels: Labels, scope: str, seconds: float):
+        """Called when the rate limiter delayed a request ('wait') or paused an account ('pause')"""
+        pass
+
+class CompositeHooks(InstrumentationHooks):
+    """Fan every event out to several hook implementations"""
+
+    def __init__(self, *hooks: InstrumentationHooks):
+        self.hooks = list(hooks)
+
+    def request_start(self, labels, method, endpoint):
+        return [hook.request_start(labels, method, endpoint) for hook in self.hooks]
+
+    def request_end(self, context, labels, method, endpoint, status, seconds, response_bytes):
+        for hook, hook_context in zip(self.hooks, context):
+            hook.request_end(hook_context, labels, method, endpoint, status, seconds, response_bytes)
+
+    def page_decoded(self, labels, rows, seconds):
+        for hook in self.hooks:
+            hook.page_decoded(labels, rows, seconds)
+
+    def rows_emitted(self, labels, rows, cached):
+        for hook in self.hooks:
+            hook.rows_emitted(labels, rows, cached)
+
+    def retry(self, labels, reason, attempt):
+        for hook in self.hooks:
+            hook.retry(labels, reason, attempt)
+
+    def throttle(self, labels, scope, seconds):
+        for hook in self.hooks:
+            hook.throttle(labels, scope, seconds)
+
+_default_hooks = InstrumentationHooks()
+
+def get_default_hooks() -> InstrumentationHooks:
+    """Hooks used by sources whose settings do not provide ``instrumentation``"""
+    return _default_hooks
+
+def set_default_hooks(hooks: Optional[InstrumentationHooks]):
+    """Install process-wide hooks, e.g. a MetricsCollector; None restores the no-op hooks"""
+    global _default_hooks
+    _default_hooks = hooks or InstrumentationHooks()
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+ROWS_BUCKETS = (0, 10, 100, 500, 1000, 5000, 10000, 50000)
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus model"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., sum, count]
+        self.series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, key: Tuple, value: float):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def quantile(self, key: Tuple, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile, or None without data"""
+        series = self.series.get(key)
+        if not series or not series[-1]:
+            return None
+        rank = q * series[-1]
+        for index, bound in enumerate(self.buckets):
+            if series[index] >= rank:
+                return bound
+        return float('inf')
+
+def _format_labels(names: Sequence[str], values: Iterable[Any], extra: str = '') -> str:
+    parts = [
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class MetricsCollector(InstrumentationHooks):
+    """Aggregates hook events into counters and histograms per source and account.
+
+    Install it with ``set_default_hooks(collector)`` or a source's
+    ``instrumentation`` setting, then read ``to_prometheus()`` or
+    ``snapshot()``.
+    """
+
+    # name -> (type, help, label names)
+    METRICS = {
+        'datahub_requests_total': ('counter', 'HTTP requests sent', ('source', 'account', 'endpoint', 'method', 'status')),
+        'datahub_request_duration_seconds': ('histogram', 'HTTP request duration', ('source', 'account', 'endpoint')),
+        'datahub_response_bytes': ('histogram', 'HTTP response body size', ('source', 'account', 'endpoint')),
+        'datahub_page_duration_seconds': ('histogram', 'Time to fetch and decode one page', ('source', 'account')),
+        'datahub_page_rows': ('histogram', 'Rows per decoded page', ('source', 'account')),
+        'datahub_rows_total': ('counter', 'Rows handed to callers', ('source', 'account', 'cached')),
+        'datahub_retries_total': ('counter', 'Retried requests and shards', ('source', 'account', 'reason')),
+        'datahub_throttle_events_total': ('counter', 'Requests delayed by the rate limiter', ('source', 'account', 'scope')),
+        'datahub_throttle_seconds_total': ('counter', 'Time spent waiting on the rate limiter', ('source', 'account', 'scope')),
+    }
+
+    HISTOGRAM_BUCKETS = {
+        'datahub_request_duration_seconds': DURATION_BUCKETS,
+        'datahub_response_bytes': BYTES_BUCKETS,
+        'datahub_page_duration_seconds': DURATION_BUCKETS,
+        'datahub_page_rows': ROWS_BUCKETS,
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters: Dict[str, Dict[Tuple, float]] = {
+                name: {} for name, (kind, _, _) in self.METRICS.items() if kind == 'counter'
+            }
+            self.histograms: Dict[str, Histogram] = {
+                name: Histogram(buckets) for name, buckets in self.HISTOGRAM_BUCKETS.items()
+            }
+
+    def _inc(self, name: str, key: Tuple, amount: float = 1):
+        counter = self.counters[name]
+        counter[key] = counter.get(key, 0) + amount
+
+    def request_end(self, context, labels, method, endpoint, status, seconds, response_bytes):
+        source, account = labels['source'], labels['account']
+        with self._lock:
+            self._inc('datahub_requests_total', (source, account, endpoint, method, status))
+            self.histograms['datahub_request_duration_seconds'].observe((source, account, endpoint), seconds)
+            if response_bytes is not None:
+                self.histograms['datahub_response_bytes'].observe((source, account, endpoint), response_bytes)
+
+    def page_decoded(self, labels, rows, seconds):
+        key = (labels['source'], labels['account'])
+        with self._lock:
+            self.histograms['datahub_page_duration_seconds'].observe(key, seconds)
+            self.histograms['datahub_page_rows'].observe(key, rows)
+
+    def rows_emitted(self, labels, rows, cached):
+        with self._lock:
+            self._inc('datahub_rows_total', (labels['source'], labels['account'], str(cached).lower()), rows)
+
+    def retry(self, labels, reason, attempt):
+        with self._lock:
+            self._inc('datahub_retries_total', (labels['source'], labels['account'], reason))
+
+    def throttle(self, labels, scope, seconds):
+        key = (labels['source'], labels['account'], scope)
+        with self._lock:
+            self._inc('datahub_throttle_events_total', key)
+            self._inc('datahub_throttle_seconds_total', key, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain-dict copy of every series, keyed by metric name and label tuple"""
+        with self._lock:
+            data = {name: dict(series) for name, series in self.counters.items()}
+            for name, histogram in self.histograms.items():
+                data[name] = {
+                    key: {'count': series[-1], 'sum': series[-2],
+                          'p50': histogram.quantile(key, 0.5), 'p99': histogram.quantile(key, 0.99)}
+                    for key, series in histogram.series.items()
+                }
+            return data
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, label_names) in self.METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == 'counter':
+                    for key, value in sorted(self.counters[name].items()):
+                        lines.append(f"{name}{_format_labels(label_names, key)} {_format_number(value)}")
+                    continue
+                histogram = self.histograms[name]
+                for key, series in sorted(histogram.series.items()):
+                    for index, bound in enumerate(histogram.buckets + (float('inf'),)):
+                        count = series[index] if index < len(histogram.buckets) else series[-1]
+                        le = 'le="' + _format_number(bound) + '"'
+                        lines.append(f"{name}_bucket{_format_labels(label_names, key, le)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, key)} {_format_number(series[-2])}")
+                    lines.append(f"{name}_count{_format_labels(label_names, key)} {series[-1]}")
+        return '\n'.join(lines) + '\n'
+
+class TracingHooks(InstrumentationHooks):
+    """Record HTTP requests, retries and throttle delays as tracing spans.
+
+    ``tracer`` follows the OpenTelemetry API (``start_span(name,
+    attributes=...)`` returning a span with ``set_attribute`` and ``end``).
+    Without one, the global OpenTelemetry tracer is used, which requires the
+    opentelemetry-api package.
+    """
+
+    def __init__(self, tracer: Any = None):
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer('datahub')
+        self.tracer = tracer
+
+    @staticmethod
+    def _attributes(labels: Labels, **extra) -> Dict[str, Any]:
+        attributes = {'datahub.source': labels['source'], 'datahub.account': labels['account']}
+        attributes.update(extra)
+        return attributes
+
+    def request_start(self, labels, method, endpoint):
+        return self.tracer.start_span(f"{method} {endpoint}", attributes=self._attributes(
+            labels, **{'http.method': method, 'datahub.endpoint': endpoint}
+        ))
+
+    def request_end(self, context, labels, method, endpoint, status, seconds, response_bytes):
+        if context is None:
+            return
+        context.set_attribute('http.status_code', status)
+        if response_bytes is not None:
+            context.set_attribute('http.response_content_length', response_bytes)
+        context.end()
+
+    def retry(self, labels, reason, attempt):
+        self.tracer.start_span('datahub.retry', attributes=self._attributes(
+            labels, **{'datahub.retry_reason': reason, 'datahub.attempt': attempt}
+        )).end()
+
+    def throttle(self, labels, scope, seconds):
+        self.tracer.start_span('datahub.throttle', attributes=self._attributes(
+            labels, **{'datahub.throttle_scope': scope, 'datahub.throttle_seconds': seconds}
+        )).end()
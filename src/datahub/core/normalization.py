@@ -0,0 +1,142 @@
+from typing import Dict, Any, Iterable, Iterator, List, Tuple, Union
+from array import array
+import math
+from .columnar import ColumnarBatch, DictionaryColumn, INT64, FLOAT64, STRING, np
+
+# Canonical, source-independent fields and their column types
+CANONICAL_SCHEMA = {
+    'date': STRING,
+    'account_id': STRING,
+    'campaign_id': STRING,
+    'campaign_name': STRING,
+    'ad_group_id': STRING,
+    'ad_group_name': STRING,
+    'ad_id': STRING,
+    'ad_name': STRING,
+    'impressions': INT64,
+    'clicks': INT64,
+    'cost': FLOAT64,
+    'conversions': FLOAT64,
+}
+
+SOURCE_TYPE_FIELD = 'source_type'
+
+FieldMapping = Dict[str, Union[str, Tuple[str, float]]]
+
+def _null_column(field_type: str, num_rows: int):
+    """A column of nulls: NaN for numbers, code -1 for strings"""
+    if field_type == STRING:
+        codes = np.full(num_rows, -1, dtype=np.int32) if np is not None else array('i', [-1] * num_rows)
+        return DictionaryColumn(codes, [])
+    if np is not None:
+        return np.full(num_rows, np.nan)
+    return array('d', [math.nan] * num_rows)
+
+def _constant_column(value: str, num_rows: int) -> DictionaryColumn:
+    codes = np.zeros(num_rows, dtype=np.int32) if np is not None else array('i', [0] * num_rows)
+    return DictionaryColumn(codes, [value])
+
+def _to_string_column(batch: ColumnarBatch, field: str) -> DictionaryColumn:
+    """Cast a column to a dictionary-encoded string column"""
+    column = batch.columns[field]
+    if isinstance(column, DictionaryColumn):
+        return column
+    if batch.field_type(field) == INT64 and np is not None:
+        # Encode the distinct values once instead of stringifying every row
+        categories, codes = np.unique(column, return_inverse=True)
+        return DictionaryColumn(codes.astype(np.int32), [str(value) for value in categories.tolist()])
+    values = batch.column(field)
+    if batch.field_type(field) == FLOAT64:
+        values = [None if value != value else value for value in values]
+    return DictionaryColumn.encode(values)
+
+def _to_numeric_column(batch: ColumnarBatch, field: str, field_type: str, scale: float):
+    """Cast a column to int64/float64, applying a scale factor"""
+    column = batch.columns[field]
+    if isinstance(column, DictionaryColumn):
+        # Parse each distinct string once, then gather by code
+        parsed = [float(category) for category in column.categories] + [math.nan]
+        if np is not None:
+            column = np.array(parsed)[column.codes]
+        else:
+            column = array('d', (parsed[code] for code in column.codes))
+        source_type = FLOAT64
+    else:
+        source_type = batch.field_type(field)
+
+    if np is not None:
+        values = column if scale == 1 else column.astype(np.float64) * scale
+        if field_type == INT64 and (values.dtype == np.int64 or not np.isnan(values).any()):
+            return values.astype(np.int64)
+        return values.astype(np.float64)
+
+    if field_type == INT64 and source_type == INT64 and scale == 1:
+        return array('q', column)
+    return array('d', (value * scale for value in column))
+
+class SchemaNormalizer:
+    """Maps each source's fields onto CANONICAL_SCHEMA, one batch at a time.
+
+    Sources declare a ``schema_mapping`` class attribute, or register a
+    mapping, from canonical field to their own field name, or to a
+    (field, scale) pair for unit conversions such as micros. The work
+    is done per column, so its cost grows with the number of fields and
+    distinct values rather than with a Python loop over every row.
+    """
+
+    _mappings: Dict[str, FieldMapping] = {}
+
+    @classmethod
+    def register(cls, source_type: str, mapping: FieldMapping):
+        """Register the canonical field mapping of a data source type"""
+        cls._mappings[source_type] = mapping
+
+    @classmethod
+    def mapping_for(cls, source_type: str) -> FieldMapping:
+        """Return the registered mapping, falling back to the source class's ``schema_mapping``"""
+        mapping = cls._mappings.get(source_type)
+        if mapping is None:
+            # Source modules load lazily, so look the class up through the factory
+            from .data_source import DataSourceFactory
+            try:
+                mapping = getattr(DataSourceFactory.get_source_class(source_type), 'schema_mapping', None)
+            except ValueError:
+                mapping = None
+        if mapping is None:
+            raise ValueError(f"No schema mapping registered for data source type: {source_type}")
+        return mapping
+
+    @classmethod
+    def normalize_batch(cls, source_type: str, batch: ColumnarBatch) -> ColumnarBatch:
+        """Return a batch holding every canonical field, plus the source type.
+
+        Canonical fields the source does not provide, or did not return, are
+        filled with nulls so that batches from different sources concatenate.
+        """
+        mapping = cls.mapping_for(source_type)
+        num_rows = len(batch)
+
+        columns = {}
+        for field, field_type in CANONICAL_SCHEMA.items():
+            source_field = mapping.get(field)
+            scale = 1
+            if isinstance(source_field, (tuple, list)):
+                source_field, scale = source_field
+            if source_field is None or source_field not in batch.columns:
+                columns[field] = _null_column(field_type, num_rows)
+            elif field_type == STRING:
+                columns[field] = _to_string_column(batch, source_field)
+            else:
+                columns[field] = _to_numeric_column(batch, source_field, field_type, scale)
+        columns[SOURCE_TYPE_FIELD] = _constant_column(source_type, num_rows)
+        return ColumnarBatch(columns, num_rows)
+
+    @classmethod
+    def normalize_pages(cls,
+                        source_type: str,
+                        pages: Iterable[List[Dict[str, Any]]],
+                        dimensions: Iterable[str] = ()) -> Iterator[ColumnarBatch]:
+        """Normalize a stream of row pages, yielding one batch per page"""
+        dimensions = list(dimensions)
+        for page in pages:
+            yield cls.normalize_batch(source_type, ColumnarBatch.from_rows(page, dimensions=dimensions))
@@ -0,0 +1,235 @@
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+import os
+import threading
+from .columnar import ColumnarBatch, DictionaryColumn, np
+from .normalization import SchemaNormalizer, CANONICAL_SCHEMA, SOURCE_TYPE_FIELD
+from .storage import StorageBackend, create_backend
+
+# Additive canonical metrics summed per group
+SUM_FIELDS = ('impressions', 'clicks', 'cost', 'conversions')
+# Ratios derived from the sums when a rollup is read
+RATIO_FIELDS = ('ctr', 'cpc', 'cpm')
+COUNT_FIELDS = ('impressions', 'clicks')
+DATE_FIELD = 'date'
+
+# Group keys (in group_by order) and their sums, one row per group
+Partial = Tuple[List[Tuple[Optional[str], ...]], Any]
+
+def _merge_partials(parts: Sequence[Partial]) -> Partial:
+    """Add up partials that may share group keys"""
+    index: Dict[Tuple, int] = {}
+    groups: List[Tuple] = []
+    positions = []
+    for part_groups, _ in parts:
+        for group in part_groups:
+            position = index.get(group)
+            if position is None:
+                position = index[group] = len(groups)
+                groups.append(group)
+            positions.append(position)
+    sums = np.zeros((len(groups), len(SUM_FIELDS)))
+    if positions:
+        np.add.at(sums, np.array(positions), np.vstack([part_sums for _, part_sums in parts]))
+    return groups, sums
+
+def _ratio(numerator, denominator, scale: float = 1.0):
+    result = np.full(len(numerator), np.nan)
+    np.divide(numerator * scale, denominator, out=result, where=denominator > 0)
+    return result
+
+class Rollup:
+    """Group-by sums and CTR/CPC/CPM over fetched rows, maintained day by day.
+
+    Rows from any source are normalized to CANONICAL_SCHEMA and grouped with
+    NumPy over the dictionary codes of the ``group_by`` fields. Sums are kept
+    as one partial per source, scope and day, so updating with newly fetched
+    days only aggregates those days; a day fetched again (late attribution)
+    replaces its previous partial for the same scope only. The scope is the
+    rows' account unless the caller passes one. Reading combines the small
+    partials. With a storage backend, partials persist between runs.
+    """
+
+    def __init__(self,
+                 group_by: Sequence[str] = (DATE_FIELD, 'campaign_id'),
+                 backend: Optional[StorageBackend] = None):
+        if np is None:
+            raise ImportError("numpy is required for Rollup")
+        group_fields = [field for field, field_type in CANONICAL_SCHEMA.items() if field not in SUM_FIELDS]
+        invalid = [field for field in group_by if field not in group_fields and field != SOURCE_TYPE_FIELD]
+        if invalid:
+            raise ValueError(f"Cannot group by: {', '.join(invalid)}")
+        self.group_by = tuple(group_by)
+        self.backend = backend
+        self._partials: Dict[Tuple[str, str, str], Partial] = {}
+        self._lock = threading.Lock()
+        if backend is not None:
+            for record in backend.items().values():
+                self._partials[(record['source_type'], record.get('scope', ''), record['date'])] = (
+                    [tuple(group) for group in record['groups']],
+                    np.array(record['sums'], dtype=np.float64).reshape(-1, len(SUM_FIELDS))
+                )
+
+    @classmethod
+    def open(cls, directory: str, group_by: Sequence[str] = (DATE_FIELD, 'campaign_id'),
+             storage: str = 'json') -> 'Rollup':
+        """Rollup persisted under directory, one table (or JSON file) per grouping"""
+        name = 'rollup_' + '_'.join(group_by)
+        os.makedirs(directory, exist_ok=True)
+        return cls(group_by, create_backend(storage, directory, name, os.path.join(directory, name + '.json')))
+
+    def update(self, source_type: str, rows: List[Dict[str, Any]], scope: Optional[str] = None) -> List[str]:
+        """Merge rows as returned by a source's fetch_data; return the days replaced"""
+        return self.update_pages(source_type, [rows], scope)
+
+    def update_pages(self,
+                     source_type: str,
+                     pages: Iterable[List[Dict[str, Any]]],
+                     scope: Optional[str] = None) -> List[str]:
+        """Merge pages of rows, e.g. from iter_pages; return the days replaced.
+
+        The pages are taken to hold every row of the days they contain for
+        their scope, so each of those days replaces the partial stored for it.
+        ``scope`` names what the rows cover, e.g. an account; by default each
+        row's ``account_id`` is used, so updates from several accounts of
+        one platform add up. Rows must cover single days: rows summed over
+        a range (Facebook Ads without ``time_increment: 1``) raise ValueError.
+        """
+        mapping = SchemaNormalizer.mapping_for(source_type)
+        key_fields = self.group_by + (DATE_FIELD,) + (('account_id',) if scope is None else ())
+        dimensions = [mapping[field] for field in key_fields if isinstance(mapping.get(field), str)]
+        date_end_field = self._date_end_field(source_type)
+        if date_end_field is not None:
+            dimensions.append(date_end_field)
+        # Only the source fields the rollup reads are converted to columns
+        fields = list(dict.fromkeys(dimensions))
+        for field in SUM_FIELDS:
+            source_field = mapping.get(field)
+            if isinstance(source_field, (tuple, list)):
+                source_field = source_field[0]
+            if isinstance(source_field, str) and source_field not in fields:
+                fields.append(source_field)
+        fresh: Dict[Tuple[str, str], List[Partial]] = {}
+        for page in pages:
+            if not page:
+                continue
+            batch = ColumnarBatch.from_rows(page, fields=fields, dimensions=dimensions)
+            if date_end_field is not None:
+                self._check_single_days(source_type, batch, mapping.get(DATE_FIELD), date_end_field)
+            batch = SchemaNormalizer.normalize_batch(source_type, batch)
+            for key, partial in self._group(batch, scope).items():
+                fresh.setdefault(key, []).append(partial)
+
+        merged = {key: _merge_partials(parts) for key, parts in fresh.items()}
+        with self._lock:
+            for (row_scope, day), partial in merged.items():
+                self._partials[(source_type, row_scope, day)] = partial
+            if self.backend is not None and merged:
+                self.backend.put_many(
+                    (f"{source_type}|{row_scope}|{day}", {
+                        'source_type': source_type,
+                        'scope': row_scope,
+                        'date': day,
+                        'groups': [list(group) for group in groups],
+                        'sums': sums.tolist(),
+                    })
+                    for (row_scope, day), (groups, sums) in merged.items()
+                )
+        return sorted({day for _, day in merged})
+
+    @staticmethod
+    def _date_end_field(source_type: str) -> Optional[str]:
+        """Field holding the last day of a row, for source types whose rows can span a range"""
+        from .data_source import DataSourceFactory
+        try:
+            return getattr(DataSourceFactory.get_source_class(source_type), 'date_end_field', None)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _check_single_days(source_type: str, batch: ColumnarBatch, date_field: Optional[str],
+                           date_end_field: str):
+        """Reject rows whose first and last day differ, comparing each distinct pair once"""
+        start, end = batch.columns.get(date_field), batch.columns.get(date_end_field)
+        if not isinstance(start, DictionaryColumn) or not isinstance(end, DictionaryColumn):
+            return
+        pairs = np.unique(np.stack([np.asarray(start.codes), np.asarray(end.codes)], axis=1), axis=0)
+        for start_code, end_code in pairs.tolist():
+            if start_code >= 0 and end_code >= 0 and start.categories[start_code] != end.categories[end_code]:
+                raise ValueError(
+                    f"Rollup needs one row per day, but {source_type} rows cover "
+                    f"{start.categories[start_code]}..{end.categories[end_code]}; "
+                    f"fetch them with time_increment: 1"
+                )
+
+    def _group(self, batch: ColumnarBatch, scope: Optional[str] = None) -> Dict[Tuple[str, str], Partial]:
+        """Sum a normalized batch per (scope, day, group) in one vectorized pass.
+
+        Without a scope, each row's account_id is its scope.
+        """
+        key_fields = list(self.group_by)
+        for field in (DATE_FIELD,) + (('account_id',) if scope is None else ()):
+            if field not in key_fields:
+                key_fields.append(field)
+        day_index = key_fields.index(DATE_FIELD)
+        scope_index = key_fields.index('account_id') if scope is None else None
+        columns: List[DictionaryColumn] = [batch.columns[field] for field in key_fields]
+
+        codes = np.stack([np.asarray(column.codes, dtype=np.int64) for column in columns], axis=1)
+        unique, inverse = np.unique(codes, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        sums = np.column_stack([
+            np.bincount(inverse, weights=np.nan_to_num(np.asarray(batch.columns[field], dtype=np.float64)),
+                        minlength=len(unique))
+            for field in SUM_FIELDS
+        ])
+
+        by_key: Dict[Tuple[str, str], Tuple[List[Tuple], List[int]]] = {}
+        for row, key_codes in enumerate(unique.tolist()):
+            key = tuple(columns[i].categories[code] if code >= 0 else None
+                        for i, code in enumerate(key_codes))
+            row_scope = scope if scope_index is None else key[scope_index] or ''
+            groups, rows = by_key.setdefault((row_scope, key[day_index] or ''), ([], []))
+            groups.append(key[:len(self.group_by)])
+            rows.append(row)
+        return {key: (groups, sums[rows]) for key, (groups, rows) in by_key.items()}
+
+    def days(self, source_type: Optional[str] = None) -> List[str]:
+        """Days held in the rollup, optionally for one source"""
+        with self._lock:
+            return sorted({day for source, _, day in self._partials if source_type in (None, source)})
+
+    def result(self,
+               start_date: Optional[str] = None,
+               end_date: Optional[str] = None,
+               source_types: Optional[Iterable[str]] = None) -> ColumnarBatch:
+        """Combine partials into one row per group, with sums and ratios.
+
+        Dates are inclusive 'YYYY-MM-DD' strings. Ratios are NaN where the
+        denominator is zero; cost is in account currency, cpm per 1000
+        impressions.
+        """
+        source_types = set(source_types) if source_types is not None else None
+        with self._lock:
+            parts = [
+                partial for (source, _, day), partial in sorted(self._partials.items())
+                if (source_types is None or source in source_types)
+                and (start_date is None or day >= start_date)
+                and (end_date is None or day <= end_date)
+            ]
+        groups, sums = _merge_partials(parts)
+
+        columns: Dict[str, Any] = {}
+        for index, field in enumerate(self.group_by):
+            columns[field] = DictionaryColumn.encode(group[index] for group in groups)
+        for index, field in enumerate(SUM_FIELDS):
+            values = sums[:, index]
+            columns[field] = np.rint(values).astype(np.int64) if field in COUNT_FIELDS else values
+        impressions, clicks, cost = sums[:, 0], sums[:, 1], sums[:, 2]
+        columns['ctr'] = _ratio(clicks, impressions)
+        columns['cpc'] = _ratio(cost, clicks)
+        columns['cpm'] = _ratio(cost, impressions, 1000.0)
+        return ColumnarBatch(columns, len(groups))
+
+    def to_rows(self, **filters) -> List[Dict[str, Any]]:
+        """result() as row dicts"""
+        return self.result(**filters).to_rows()
@@ -0,0 +1,171 @@
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime
+import hashlib
+import json
+from .cache import _encode_value, _decode_object
+from .storage import SqliteDatabase
+
+# Keys looked up per SELECT ... IN (...), below SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+def _serialize(row: Dict[str, Any]) -> str:
+    return json.dumps(row, sort_keys=True, default=_encode_value, separators=(',', ':'))
+
+class UpsertResult:
+    """What an upsert changed: rows inserted or updated, and rows deleted"""
+
+    def __init__(self):
+        self.changed: List[Dict[str, Any]] = []
+        self.deleted: List[Dict[str, Any]] = []
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def __repr__(self) -> str:
+        return (f"UpsertResult(inserted={self.inserted}, updated={self.updated}, "
+                f"unchanged={self.unchanged}, deleted={len(self.deleted)})")
+
+class KeyedRowStore(SqliteDatabase):
+    """Fetched rows indexed by a natural key, for reconciling re-fetched windows.
+
+    Rows live in one SQLite table, partitioned by ``namespace`` (a source
+    and query) and keyed by the values of the natural key fields, next to a
+    digest of their content and their reporting day. An upsert looks up only
+    the incoming keys and writes only rows whose digest differs, so pulling
+    an overlapping lookback window costs reads of the fetched rows and
+    writes of the changed ones, and only those are handed downstream.
+    """
+
+    def __init__(self, path: str, table: str = 'keyed_rows', timeout: float = 30.0):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        super().__init__(path, timeout)
+        self.table = table
+        with self.transaction() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, day TEXT, digest TEXT NOT NULL, "
+                "row TEXT NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_day ON {table} (namespace, day)"
+            )
+
+    @staticmethod
+    def row_key(row: Dict[str, Any], key_fields: Sequence[str]) -> str:
+        return json.dumps([row.get(field) for field in key_fields], default=str, separators=(',', ':'))
+
+    def upsert(self,
+               namespace: str,
+               rows: List[Dict[str, Any]],
+               key_fields: Sequence[str],
+               date_field: Optional[str] = None,
+               window: Optional[Tuple[datetime, datetime]] = None) -> UpsertResult:
+        """Upsert one list of rows, e.g. the output of fetch_data; see upsert_pages"""
+        return self.upsert_pages(namespace, [rows], key_fields, date_field, window)
+
+    def upsert_pages(self,
+                     namespace: str,
+                     pages: Iterable[List[Dict[str, Any]]],
+                     key_fields: Sequence[str],
+                     date_field: Optional[str] = None,
+                     window: Optional[Tuple[datetime, datetime]] = None) -> UpsertResult:
+        """Insert new rows and replace changed ones, page by page.
+
+        Within the pages the last row for a key wins. Each page is committed
+        on its own, so fetching is never done while holding the write lock.
+        With ``window`` (and ``date_field``) the pages are taken as the full
+        content of that date range: stored rows in it whose key was not
+        fetched again are deleted and reported in ``deleted``.
+        """
+        result = UpsertResult()
+        seen_table = f"temp.{self.table}_seen"
+        connection = self._connection()
+        if window is not None:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {seen_table} (key TEXT PRIMARY KEY)")
+            connection.execute(f"DELETE FROM {seen_table}")
+
+        for page in pages:
+            incoming: Dict[str, Tuple[Optional[str], str, str, Dict[str, Any]]] = {}
+            for row in page:
+                serialized = _serialize(row)
+                day = row.get(date_field) if date_field else None
+                incoming[self.row_key(row, key_fields)] = (
+                    str(day)[:10] if day is not None else None,
+                    hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest(),
+                    serialized,
+                    row,
+                )
+            if not incoming:
+                continue
+
+            updated_at = datetime.now().isoformat()
+            with self.transaction() as connection:
+                stored = self._digests(connection, namespace, list(incoming))
+                writes = []
+                for key, (day, digest, serialized, row) in incoming.items():
+                    previous = stored.get(key)
+                    if previous == digest:
+                        result.unchanged += 1
+                        continue
+                    if previous is None:
+                        result.inserted += 1
+                    else:
+                        result.updated += 1
+                    result.changed.append(row)
+                    writes.append((namespace, key, day, digest, serialized, updated_at))
+                connection.executemany(
+                    f"INSERT INTO {self.table} (namespace, key, day, digest, row, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(namespace, key) DO UPDATE SET "
+                    "day = excluded.day, digest = excluded.digest, row = excluded.row, "
+                    "updated_at = excluded.updated_at",
+                    writes
+                )
+                if window is not None:
+                    connection.executemany(f"INSERT OR IGNORE INTO {seen_table} (key) VALUES (?)",
+                                           [(key,) for key in incoming])
+
+        if window is not None and date_field:
+            start_day, end_day = (day.strftime('%Y-%m-%d') for day in window)
+            with self.transaction() as connection:
+                missing = connection.execute(
+                    f"SELECT key, row FROM {self.table} WHERE namespace = ? AND day BETWEEN ? AND ? "
+                    f"AND key NOT IN (SELECT key FROM {seen_table})",
+                    (namespace, start_day, end_day)
+                ).fetchall()
+                connection.executemany(f"DELETE FROM {self.table} WHERE namespace = ? AND key = ?",
+                                       [(namespace, key) for key, _ in missing])
+            result.deleted = [json.loads(row, object_hook=_decode_object) for _, row in missing]
+        return result
+
+    def _digests(self, connection, namespace: str, keys: List[str]) -> Dict[str, str]:
+        """Stored digests of the given keys, looked up through the primary key index"""
+        digests = {}
+        for offset in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[offset:offset + LOOKUP_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            digests.update(connection.execute(
+                f"SELECT key, digest FROM {self.table} WHERE namespace = ? AND key IN ({placeholders})",
+                [namespace] + chunk
+            ).fetchall())
+        return digests
+
+    def rows(self, namespace: str, start_date: Optional[datetime] = None,
+             end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Stored rows of a namespace, optionally limited to a date range"""
+        query = f"SELECT row FROM {self.table} WHERE namespace = ?"
+        params: List[Any] = [namespace]
+        if start_date is not None:
+            query += " AND day >= ?"
+            params.append(start_date.strftime('%Y-%m-%d'))
+        if end_date is not None:
+            query += " AND day <= ?"
+            params.append(end_date.strftime('%Y-%m-%d'))
+        query += " ORDER BY day, key"
+        return [json.loads(row, object_hook=_decode_object)
+                for row, in self._connection().execute(query, params)]
+
+    def count(self, namespace: str) -> int:
+        return self._connection().execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE namespace = ?", (namespace,)
+        ).fetchone()[0]
@@ -0,0 +1,244 @@
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import itertools
+from .config_manager import ConfigManager
+from .data_source import DataSource, split_date_range
+from .source_pool import SourcePool
+
+# Credential keys that identify the ad account behind a source
+ACCOUNT_CREDENTIAL_KEYS = ('ad_account_id', 'customer_id')
+
+class SyncJob:
+    """One unit of sync work: a configured source and a date window"""
+
+    def __init__(self,
+                 source_id: str,
+                 source_type: str,
+                 account_id: str,
+                 start_date: datetime,
+                 end_date: datetime,
+                 metrics: List[str],
+                 dimensions: List[str],
+                 priority: int = 0):
+        self.source_id = source_id
+        self.source_type = source_type
+        self.account_id = account_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.metrics = metrics
+        self.dimensions = dimensions
+        # Lower values run first
+        self.priority = priority
+        self.attempts = 0
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and self.attempts > 0
+
+    def __repr__(self) -> str:
+        return (f"SyncJob({self.source_id}, {self.start_date:%Y-%m-%d}..{self.end_date:%Y-%m-%d}, "
+                f"priority={self.priority})")
+
+def collect_rows(source: DataSource, job: SyncJob) -> List[Dict[str, Any]]:
+    """Default job handler: fetch the job's window and return its rows"""
+    return list(source.iter_rows(job.start_date, job.end_date, job.metrics, job.dimensions))
+
+class SyncScheduler:
+    """Runs sync jobs for many sources with per-platform and per-account limits.
+
+    At most ``platform_limits[source_type]`` jobs of a platform and
+    ``account_limit`` jobs of an account run at once. Among the jobs allowed to
+    start, the one with the lowest priority value wins; ties go to the account
+    that has started the fewest jobs, so one large account cannot starve the
+    others.
+    """
+
+    def __init__(self,
+                 config_manager: ConfigManager,
+                 platform_limits: Optional[Dict[str, int]] = None,
+                 default_platform_limit: int = 4,
+                 account_limit: int = 1,
+                 max_workers: Optional[int] = None,
+                 max_retries: int = 1,
+                 source_pool: Optional[SourcePool] = None):
+        # A limit of 0 would leave jobs that can never start, and run() would wait forever
+        limits = list((platform_limits or {}).items()) + [('default_platform_limit', default_platform_limit),
+                                                          ('account_limit', account_limit)]
+        invalid = [name for name, limit in limits if limit < 1]
+        if invalid:
+            raise ValueError(f"Concurrency limits must be at least 1: {', '.join(invalid)}")
+        self.config_manager = config_manager
+        self.platform_limits = platform_limits or {}
+        self.default_platform_limit = default_platform_limit
+        self.account_limit = account_limit
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.source_pool = source_pool or SourcePool(config_manager)
+
+    def build_jobs(self,
+                   start_date: datetime,
+                   end_date: datetime,
+                   metrics: Optional[Dict[str, List[str]]] = None,
+                   dimensions: Optional[Dict[str, List[str]]] = None,
+                   window: Any = 'day',
+                   source_ids: Optional[List[str]] = None) -> List[SyncJob]:
+        """Build one job per configured source and date window.
+
+        ``metrics`` and ``dimensions`` are keyed by source type; a source's own
+        ``metrics``/``dimensions`` settings take precedence. The most recent
+        windows get the lowest priority values, so the freshest data lands first.
+        """
+        metrics = metrics or {}
+        dimensions = dimensions or {}
+        sources = self.config_manager.list_sources()
+        if source_ids is None:
+            source_ids = list(sources)
+
+        windows = split_date_range(start_date, end_date, window)
+        jobs = []
+        for source_id in source_ids:
+            source_config = sources[source_id]
+            source_type = source_config['type']
+            settings = source_config.get('settings', {})
+            credentials = source_config.get('credentials', {})
+            account_id = next(
+                (credentials[key] for key in ACCOUNT_CREDENTIAL_KEYS if credentials.get(key)),
+                source_id
+            )
+            for index, (window_start, window_end) in enumerate(reversed(windows)):
+                jobs.append(SyncJob(
+                    source_id=source_id,
+                    source_type=source_type,
+                    account_id=f"{source_type}:{account_id}",
+                    start_date=window_start,
+                    end_date=window_end,
+                    metrics=settings.get('metrics', metrics.get(source_type, [])),
+                    dimensions=settings.get('dimensions', dimensions.get(source_type, [])),
+                    priority=index
+                ))
+        return jobs
+
+    def platform_limit(self, source_type: str) -> int:
+        return self.platform_limits.get(source_type, self.default_platform_limit)
+
+    def run(self,
+            jobs: List[SyncJob],
+            handler: Callable[[DataSource, SyncJob], Any] = collect_rows) -> List[SyncJob]:
+        """Run jobs to completion and return them with result or error set.
+
+        Failed jobs are re-queued up to ``max_retries`` times. ``handler``
+        receives the connected source and the job, and its return value is
+        stored as ``job.result``.
+        """
+        max_workers = self.max_workers or sum(
+            self.platform_limit(source_type) for source_type in {job.source_type for job in jobs}
+        ) or 1
+
+        sequence = itertools.count()
+        pending = self._queue(jobs, sequence)
+
+        running_per_platform: Dict[str, int] = {}
+        running_per_account: Dict[str, int] = {}
+        started_per_account: Dict[str, int] = {account: 0 for account in pending}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                job = self._next_job(pending, running_per_platform, running_per_account,
+                                     started_per_account) if len(running) < max_workers else None
+                if job is not None:
+                    running_per_platform[job.source_type] = running_per_platform.get(job.source_type, 0) + 1
+                    running_per_account[job.account_id] = running_per_account.get(job.account_id, 0) + 1
+                    started_per_account[job.account_id] += 1
+                    running[executor.submit(self._execute, job, handler)] = job
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    running_per_platform[job.source_type] -= 1
+                    running_per_account[job.account_id] -= 1
+                    if job.error is not None and job.attempts <= self.max_retries:
+                        pending.setdefault(job.account_id, []).insert(0, (job.priority, next(sequence), job))
+        return jobs
+
+    def dispatch(self,
+                 jobs: List[SyncJob],
+                 submit: Callable[[SyncJob], Future],
+                 max_workers: int) -> Iterator[Tuple[SyncJob, Future]]:
+        """Submit jobs within the concurrency limits; yield (job, future) as each completes.
+
+        ``submit`` starts a job elsewhere, e.g. on a process pool, and returns
+        its future. Unlike run, results stay in the futures and failed jobs
+        are not retried.
+        """
+        pending = self._queue(jobs, itertools.count())
+        running_per_platform: Dict[str, int] = {}
+        running_per_account: Dict[str, int] = {}
+        started_per_account: Dict[str, int] = {account: 0 for account in pending}
+        running: Dict[Future, SyncJob] = {}
+        while pending or running:
+            job = self._next_job(pending, running_per_platform, running_per_account,
+                                 started_per_account) if len(running) < max_workers else None
+            if job is not None:
+                running_per_platform[job.source_type] = running_per_platform.get(job.source_type, 0) + 1
+                running_per_account[job.account_id] = running_per_account.get(job.account_id, 0) + 1
+                started_per_account[job.account_id] += 1
+                running[submit(job)] = job
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                running_per_platform[job.source_type] -= 1
+                running_per_account[job.account_id] -= 1
+                yield job, future
+
+    @staticmethod
+    def _queue(jobs: List[SyncJob], sequence) -> Dict[str, List]:
+        """Pending jobs per account, each list ordered by (priority, sequence)"""
+        pending: Dict[str, List] = {}
+        for job in jobs:
+            pending.setdefault(job.account_id, []).append((job.priority, next(sequence), job))
+        for queue in pending.values():
+            queue.sort(key=lambda entry: entry[:2])
+        return pending
+
+    def _next_job(self, pending, running_per_platform, running_per_account,
+                  started_per_account) -> Optional[SyncJob]:
+        """Pop the best job that fits within the concurrency limits"""
+        best_key = None
+        best_account = None
+        for account_id, queue in pending.items():
+            priority, seq, job = queue[0]
+            if running_per_account.get(account_id, 0) >= self.account_limit:
+                continue
+            if running_per_platform.get(job.source_type, 0) >= self.platform_limit(job.source_type):
+                continue
+            key = (priority, started_per_account[account_id], seq)
+            if best_key is None or key < best_key:
+                best_key = key
+                best_account = account_id
+
+        if best_account is None:
+            return None
+        queue = pending[best_account]
+        _, _, job = queue.pop(0)
+        if not queue:
+            del pending[best_account]
+        return job
+
+    def _execute(self, job: SyncJob, handler: Callable[[DataSource, SyncJob], Any]):
+        job.attempts += 1
+        try:
+            job.result = handler(self._get_source(job), job)
+            job.error = None
+        except Exception as e:
+            job.error = e
+
+    def _get_source(self, job: SyncJob) -> DataSource:
+        """Return a connected source for the job from the source pool"""
+        return self.source_pool.get(job.source_id)
@@ -0,0 +1,111 @@
+from typing import Dict, Any, Callable, Tuple
+import hashlib
+import json
+import threading
+import time
+from .config_manager import ConfigManager
+from .data_source import DataSource
+
+def credential_fingerprint(source_type: str, credentials: Dict[str, Any]) -> str:
+    """Hash identifying a set of credentials, so changed credentials miss the cache"""
+    material = json.dumps({'type': source_type, 'credentials': credentials}, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class ValidationCache:
+    """Remembers which credentials validated successfully, for ``ttl`` seconds.
+
+    Failures are not cached, so fixed credentials are picked up on the next
+    connect. Entries are keyed by credential fingerprint, which changes as
+    soon as any credential does.
+    """
+
+    def __init__(self, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._valid_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def validate(self, source: DataSource) -> bool:
+        """Return whether the source's credentials are valid, calling the API only on a miss"""
+        fingerprint = credential_fingerprint(source.source_type or type(source).__name__,
+                                             source.config.credentials)
+        with self._lock:
+            if self._valid_until.get(fingerprint, 0.0) > self._clock():
+                return True
+        valid = source.validate_credentials()
+        if valid:
+            with self._lock:
+                self._valid_until[fingerprint] = self._clock() + self.ttl
+        return valid
+
+    def invalidate(self, source: DataSource):
+        """Forget the cached result for the source's current credentials"""
+        fingerprint = credential_fingerprint(source.source_type or type(source).__name__,
+                                             source.config.credentials)
+        with self._lock:
+            self._valid_until.pop(fingerprint, None)
+
+    def clear(self):
+        with self._lock:
+            self._valid_until = {}
+
+class SourcePool:
+    """Connected data source instances, reused across fetches by source id.
+
+    A pooled instance is rebuilt when its stored configuration or token
+    changes. Connecting goes through a shared ValidationCache, so recently
+    validated credentials do not cost another round-trip.
+    """
+
+    def __init__(self,
+                 config_manager: ConfigManager,
+                 validation_ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.config_manager = config_manager
+        self.validation_cache = ValidationCache(validation_ttl, clock=clock)
+        self._entries: Dict[str, Tuple[str, DataSource]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, source_id: str) -> DataSource:
+        """Return a connected source, connecting it on first use or after a config change.
+
+        Raises ConnectionError when the source is unknown or fails to connect.
+        """
+        with self._lock:
+            lock = self._locks.setdefault(source_id, threading.Lock())
+        with lock:
+            source_config = self.config_manager.get_resolved_config(source_id)
+            if source_config is None:
+                raise ConnectionError(f"Unknown source: {source_id}")
+            fingerprint = credential_fingerprint(source_config['type'], {
+                'credentials': source_config.get('credentials', {}),
+                'settings': source_config.get('settings', {})
+            })
+
+            entry = self._entries.get(source_id)
+            if entry is not None and entry[0] == fingerprint:
+                return entry[1]
+
+            source = self.config_manager.get_data_source(source_config['type'], source_id)
+            if source is None:
+                raise ConnectionError(f"Unknown source: {source_id}")
+            source.validation_cache = self.validation_cache
+            if not source.connect():
+                self._entries.pop(source_id, None)
+                raise ConnectionError(f"Failed to connect to source: {source_id}")
+            self._entries[source_id] = (fingerprint, source)
+            return source
+
+    def invalidate(self, source_id: str):
+        """Drop the pooled instance and its validation result, e.g. after an auth error"""
+        with self._lock:
+            entry = self._entries.pop(source_id, None)
+        if entry is not None:
+            self.validation_cache.invalidate(entry[1])
+
+    def clear(self):
+        """Drop every pooled instance and cached validation"""
+        with self._lock:
+            self._entries = {}
+        self.validation_cache.clear()
@@ -0,0 +1,269 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+from datetime import datetime
+import copy
+import json
+import os
+import sqlite3
+import threading
+
+class StorageBackend(ABC):
+    """Keyed store of JSON-serializable records, such as source configs or tokens"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the record stored under key, or None"""
+        pass
+
+    @abstractmethod
+    def put(self, key: str, record: Dict[str, Any]):
+        """Insert or replace the record stored under key"""
+        pass
+
+    @abstractmethod
+    def put_many(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Insert or replace several records in one write"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Delete the record stored under key; return whether it existed"""
+        pass
+
+    @abstractmethod
+    def items(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of every record, keyed by record key"""
+        pass
+
+    @abstractmethod
+    def transaction(self):
+        """Context manager grouping reads and writes into one atomic unit"""
+        pass
+
+    def close(self):
+        """Release any resources held by the backend"""
+        pass
+
+class JsonFileBackend(StorageBackend):
+    """Records kept in one JSON file, rewritten atomically on every change.
+
+    With ``section`` set, records live under that top-level key and the other
+    keys of the file are preserved. Inside ``transaction()`` the file is
+    written once, on exit, so bulk changes cost a single rewrite. Suited to
+    small, single-process setups; use SqliteBackend for many sources or
+    concurrent workers.
+    """
+
+    def __init__(self, path: str, section: Optional[str] = None, indent: Optional[int] = None):
+        self.path = path
+        self.section = section
+        self.indent = indent
+        self._document: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self._document = json.load(f)
+
+    def _records(self) -> Dict[str, Any]:
+        if self.section is None:
+            return self._document
+        return self._document.setdefault(self.section, {})
+
+    def _save(self):
+        if self._depth:
+            self._dirty = True
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._document, f, indent=self.indent)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records().get(key)
+            return copy.deepcopy(record) if record is not None else None
+
+    def put(self, key: str, record: Dict[str, Any]):
+        with self._lock:
+            self._records()[key] = copy.deepcopy(record)
+            self._save()
+
+    def put_many(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        with self._lock:
+            stored = self._records()
+            for key, record in records:
+                stored[key] = copy.deepcopy(record)
+            self._save()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            stored = self._records()
+            if key not in stored:
+                return False
+            del stored[key]
+            self._save()
+            return True
+
+    def items(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self._records())
+
+    @contextmanager
+    def transaction(self) -> Iterator['JsonFileBackend']:
+        with self._lock:
+            snapshot = copy.deepcopy(self._document) if not self._depth else None
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                if snapshot is not None:
+                    # Roll back the changes made inside the outermost transaction
+                    self._document = snapshot
+                    self._dirty = False
+                raise
+            finally:
+                self._depth -= 1
+            if not self._depth and self._dirty:
+                self._save()
+
+class SqliteDatabase:
+    """Per-thread connections to one SQLite file, with nestable write transactions.
+
+    The database runs in WAL mode, letting readers proceed while a writer
+    commits, and several processes can share the file. Each thread has one
+    connection per database file, shared by every table on it, so a
+    transaction can span tables. ``transaction()`` takes the write lock up
+    front so read-modify-write sequences are not interleaved with other writers.
+    """
+
+    _local = threading.local()
+    _connections: Dict[str, list] = {}
+    _connections_lock = threading.Lock()
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = os.path.abspath(path)
+        self.timeout = timeout
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+    def _state(self) -> list:
+        """This thread's [connection, transaction depth] for the database file"""
+        states = getattr(self._local, 'states', None)
+        if states is None:
+            states = self._local.states = {}
+        state = states.get(self.path)
+        if state is None or state[0] is None:
+            # isolation_level=None: transactions are opened explicitly in transaction()
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            state = states[self.path] = [connection, 0]
+            with self._connections_lock:
+                self._connections.setdefault(self.path, []).append(state)
+        return state
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._state()[0]
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        state = self._state()
+        connection = state[0]
+        if state[1]:
+            state[1] += 1
+            try:
+                yield connection
+            finally:
+                state[1] -= 1
+            return
+
+        connection.execute('BEGIN IMMEDIATE')
+        state[1] = 1
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+        finally:
+            state[1] = 0
+
+    def close(self):
+        """Close every thread's connection to the database file"""
+        with self._connections_lock:
+            for state in self._connections.pop(self.path, []):
+                state[0].close()
+                state[0] = None
+
+class SqliteBackend(SqliteDatabase, StorageBackend):
+    """Records kept in an indexed SQLite table, one row per key.
+
+    Writes are row-level upserts, so changing one source does not rewrite the
+    others. Connections and transactions are shared with every other table
+    on the same file (see SqliteDatabase).
+    """
+
+    def __init__(self, path: str, table: str, timeout: float = 30.0):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        super().__init__(path, timeout)
+        self.table = table
+        with self.transaction() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at TEXT NOT NULL)"
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_updated_at ON {table} (updated_at)"
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, record: Dict[str, Any]):
+        self.put_many([(key, record)])
+
+    def put_many(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        updated_at = datetime.now().isoformat()
+        rows = [(key, json.dumps(record), updated_at) for key, record in records]
+        with self.transaction() as connection:
+            connection.executemany(
+                f"INSERT INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                rows
+            )
+
+    def delete(self, key: str) -> bool:
+        with self.transaction() as connection:
+            cursor = connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            return cursor.rowcount > 0
+
+    def items(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._connection().execute(f"SELECT key, value FROM {self.table} ORDER BY key")
+        return {key: json.loads(value) for key, value in rows}
+
+STORAGE_BACKENDS = ('json', 'sqlite')
+
+def create_backend(storage: str, directory: str, table: str, json_path: str,
+                   section: Optional[str] = None, indent: Optional[int] = None) -> StorageBackend:
+    """Create the backend for one table: a JSON file, or a table in ``datahub.db``"""
+    if storage == 'json':
+        return JsonFileBackend(json_path, section=section, indent=indent)
+    if storage == 'sqlite':
+        return SqliteBackend(os.path.join(directory, 'datahub.db'), table)
+    raise ValueError(f"Unknown storage backend: {storage}")
@@ -0,0 +1,47 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from .storage import StorageBackend, JsonFileBackend
+
+WATERMARK_FORMAT = '%Y-%m-%d'
+
+def metric_set_key(metrics: List[str], dimensions: List[str]) -> str:
+    """Build the key identifying a set of metrics and dimensions, independent of order"""
+    return ','.join(sorted(metrics)) + '|' + ','.join(sorted(dimensions))
+
+class SyncStateManager:
+    """Manages incremental sync watermarks for data sources.
+
+    Watermarks are kept in a storage backend, one record per source mapping
+    metric sets to their watermark; by default the JSON file at
+    ``storage_path``.
+    """
+    
+    def __init__(self, storage_path: str, backend: Optional[StorageBackend] = None):
+        self.storage_path = storage_path
+        self.backend = backend or JsonFileBackend(storage_path, indent=2)
+    
+    @property
+    def state(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Every stored watermark, keyed by source id and metric set"""
+        return self.backend.items()
+    
+    def get_watermark(self, source_id: str, metric_set: str) -> Optional[datetime]:
+        """Get the last fully synced date for a source and metric set"""
+        entry = (self.backend.get(source_id) or {}).get(metric_set)
+        if not entry:
+            return None
+        return datetime.strptime(entry['watermark'], WATERMARK_FORMAT)
+    
+    def set_watermark(self, source_id: str, metric_set: str, watermark: datetime):
+        """Store the last fully synced date for a source and metric set"""
+        with self.backend.transaction():
+            record = self.backend.get(source_id) or {}
+            record[metric_set] = {
+                'watermark': watermark.strftime(WATERMARK_FORMAT),
+                'updated_at': datetime.now().isoformat()
+            }
+            self.backend.put(source_id, record)
+    
+    def remove_source(self, source_id: str):
+        """Remove all watermarks of a data source"""
+        self.backend.delete(source_id)
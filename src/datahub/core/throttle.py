@@ -0,0 +1,206 @@
+from typing import Dict, Any, Callable, Optional
+import json
+import re
+import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate can be changed while in use"""
+
+    def __init__(self,
+                 rate: float,
+                 capacity: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        # While blocked, _updated lies in the future and no tokens accrue
+        if now > self._updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens, sleeping until they are available; return the time waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.tokens >= tokens - 1e-9:
+                    self.tokens = max(0.0, self.tokens - tokens)
+                    return waited
+                else:
+                    delay = (tokens - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = rate
+
+    def block_for(self, seconds: float):
+        """Refuse all tokens for the given number of seconds"""
+        with self._lock:
+            now = self._clock()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = 0.0
+            self._updated = self.blocked_until
+
+def usage_percent(usage: Dict[str, Any]) -> float:
+    """Highest utilisation percentage in a Graph API usage object"""
+    values = [
+        usage.get(key) or 0
+        for key in ('call_count', 'total_time', 'total_cputime', 'acc_id_util_pct')
+    ]
+    return float(max(values))
+
+def _header_json(headers: Any, name: str) -> Optional[Any]:
+    value = headers.get(name) if headers is not None else None
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+def parse_facebook_usage(headers: Any) -> Dict[str, Any]:
+    """Extract app and ad-account usage from Graph API response headers.
+
+    Returns ``app_pct`` from X-App-Usage, and ``account_pct`` plus
+    ``regain_seconds`` from X-Business-Use-Case-Usage and X-Ad-Account-Usage.
+    """
+    usage = {}
+    app_usage = _header_json(headers, 'X-App-Usage')
+    if isinstance(app_usage, dict):
+        usage['app_pct'] = usage_percent(app_usage)
+
+    account_pct = None
+    regain_minutes = 0
+    business_usage = _header_json(headers, 'X-Business-Use-Case-Usage')
+    if isinstance(business_usage, dict):
+        for entries in business_usage.values():
+            for entry in entries if isinstance(entries, list) else [entries]:
+                account_pct = max(account_pct or 0, usage_percent(entry))
+                regain_minutes = max(regain_minutes, entry.get('estimated_time_to_regain_access') or 0)
+    account_usage = _header_json(headers, 'X-Ad-Account-Usage')
+    if isinstance(account_usage, dict):
+        account_pct = max(account_pct or 0, usage_percent(account_usage))
+        regain_minutes = max(regain_minutes, (account_usage.get('reset_time_duration') or 0) / 60)
+
+    if account_pct is not None:
+        usage['account_pct'] = account_pct
+    if regain_minutes:
+        usage['regain_seconds'] = regain_minutes * 60
+    return usage
+
+def parse_duration(value: Any) -> Optional[float]:
+    """Parse a protobuf duration ('30s', '1.5s') or a plain number of seconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.fullmatch(r'\s*([0-9.]+)s?\s*', value)
+        if match:
+            return float(match.group(1))
+    return None
+
+def parse_google_retry_delay(error_body: Any) -> Optional[float]:
+    """Find the quotaErrorDetails retryDelay in a Google Ads error response"""
+    if not isinstance(error_body, dict):
+        return None
+    delays = []
+    for detail in error_body.get('error', {}).get('details', []):
+        for error in detail.get('errors', []):
+            quota_details = error.get('details', {}).get('quotaErrorDetails', {})
+            delay = parse_duration(quota_details.get('retryDelay'))
+            if delay is not None:
+                delays.append(delay)
+    return max(delays) if delays else None
+
+class RateLimiter:
+    """Token buckets per app and per ad account, adapted to platform usage.
+
+    Every request takes a token from its app bucket and its account bucket.
+    Once reported usage passes ``slowdown_pct``, the bucket's rate shrinks in
+    proportion to the headroom left, down to ``min_rate_fraction`` of the base
+    rate, so requests slow down before the platform starts rejecting them.
+    A rate-limit response or a regain-access estimate blocks the bucket.
+    """
+
+    _shared: Dict[tuple, 'RateLimiter'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 account_rate: float = 10.0,
+                 app_rate: float = 100.0,
+                 burst: float = 10.0,
+                 slowdown_pct: float = 75.0,
+                 min_rate_fraction: float = 0.05,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.account_rate = account_rate
+        self.app_rate = app_rate
+        self.burst = burst
+        self.slowdown_pct = slowdown_pct
+        self.min_rate_fraction = min_rate_fraction
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, platform: str, settings: Dict[str, Any]) -> 'RateLimiter':
+        """Return the limiter shared by sources of a platform with the same throttle settings"""
+        options = {}
+        for key, argument in (('throttle_account_rate', 'account_rate'),
+                              ('throttle_app_rate', 'app_rate'),
+                              ('throttle_burst', 'burst'),
+                              ('throttle_slowdown_pct', 'slowdown_pct')):
+            if key in settings:
+                options[argument] = settings[key]
+        key = (platform,) + tuple(sorted(options.items()))
+        with cls._shared_lock:
+            limiter = cls._shared.get(key)
+            if limiter is None:
+                limiter = cls(**options)
+                cls._shared[key] = limiter
+            return limiter
+
+    def bucket(self, scope: str, key: str) -> TokenBucket:
+        """Return the bucket for ('app' or 'account', key), creating it on first use"""
+        with self._lock:
+            bucket = self._buckets.get((scope, key))
+            if bucket is None:
+                rate = self.app_rate if scope == 'app' else self.account_rate
+                bucket = TokenBucket(rate, self.burst, clock=self._clock, sleep=self._sleep)
+                self._buckets[(scope, key)] = bucket
+            return bucket
+
+    def acquire(self, app_id: str, account_id: str) -> float:
+        """Wait for a request slot for the app and the account; return the time waited"""
+        return (self.bucket('app', app_id).acquire()
+                + self.bucket('account', account_id).acquire())
+
+    def observe_usage(self, scope: str, key: str, percent: float):
+        """Adapt a bucket's rate to the platform-reported usage percentage"""
+        base_rate = self.app_rate if scope == 'app' else self.account_rate
+        if percent <= self.slowdown_pct:
+            rate = base_rate
+        else:
+            headroom = max(0.0, 100.0 - percent) / (100.0 - self.slowdown_pct)
+            rate = base_rate * max(self.min_rate_fraction, headroom)
+        self.bucket(scope, key).set_rate(rate)
+
+    def pause(self, scope: str, key: str, seconds: float):
+        """Block a bucket, e.g. after a rate-limit response"""
+        self.bucket(scope, key).block_for(seconds)
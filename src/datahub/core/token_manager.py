@@ -1,40 +1,28 @@
 from typing import Dict, Any, Optional
 from datetime import datetime
-import json
-import os
+from .storage import StorageBackend, JsonFileBackend
 
 class TokenManager:
     """Manages authentication tokens for different data sources"""
-    
-    def __init__(self, storage_path: str):
+
+    def __init__(self, storage_path: str, backend: Optional[StorageBackend] = None):
         self.storage_path = storage_path
-        self.tokens: Dict[str, Dict[str, Any]] = {}
-        self._load_tokens()
-    
-    def _load_tokens(self):
-        """Load tokens from storage"""
-        if os.path.exists(self.storage_path):
-            with open(self.storage_path, 'r') as f:
-                self.tokens = json.load(f)
-    
-    def _save_tokens(self):
-        """Save tokens to storage"""
-        os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
-        with open(self.storage_path, 'w') as f:
-            json.dump(self.tokens, f)
-    
+        self.backend = backend or JsonFileBackend(storage_path)
+
+    @property
+    def tokens(self) -> Dict[str, Dict[str, Any]]:
+        """All stored tokens, keyed by source id"""
+        return self.backend.items()
+
     def get_token(self, source_id: str) -> Optional[Dict[str, Any]]:
         """Get token for a specific data source"""
-        return self.tokens.get(source_id)
-    
+        return self.backend.get(source_id)
+
     def store_token(self, source_id: str, token_data: Dict[str, Any]):
         """Store token for a specific data source"""
         token_data['updated_at'] = datetime.now().isoformat()
-        self.tokens[source_id] = token_data
-        self._save_tokens()
-    
+        self.backend.put(source_id, token_data)
+
     def remove_token(self, source_id: str):
         """Remove token for a specific data source"""
-        if source_id in self.tokens:
-            del self.tokens[source_id]
-            self._save_tokens()
+        self.backend.delete(source_id)
@@ -0,0 +1,107 @@
+from typing import Dict, Any, Iterable, Optional
+import threading
+
+# 429 is left to the sources' throttles, which know the platform's retry hints
+DEFAULT_RETRY_STATUSES = (500, 502, 503, 504)
+DEFAULT_RETRY_METHODS = ('GET', 'POST')
+
+# Settings keys read by HttpTransport.from_settings, mapped to constructor arguments
+TRANSPORT_SETTINGS = {
+    'http_pool_connections': 'pool_connections',
+    'http_pool_size': 'pool_maxsize',
+    'http_max_retries': 'max_retries',
+    'http_backoff_factor': 'backoff_factor',
+    'http_retry_statuses': 'retry_statuses',
+    'http_retry_methods': 'retry_methods',
+    'http_timeout': 'timeout',
+}
+
+class HttpTransport:
+    """Pooled keep-alive HTTP transport shared by data sources.
+
+    requests is imported when the first transport is built, not when this
+    module is imported, so loading DataHub stays cheap for short-lived workers.
+    """
+
+    _shared: Dict[tuple, 'HttpTransport'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
+                 max_retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 retry_statuses: Iterable[int] = DEFAULT_RETRY_STATUSES,
+                 retry_methods: Iterable[str] = DEFAULT_RETRY_METHODS,
+                 timeout: Optional[float] = 60):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.timeout = timeout
+        self.session = requests.Session()
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=tuple(retry_statuses),
+            allowed_methods=frozenset(method.upper() for method in retry_methods),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        # One connection pool per host, each holding up to pool_maxsize keep-alive connections
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> 'HttpTransport':
+        """Return the shared transport for the HTTP options in a source's settings.
+
+        Sources configured with the same options share one transport, and with
+        it one set of connection pools.
+        """
+        options = {
+            argument: settings[key]
+            for key, argument in TRANSPORT_SETTINGS.items()
+            if key in settings
+        }
+        key = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in options.items()
+        ))
+        with cls._shared_lock:
+            transport = cls._shared.get(key)
+            if transport is None:
+                transport = cls(**options)
+                cls._shared[key] = transport
+            return transport
+
+    @classmethod
+    def close_shared(cls):
+        """Close and forget all shared transports"""
+        with cls._shared_lock:
+            for transport in cls._shared.values():
+                transport.close()
+            cls._shared = {}
+
+    def request(self, method: str, url: str, **kwargs) -> 'requests.Response':
+        """Send a request through the pooled session"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> 'requests.Response':
+        """Send a GET request"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> 'requests.Response':
+        """Send a POST request"""
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
@@ -0,0 +1,20 @@
+"""
+Sinks that write fetched pages to partitioned files on disk
+"""
+from .base import Sink
+from .jsonl_sink import JsonLinesSink
+from .csv_sink import CsvSink
+
+SINK_FORMATS = ('jsonl', 'csv', 'parquet')
+
+def create_sink(format: str, root: str, **options) -> Sink:
+    """Create a sink for 'jsonl', 'csv' or 'parquet' output under root"""
+    if format == 'jsonl':
+        return JsonLinesSink(root, **options)
+    if format == 'csv':
+        return CsvSink(root, **options)
+    if format == 'parquet':
+        # Imported here so that pyarrow is only needed for Parquet output
+        from .parquet_sink import ParquetSink
+        return ParquetSink(root, **options)
+    raise ValueError(f"Unknown sink format: {format}")
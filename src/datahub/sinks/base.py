@@ -0,0 +1,222 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from datetime import date, datetime
+from decimal import Decimal
+import os
+import re
+import threading
+import uuid
+
+# Row fields that hold the reporting day, tried in order when partitioning
+DATE_FIELDS = ('date', 'date_start', 'segments.date')
+UNKNOWN_PARTITION = 'unknown'
+
+def encode_value(value: Any) -> Any:
+    """JSON fallback for values fetched rows may hold"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _partition_value(value: Any) -> str:
+    """Make a value safe to use as a directory name"""
+    text = str(value)[:10] if isinstance(value, (datetime, date)) else str(value)
+    return re.sub(r'[^A-Za-z0-9._-]', '_', text) or UNKNOWN_PARTITION
+
+class _PartFile:
+    """One output file being written: a hidden temp path until committed"""
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        self.tmp_path = os.path.join(directory, f".{name}.tmp")
+        self.handle = None
+        self.rows = 0
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.name)
+
+class Sink(ABC):
+    """Writes fetched pages to files partitioned by source and reporting day.
+
+    Files land under ``root/source=<source>/date=<YYYY-MM-DD>/`` as
+    ``part-<run>-<n><extension>``. Rows are buffered per partition and flushed
+    every ``chunk_rows`` rows, and at most ``max_buffered_rows`` rows are held
+    across all partitions, so memory stays bounded however large the export.
+    At most ``max_open_files`` files are open at once; a partition written to
+    again after its file was closed continues in a new part file.
+    Files are written under hidden temporary names and renamed into place
+    by ``close()``; ``abort()`` (or leaving a ``with`` block on an error)
+    deletes them, so readers never see a partial export. Sinks are
+    thread-safe and can be shared by several sources.
+    """
+
+    extension = ''
+
+    def __init__(self,
+                 root: str,
+                 chunk_rows: int = 10000,
+                 max_buffered_rows: int = 100000,
+                 max_rows_per_file: Optional[int] = None,
+                 max_open_files: int = 64,
+                 partition_field: Optional[str] = None):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.max_buffered_rows = max(max_buffered_rows, chunk_rows)
+        self.max_rows_per_file = max_rows_per_file
+        self.max_open_files = max(1, max_open_files)
+        self.partition_field = partition_field
+        self.run_id = uuid.uuid4().hex[:12]
+        self.rows_written = 0
+        self.committed_files: List[str] = []
+        self._buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._buffered_rows = 0
+        self._open_files: Dict[Tuple[str, str], _PartFile] = {}
+        self._pending_files: List[_PartFile] = []
+        self._sequence = 0
+        self._closed = False
+        self._lock = threading.RLock()
+
+    def __enter__(self) -> 'Sink':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _partition_of(self, row: Dict[str, Any]) -> str:
+        if self.partition_field is not None:
+            value = row.get(self.partition_field)
+        else:
+            value = next((row[field] for field in DATE_FIELDS if row.get(field) is not None), None)
+        return UNKNOWN_PARTITION if value is None else _partition_value(value)
+
+    def write_page(self, rows: List[Dict[str, Any]], source: str):
+        """Buffer one page of rows from a source, flushing full partitions"""
+        with self._lock:
+            if self._closed:
+                raise ValueError("Sink is already closed")
+            source = _partition_value(source)
+            for row in rows:
+                key = (source, self._partition_of(row))
+                buffer = self._buffers.setdefault(key, [])
+                buffer.append(row)
+                self._buffered_rows += 1
+                if len(buffer) >= self.chunk_rows:
+                    self._flush(key)
+            while self._buffered_rows > self.max_buffered_rows:
+                largest = max(self._buffers, key=lambda key: len(self._buffers[key]))
+                self._flush(largest)
+
+    def write_pages(self, pages: Iterable[List[Dict[str, Any]]], source: str) -> int:
+        """Write every page of an iterator; return the number of rows written"""
+        written = 0
+        for page in pages:
+            self.write_page(page, source)
+            written += len(page)
+        return written
+
+    def flush(self):
+        """Write out every buffered row; files stay uncommitted until close()"""
+        with self._lock:
+            for key in list(self._buffers):
+                self._flush(key)
+
+    def close(self) -> List[str]:
+        """Flush, then atomically rename every written file into place; return their paths"""
+        with self._lock:
+            if self._closed:
+                return self.committed_files
+            self.flush()
+            for key in list(self._open_files):
+                self._finish(key)
+            for part in self._pending_files:
+                os.replace(part.tmp_path, part.path)
+                self.committed_files.append(part.path)
+            self._pending_files = []
+            self._closed = True
+            return self.committed_files
+
+    def abort(self):
+        """Discard buffered rows and delete every uncommitted file"""
+        with self._lock:
+            self._buffers = {}
+            self._buffered_rows = 0
+            for key in list(self._open_files):
+                self._finish(key)
+            for part in self._pending_files:
+                try:
+                    os.remove(part.tmp_path)
+                except OSError:
+                    pass
+            self._pending_files = []
+            self._closed = True
+
+    def _flush(self, key: Tuple[str, str]):
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        self._buffered_rows -= len(rows)
+        while rows:
+            part = self._open_files.pop(key, None)
+            if part is None:
+                part = self._open_part(key)
+            # Keep _open_files ordered from least to most recently used
+            self._open_files[key] = part
+            chunk = rows
+            if self.max_rows_per_file is not None:
+                chunk = rows[:self.max_rows_per_file - part.rows]
+            if not self._write(part.handle, chunk):
+                # The format cannot append these rows to the current file
+                self._finish(key)
+                part = self._open_part(key)
+                self._write(part.handle, chunk)
+            part.rows += len(chunk)
+            self.rows_written += len(chunk)
+            rows = rows[len(chunk):]
+            if self.max_rows_per_file is not None and part.rows >= self.max_rows_per_file:
+                self._finish(key)
+
+    def _open_part(self, key: Tuple[str, str]) -> _PartFile:
+        while len(self._open_files) >= self.max_open_files:
+            self._finish(next(iter(self._open_files)))
+        source, day = key
+        directory = os.path.join(self.root, f"source={source}", f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        self._sequence += 1
+        name = f"part-{self.run_id}-{self._sequence:05d}{self.extension}"
+        part = _PartFile(directory, name)
+        part.handle = self._open(part.tmp_path)
+        self._open_files[key] = part
+        self._pending_files.append(part)
+        return part
+
+    def _finish(self, key: Tuple[str, str]):
+        part = self._open_files.pop(key)
+        self._close(part.handle)
+        if part.rows == 0:
+            # Nothing was written: drop the part rather than commit an empty file
+            self._pending_files.remove(part)
+            try:
+                os.remove(part.tmp_path)
+            except OSError:
+                pass
+
+    @abstractmethod
+    def _open(self, path: str) -> Any:
+        """Open a new file at path and return a handle"""
+        pass
+
+    @abstractmethod
+    def _write(self, handle: Any, rows: List[Dict[str, Any]]) -> bool:
+        """Append rows to an open file; return False when a new file is needed instead"""
+        pass
+
+    @abstractmethod
+    def _close(self, handle: Any):
+        """Finish writing a file"""
+        pass
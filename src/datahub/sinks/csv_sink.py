@@ -0,0 +1,51 @@
+from typing import Dict, Any, List, Optional
+import csv
+import gzip
+from .base import Sink
+
+class _CsvFile:
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = None
+        self.fieldnames: Optional[List[str]] = None
+
+class CsvSink(Sink):
+    """CSV with a header row, optionally gzip-compressed.
+
+    The first chunk written to a file fixes its columns; a chunk that brings
+    new fields starts a new part file with a wider header.
+    """
+
+    def __init__(self, root: str, compression: Optional[str] = None, compresslevel: int = 6, **options):
+        if compression not in (None, 'gzip'):
+            raise ValueError(f"Unsupported CSV compression: {compression}")
+        super().__init__(root, **options)
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.extension = '.csv.gz' if compression == 'gzip' else '.csv'
+
+    def _open(self, path: str) -> _CsvFile:
+        if self.compression == 'gzip':
+            stream = gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=self.compresslevel)
+        else:
+            stream = open(path, 'w', encoding='utf-8', newline='')
+        return _CsvFile(stream)
+
+    def _write(self, handle: _CsvFile, rows: List[Dict[str, Any]]) -> bool:
+        fields: Dict[str, None] = {}
+        for row in rows:
+            for key in row:
+                if key not in fields:
+                    fields[key] = None
+
+        if handle.writer is None:
+            handle.fieldnames = list(fields)
+            handle.writer = csv.DictWriter(handle.stream, fieldnames=handle.fieldnames)
+            handle.writer.writeheader()
+        elif not set(fields) <= set(handle.fieldnames):
+            return False
+        handle.writer.writerows(rows)
+        return True
+
+    def _close(self, handle: _CsvFile):
+        handle.stream.close()
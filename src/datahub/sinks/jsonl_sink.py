@@ -0,0 +1,27 @@
+from typing import Dict, Any, List, Optional
+import gzip
+import json
+from .base import Sink, encode_value
+
+class JsonLinesSink(Sink):
+    """One JSON object per line, gzip-compressed by default"""
+
+    def __init__(self, root: str, compression: Optional[str] = 'gzip', compresslevel: int = 6, **options):
+        if compression not in (None, 'gzip'):
+            raise ValueError(f"Unsupported JSONL compression: {compression}")
+        super().__init__(root, **options)
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.extension = '.jsonl.gz' if compression == 'gzip' else '.jsonl'
+
+    def _open(self, path: str):
+        if self.compression == 'gzip':
+            return gzip.open(path, 'wt', encoding='utf-8', compresslevel=self.compresslevel)
+        return open(path, 'w', encoding='utf-8')
+
+    def _write(self, handle, rows: List[Dict[str, Any]]) -> bool:
+        handle.write(''.join(json.dumps(row, default=encode_value) + '\n' for row in rows))
+        return True
+
+    def _close(self, handle):
+        handle.close()
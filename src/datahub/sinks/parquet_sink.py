@@ -0,0 +1,66 @@
+from typing import Dict, Any, Iterable, List
+from ..core.columnar import ColumnarBatch
+from .base import Sink
+
+class _ParquetFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = None
+        self.schema = None
+
+class ParquetSink(Sink):
+    """Parquet files written one row group per flushed chunk; requires pyarrow.
+
+    Column types are inferred from the first chunk of each file, with
+    ``dimensions`` always stored as (dictionary-encoded) strings. A later
+    chunk whose columns cannot be cast to that schema starts a new part file.
+    """
+
+    extension = '.parquet'
+
+    def __init__(self,
+                 root: str,
+                 row_group_size: int = 65536,
+                 compression: str = 'snappy',
+                 dimensions: Iterable[str] = (),
+                 **options):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow is required for ParquetSink; install datahub[columnar]")
+        options.setdefault('chunk_rows', row_group_size)
+        options.setdefault('max_buffered_rows', max(100000, options['chunk_rows']))
+        super().__init__(root, **options)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.dimensions = list(dimensions)
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+
+    def _open(self, path: str) -> _ParquetFile:
+        return _ParquetFile(path)
+
+    def _write(self, handle: _ParquetFile, rows: List[Dict[str, Any]]) -> bool:
+        pa = self._pa
+        if handle.writer is None:
+            table = ColumnarBatch.from_rows(rows, dimensions=self.dimensions).to_arrow()
+            handle.schema = table.schema
+            handle.writer = self._pq.ParquetWriter(handle.path, table.schema, compression=self.compression)
+        else:
+            schema = handle.schema
+            if any(key not in schema.names for row in rows for key in row):
+                return False
+            table = ColumnarBatch.from_rows(rows, fields=schema.names, dimensions=self.dimensions).to_arrow()
+            if not table.schema.equals(schema):
+                try:
+                    table = table.cast(schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                    return False
+        handle.writer.write_table(table, row_group_size=self.row_group_size)
+        return True
+
+    def _close(self, handle: _ParquetFile):
+        # A file never written to was never created; the sink drops its part
+        if handle.writer is not None:
+            handle.writer.close()
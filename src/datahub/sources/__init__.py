@@ -0,0 +1,3 @@
+"""
+Data source implementations, loaded on demand by DataSourceFactory
+"""
@@ -1,21 +1,74 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+from collections import deque
 from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+import json
+import re
+import time
 from ..core.data_source import DataSource, DataSourceConfig
-import requests
+from ..core.transport import HttpTransport
+from ..core.throttle import parse_facebook_usage
+
+# Minimum date span (in days) per level at which 'auto' mode submits an async
+# report job; levels not listed always use synchronous pagination
+ASYNC_MIN_DAYS = {
+    'ad': 14,
+    'adset': 31,
+    'campaign': 90,
+}
+
+# Graph API error codes signalling app, user or ad-account rate limiting
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+RATE_LIMIT_STATUSES = (400, 403, 429)
+
+# The Graph API batch endpoint accepts at most this many sub-requests per call
+BATCH_MAX_REQUESTS = 50
+
+_VERSION_PREFIX = re.compile(r'^v\d+(\.\d+)?/')
+
+ASYNC_COMPLETED = 'Job Completed'
+ASYNC_FAILED = ('Job Failed', 'Job Skipped')
 
 class FacebookAdsSource(DataSource):
     """Facebook Ads data source implementation"""
     
-    def __init__(self, config: DataSourceConfig):
-        self.config = config
-        self.base_url = "https://graph.facebook.com/v12.0"
+    source_type = 'facebook_ads'
+    date_field = 'date_start'
+    date_end_field = 'date_stop'
+    
+    # Reporting level -> field identifying a row at that level
+    LEVEL_ID_FIELDS = {
+        'account': 'account_id',
+        'campaign': 'campaign_id',
+        'adset': 'adset_id',
+        'ad': 'ad_id',
+    }
+    
+    # Canonical field -> source field, used by SchemaNormalizer
+    schema_mapping = {
+        'date': 'date_start',
+        'account_id': 'account_id',
+        'campaign_id': 'campaign_id',
+        'campaign_name': 'campaign_name',
+        'ad_group_id': 'adset_id',
+        'ad_group_name': 'adset_name',
+        'ad_id': 'ad_id',
+        'ad_name': 'ad_name',
+        'impressions': 'impressions',
+        'clicks': 'clicks',
+        'cost': 'spend',
+    }
+    
+    def __init__(self, config: DataSourceConfig, transport: HttpTransport = None):
+        super().__init__(config, transport)
+        self.base_url = config.settings.get('base_url', "https://graph.facebook.com/v12.0")
         self.token = None
     
     def connect(self) -> bool:
         """Establish connection to Facebook Ads API"""
         try:
             self.token = self.config.credentials.get('access_token')
-            return self.validate_credentials()
+            return self._check_credentials()
         except Exception as e:
             print(f"Failed to connect to Facebook Ads API: {str(e)}")
             return False
@@ -29,7 +82,7 @@ class FacebookAdsSource(DataSource):
             headers = {
                 'Authorization': f'Bearer {self.token}'
             }
-            response = requests.get(
+            response = self._get(
                 f"{self.base_url}/me",
                 headers=headers
             )
@@ -47,43 +100,371 @@ class FacebookAdsSource(DataSource):
             raise ValueError("Not connected to Facebook Ads API")
         
         try:
-            headers = {
-                'Authorization': f'Bearer {self.token}'
-            }
+            return list(self.iter_rows(start_date, end_date, metrics, dimensions))
+        except Exception as e:
+            print(f"Failed to fetch data from Facebook Ads API: {str(e)}")
+            return []
+    
+    def _iter_api_pages(self,
+                        start_date: datetime,
+                        end_date: datetime,
+                        metrics: List[str],
+                        dimensions: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        """Yield insight pages as they arrive, raising on failure"""
+        if not self.token:
+            raise ValueError("Not connected to Facebook Ads API")
+        
+        headers = {
+            'Authorization': f'Bearer {self.token}'
+        }
+        
+        account_ids = self._account_ids()
+        level = self.config.settings.get('level', 'ad')
+        use_async = self._use_async_report(start_date, end_date, level)
+        
+        if len(account_ids) > 1 and not use_async:
+            for _, _, rows in self.iter_account_pages(
+                    start_date, end_date, metrics, dimensions, account_ids=account_ids):
+                yield rows
+            return
+        
+        params = self._insights_params(start_date, end_date, metrics, dimensions, level)
+        # An interrupted pull continues with the account, report job and page it reached
+        resume = self._resume_cursor() or {}
+        first_index = resume.get('account_index', 0)
+        for index, account_id in enumerate(account_ids):
+            if index < first_index:
+                continue
+            account_resume = resume if index == first_index else {}
+            cursor = {'account_index': index}
+            if use_async:
+                report_run_id = account_resume.get('report_run_id')
+                if report_run_id is None:
+                    report_run_id = self._submit_async_report(account_id, headers, params)
+                    self._save_cursor({'account_index': index, 'report_run_id': report_run_id})
+                self._wait_for_async_report(report_run_id, headers)
+                cursor['report_run_id'] = report_run_id
+                pages = self._iter_insight_pages(
+                    f"{self.base_url}/{report_run_id}/insights", headers, None, cursor, account_resume
+                )
+            else:
+                pages = self._iter_insight_pages(
+                    f"{self.base_url}/{account_id}/insights", headers, params, cursor, account_resume
+                )
+            if len(account_ids) > 1:
+                pages = (self._tag_account(rows, account_id) for rows in pages)
+            yield from pages
+    
+    def iter_account_pages(self,
+                           start_date: datetime,
+                           end_date: datetime,
+                           metrics: List[str],
+                           dimensions: List[str],
+                           account_ids: Optional[Sequence[str]] = None,
+                           levels: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, str, List[Dict[str, Any]]]]:
+        """Fetch insights for many accounts and levels through Graph API batch calls.
+
+        Each (account, level) pair is one sub-request; up to ``batch_size``
+        (at most 50) of them share a single HTTP call, and every sub-response
+        is paginated on its own, its next page joining a later batch. Yields
+        ``(account_id, level, rows)`` for each page, in completion order.
+        Rows lacking ``account_id`` are tagged with the requested account.
+        """
+        if not self.token:
+            raise ValueError("Not connected to Facebook Ads API")
+        
+        account_ids = list(account_ids or self._account_ids())
+        levels = list(levels or [self.config.settings.get('level', 'ad')])
+        headers = {
+            'Authorization': f'Bearer {self.token}'
+        }
+        sub_requests = {}
+        for account_id in account_ids:
+            for level in levels:
+                params = self._insights_params(start_date, end_date, metrics, dimensions, level)
+                sub_requests[(account_id, level)] = f"{account_id}/insights?{urlencode(params)}"
+        
+        for (account_id, level), rows in self._iter_batched_pages(sub_requests, headers):
+            yield account_id, level, self._tag_account(rows, account_id)
+    
+    def _insights_params(self, start_date: datetime, end_date: datetime,
+                         metrics: List[str], dimensions: List[str], level: str) -> Dict[str, Any]:
+        params = {
+            'time_range': json.dumps({
+                'start_date': start_date.strftime('%Y-%m-%d'),
+                'end_date': end_date.strftime('%Y-%m-%d')
+            }),
+            'fields': ','.join(metrics + dimensions),
+            'level': level
+        }
+        time_increment = self.config.settings.get('time_increment')
+        if time_increment is not None:
+            # 1 returns one row per day; otherwise rows aggregate the whole range
+            params['time_increment'] = time_increment
+        return params
+    
+    def _account_ids(self) -> List[str]:
+        """Accounts to report on: the ``ad_account_ids`` list, else ``ad_account_id``"""
+        account_ids = self.config.credentials.get('ad_account_ids')
+        if account_ids:
+            return list(account_ids)
+        return [self.config.credentials.get('ad_account_id')]
+    
+    @staticmethod
+    def _tag_account(rows: List[Dict[str, Any]], account_id: str) -> List[Dict[str, Any]]:
+        for row in rows:
+            if 'account_id' not in row:
+                row['account_id'] = account_id
+        return rows
+    
+    def _relative_url(self, url: str) -> str:
+        """Turn an absolute paging.next URL into a batch relative_url"""
+        base = self.base_url.rstrip('/') + '/'
+        if url.startswith(base):
+            return url[len(base):]
+        parts = urlsplit(url)
+        path = _VERSION_PREFIX.sub('', parts.path.lstrip('/'))
+        return f"{path}?{parts.query}" if parts.query else path
+    
+    def _iter_batched_pages(self, sub_requests: Dict[Any, str],
+                            headers: Dict[str, str]) -> Iterator[Tuple[Any, List[Dict[str, Any]]]]:
+        """Run GET relative_urls through the batch endpoint, following each one's pagination.
+
+        A sub-request that is rate limited or times out (a null or missing
+        entry) is retried in a later batch, up to ``throttle_max_retries`` times; any
+        other failed sub-request raises.
+        """
+        settings = self.config.settings
+        batch_size = max(1, min(BATCH_MAX_REQUESTS, settings.get('batch_size', BATCH_MAX_REQUESTS)))
+        max_retries = settings.get('throttle_max_retries', 3)
+        hooks = self.hooks
+        labels = self._metric_labels()
+        pending = deque(sub_requests.items())
+        attempts: Dict[Any, int] = {}
+        
+        while pending:
+            chunk = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            for key, _ in chunk:
+                # Sub-requests count against their own account's limits
+                waited = self.throttle.bucket('account', self._batch_account(key)).acquire()
+                if waited:
+                    hooks.throttle(labels, 'wait', waited)
+            
+            response = self._post(
+                self.base_url.rstrip('/') + '/',
+                headers=headers,
+                data={
+                    'batch': json.dumps([
+                        {'method': 'GET', 'relative_url': relative_url} for _, relative_url in chunk
+                    ]),
+                    'include_headers': 'false'
+                }
+            )
+            response.raise_for_status()
+            results = list(self._decode_json(response) or [])
+            # Entries missing from a short reply are retried like timed-out ones
+            results += [None] * (len(chunk) - len(results))
             
-            account_id = self.config.credentials.get('ad_account_id')
+            for (key, relative_url), result in zip(chunk, results):
+                body = self._batch_body(result)
+                if result is not None and result.get('code') == 200:
+                    yield key, self._process_response(body)
+                    next_page = body.get('paging', {}).get('next')
+                    if next_page:
+                        pending.append((key, self._relative_url(next_page)))
+                    continue
+                
+                status = result.get('code') if result is not None else None
+                error = body.get('error', {})
+                rate_limited = status == 429 or (
+                    status in RATE_LIMIT_STATUSES and error.get('code') in RATE_LIMIT_ERROR_CODES
+                )
+                if result is not None and not rate_limited:
+                    raise RuntimeError(
+                        f"Batched insights request {relative_url} failed with status {status}: "
+                        f"{error.get('message', body)}"
+                    )
+                attempts[key] = attempts.get(key, 0) + 1
+                if attempts[key] > max_retries:
+                    raise RuntimeError(f"Batched insights request {relative_url} still failing "
+                                       f"after {max_retries} retries")
+                if rate_limited:
+                    delay = settings.get('throttle_pause', 60.0)
+                    self.throttle.pause('account', self._batch_account(key), delay)
+                    hooks.throttle(labels, 'pause', delay)
+                hooks.retry(labels, 'rate_limit' if rate_limited else 'batch_timeout', attempts[key])
+                pending.append((key, relative_url))
+    
+    @staticmethod
+    def _batch_account(key: Any) -> str:
+        return key[0] if isinstance(key, tuple) else str(key)
+    
+    def _batch_body(self, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Decode a sub-response body, which the batch endpoint returns as a JSON string"""
+        if not result or not result.get('body'):
+            return {}
+        try:
+            body = self.decoder.loads(result['body'])
+        except ValueError:
+            return {}
+        return body if isinstance(body, dict) else {}
+    
+    def natural_key(self, metrics: List[str], dimensions: List[str]) -> List[str]:
+        """A row is one object of the reporting level on one day, when its id is requested"""
+        id_field = self.LEVEL_ID_FIELDS.get(self.config.settings.get('level', 'ad'))
+        if id_field in dimensions:
+            return [self.date_field, id_field]
+        return super().natural_key(metrics, dimensions)
+    
+    def _cache_scope(self) -> Dict[str, Any]:
+        """Cache entries are per ad account and reporting level"""
+        return {
+            'account': ','.join(self._account_ids()) if self.config.credentials.get('ad_account_ids')
+                       else self.config.credentials.get('ad_account_id'),
+            'level': self.config.settings.get('level', 'ad'),
+            'time_increment': self.config.settings.get('time_increment')
+        }
+    
+    def _daily_rows(self, metrics: List[str], dimensions: List[str]) -> bool:
+        """Insights rows cover single days only with time_increment=1"""
+        return str(self.config.settings.get('time_increment')) == '1'
+    
+    def _checkpoint_scope(self) -> Dict[str, Any]:
+        """Cursors differ between sync paging and async report jobs"""
+        return dict(self._cache_scope(), insights_mode=self.config.settings.get('insights_mode', 'auto'))
+    
+    def _account_id(self) -> str:
+        return self.config.credentials.get('ad_account_id') or ''
+    
+    def _observe_response(self, response) -> Optional[float]:
+        """Adapt the throttle to X-App-Usage / X-Business-Use-Case-Usage headers"""
+        usage = parse_facebook_usage(response.headers)
+        if 'app_pct' in usage:
+            self.throttle.observe_usage('app', self._app_id(), usage['app_pct'])
+        if 'account_pct' in usage:
+            self.throttle.observe_usage('account', self._account_id(), usage['account_pct'])
+        regain_seconds = usage.get('regain_seconds')
+        if regain_seconds:
+            self.throttle.pause('account', self._account_id(), regain_seconds)
+        
+        if response.status_code not in RATE_LIMIT_STATUSES:
+            return None
+        try:
+            error_code = response.json().get('error', {}).get('code')
+        except ValueError:
+            error_code = None
+        if response.status_code != 429 and error_code not in RATE_LIMIT_ERROR_CODES:
+            return None
+        return regain_seconds or self.config.settings.get('throttle_pause', 60.0)
+    
+    def _iter_insight_pages(self, url: str, headers: Dict[str, str],
+                            params: Optional[Dict[str, Any]],
+                            cursor: Optional[Dict[str, Any]] = None,
+                            resume: Optional[Dict[str, Any]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield each page of an insights edge, following paging.next.
+
+        Each page's paging.next is reported as the checkpoint cursor, merged
+        into ``cursor``; a ``resume`` cursor holding ``next`` continues there.
+        """
+        next_page = url
+        if resume and 'next' in resume:
+            next_page = resume['next']
+            params = None
+        
+        incremental = self._incremental_decoding()
+        while next_page:
+            response = self._get(next_page, headers=headers, params=params, stream=incremental)
+            if incremental:
+                # Rows are decoded one by one from the byte stream; paging follows them
+                data = {}
+                data['data'] = self._decode_rows(response, 'data', data)
+            else:
+                response.raise_for_status()
+                data = self._decode_json(response)
             
-            params = {
-                'time_range': {
-                    'start_date': start_date.strftime('%Y-%m-%d'),
-                    'end_date': end_date.strftime('%Y-%m-%d')
-                },
-                'fields': ','.join(metrics + dimensions),
-                'level': 'ad'  # Default to ad level, can be configured
-            }
+            # Handle pagination
+            paging = data.get('paging', {})
+            next_page = paging.get('next')
+            self._next_cursor(dict(cursor or {}, next=next_page))
+            yield self._process_response(data)
             
-            url = f"{self.base_url}/{account_id}/insights"
+            # Clear params for subsequent requests as they're included in the next URL
+            params = None
+    
+    def _use_async_report(self, start_date: datetime, end_date: datetime, level: str) -> bool:
+        """Decide between synchronous pagination and an async report job.
+
+        The ``insights_mode`` setting forces 'sync' or 'async'; in 'auto' mode
+        large levels switch to async once the date span reaches
+        ``async_min_days`` (an int, or a dict keyed by level).
+        """
+        mode = self.config.settings.get('insights_mode', 'auto')
+        if mode in ('sync', 'async'):
+            return mode == 'async'
+        
+        min_days = self.config.settings.get('async_min_days', ASYNC_MIN_DAYS)
+        if isinstance(min_days, dict):
+            min_days = min_days.get(level)
+        if min_days is None:
+            return False
+        return (end_date - start_date).days + 1 >= min_days
+    
+    def _submit_async_report(self, account_id: str, headers: Dict[str, str],
+                             params: Dict[str, Any]) -> str:
+        """Submit an async insights job and return its report_run_id"""
+        response = self._post(
+            f"{self.base_url}/{account_id}/insights",
+            headers=headers,
+            data=params
+        )
+        response.raise_for_status()
+        return self._decode_json(response)['report_run_id']
+    
+    def _wait_for_async_report(self, report_run_id: str, headers: Dict[str, str]):
+        """Poll an async job until it completes.
+
+        The poll interval follows the job's progress: while the completion
+        percentage moves, the next poll is scheduled for about half of the
+        estimated remaining time; while it stalls, the interval doubles.
+        """
+        settings = self.config.settings
+        min_interval = settings.get('async_poll_interval', 1.0)
+        max_interval = settings.get('async_max_poll_interval', 30.0)
+        timeout = settings.get('async_timeout', 3600)
+        
+        started = time.monotonic()
+        interval = min_interval
+        last_percent = 0
+        
+        while True:
+            response = self._get(
+                f"{self.base_url}/{report_run_id}",
+                headers=headers,
+                params={'fields': 'async_status,async_percent_completion'}
+            )
+            response.raise_for_status()
             
-            all_results = []
-            next_page = url
+            status = self._decode_json(response)
+            job_status = status.get('async_status')
+            if job_status == ASYNC_COMPLETED:
+                return
+            if job_status in ASYNC_FAILED:
+                raise RuntimeError(f"Async insights report {report_run_id} ended with status: {job_status}")
             
-            while next_page:
-                response = requests.get(next_page, headers=headers, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                all_results.extend(self._process_response(data))
-                
-                # Handle pagination
-                paging = data.get('paging', {})
-                next_page = paging.get('next')
-                # Clear params for subsequent requests as they're included in the next URL
-                params = None
+            elapsed = time.monotonic() - started
+            if elapsed >= timeout:
+                raise TimeoutError(f"Async insights report {report_run_id} did not finish within {timeout}s")
             
-            return all_results
-        except Exception as e:
-            print(f"Failed to fetch data from Facebook Ads API: {str(e)}")
-            return []
+            percent = status.get('async_percent_completion') or 0
+            if percent > last_percent:
+                remaining = elapsed * (100 - percent) / percent
+                interval = remaining / 2
+            else:
+                interval *= 2
+            interval = max(min_interval, min(max_interval, interval, timeout - elapsed))
+            last_percent = percent
+            
+            time.sleep(interval)
     
     def _process_response(self, response_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Process the API response and convert it to standard format"""
@@ -0,0 +1,110 @@
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime
+from .google_ads_schema import MICROS_SUFFIX
+
+# Prefixes every resource can select alongside its own attributes
+COMMON_PREFIXES = ('customer', 'segments', 'metrics')
+
+# Reporting resources from the coarsest row grain to the finest, with the
+# attribute prefixes each can select. Attributes of a resource's parents do
+# not change its grain; only the resource itself and segments.* do.
+RESOURCES: Dict[str, Tuple[str, ...]] = {
+    'customer': (),
+    'campaign': ('campaign', 'campaign_budget', 'bidding_strategy'),
+    'ad_group': ('campaign', 'campaign_budget', 'bidding_strategy', 'ad_group'),
+    'ad_group_ad': ('campaign', 'campaign_budget', 'bidding_strategy', 'ad_group', 'ad_group_ad'),
+    'keyword_view': ('campaign', 'ad_group', 'ad_group_criterion', 'keyword_view'),
+    'age_range_view': ('campaign', 'ad_group', 'ad_group_criterion', 'age_range_view'),
+    'gender_view': ('campaign', 'ad_group', 'ad_group_criterion', 'gender_view'),
+    'search_term_view': ('campaign', 'ad_group', 'search_term_view'),
+    'geographic_view': ('campaign', 'geographic_view'),
+}
+
+def field_prefix(field: str) -> str:
+    return field.split('.', 1)[0]
+
+def is_metric(field: str) -> bool:
+    return field_prefix(field) == 'metrics'
+
+def choose_resource(fields: Iterable[str]) -> str:
+    """Return the coarsest resource that can select every field.
+
+    Selecting from a finer resource than needed returns one row per finer
+    object, so reports would be over-fetched and need re-aggregating.
+    """
+    prefixes = {field_prefix(field) for field in fields} - set(COMMON_PREFIXES)
+    for resource, allowed in RESOURCES.items():
+        if prefixes <= set(allowed):
+            return resource
+    raise ValueError(f"No single GAQL resource can select: {', '.join(sorted(prefixes))}")
+
+def build_query(resource: str, fields: Sequence[str],
+                start_date: datetime, end_date: datetime) -> str:
+    """Render the GAQL query for fields over a date range"""
+    date_range = f"segments.date BETWEEN '{start_date.strftime('%Y-%m-%d')}' AND '{end_date.strftime('%Y-%m-%d')}'"
+    return f"SELECT {', '.join(fields)} FROM {resource} WHERE {date_range}"
+
+def output_fields(fields: Sequence[str], convert_micros: bool = True) -> List[str]:
+    """Keys a flattened row holds for fields, including derived currency fields"""
+    keys = []
+    for field in fields:
+        keys.append(field)
+        if convert_micros and field.endswith(MICROS_SUFFIX):
+            keys.append(field[:-len(MICROS_SUFFIX)])
+    return keys
+
+class PlannedQuery:
+    """One GAQL query answering one or more requests"""
+
+    def __init__(self, resource: str, start_date: datetime, end_date: datetime):
+        self.resource = resource
+        self.start_date = start_date
+        self.end_date = end_date
+        self.dimensions: List[str] = []
+        self.metrics: List[str] = []
+        # (request index, requested fields) for every request this query serves
+        self.members: List[Tuple[int, List[str]]] = []
+
+    def add(self, index: int, metrics: Sequence[str], dimensions: Sequence[str]):
+        fields = list(dimensions) + list(metrics)
+        for field in fields:
+            target = self.metrics if is_metric(field) else self.dimensions
+            if field not in target:
+                target.append(field)
+        self.members.append((index, fields))
+
+    @property
+    def fields(self) -> List[str]:
+        return self.dimensions + self.metrics
+
+    @property
+    def query(self) -> str:
+        return build_query(self.resource, self.fields, self.start_date, self.end_date)
+
+def plan_queries(requests: Sequence[Tuple[datetime, datetime, List[str], List[str]]],
+                 resource: Optional[str] = None) -> List[PlannedQuery]:
+    """Group (start_date, end_date, metrics, dimensions) requests into as few queries as possible.
+
+    Requests over the same date range whose fields resolve to the same
+    resource and select the same segments share a query: the row grain is
+    identical, so the union of their attributes and metrics is fetched once
+    and each request gets its own columns back. ``resource`` forces the
+    FROM clause of every query.
+    """
+    planned: Dict[Tuple, PlannedQuery] = {}
+    for index, (start_date, end_date, metrics, dimensions) in enumerate(requests):
+        fields = list(dimensions) + list(metrics)
+        query_resource = resource or choose_resource(fields)
+        segments = frozenset(field for field in fields if field_prefix(field) == 'segments')
+        key = (start_date, end_date, query_resource, segments)
+        query = planned.get(key)
+        if query is None:
+            query = planned[key] = PlannedQuery(query_resource, start_date, end_date)
+        query.add(index, metrics, dimensions)
+    return list(planned.values())
+
+def split_rows(rows: List[Dict[str, Any]], fields: Sequence[str],
+               convert_micros: bool = True) -> List[Dict[str, Any]]:
+    """Project rows of a merged query onto one request's fields"""
+    keys = output_fields(fields, convert_micros)
+    return [{key: row.get(key) for key in keys} for row in rows]
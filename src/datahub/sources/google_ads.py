@@ -1,21 +1,52 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime
 from ..core.data_source import DataSource, DataSourceConfig
-import requests
+from ..core.transport import HttpTransport
+from ..core.decoding import iter_json_array
+from ..core.throttle import parse_duration, parse_google_retry_delay
+from .google_ads_schema import compile_flattener
+from .gaql_planner import build_query, choose_resource, plan_queries, split_rows
 
 class GoogleAdsSource(DataSource):
     """Google Ads data source implementation"""
     
-    def __init__(self, config: DataSourceConfig):
-        self.config = config
-        self.base_url = "https://googleads.googleapis.com/v9"
+    source_type = 'google_ads'
+    date_field = 'segments.date'
+    
+    # GAQL resource -> field identifying a row of it, before segmentation
+    RESOURCE_ID_FIELDS = {
+        'customer': 'customer.id',
+        'campaign': 'campaign.id',
+        'ad_group': 'ad_group.id',
+        'ad_group_ad': 'ad_group_ad.ad.id',
+    }
+    
+    # Canonical field -> source field, used by SchemaNormalizer
+    schema_mapping = {
+        'date': 'segments.date',
+        'account_id': 'customer.id',
+        'campaign_id': 'campaign.id',
+        'campaign_name': 'campaign.name',
+        'ad_group_id': 'ad_group.id',
+        'ad_group_name': 'ad_group.name',
+        'ad_id': 'ad_group_ad.ad.id',
+        'ad_name': 'ad_group_ad.ad.name',
+        'impressions': 'metrics.impressions',
+        'clicks': 'metrics.clicks',
+        'cost': ('metrics.cost_micros', 1e-6),
+        'conversions': 'metrics.conversions',
+    }
+    
+    def __init__(self, config: DataSourceConfig, transport: HttpTransport = None):
+        super().__init__(config, transport)
+        self.base_url = config.settings.get('base_url', "https://googleads.googleapis.com/v9")
         self.token = None
     
     def connect(self) -> bool:
         """Establish connection to Google Ads API"""
         try:
             self.token = self.config.credentials.get('access_token')
-            return self.validate_credentials()
+            return self._check_credentials()
         except Exception as e:
             print(f"Failed to connect to Google Ads API: {str(e)}")
             return False
@@ -32,7 +63,7 @@ class GoogleAdsSource(DataSource):
             }
             customer_id = self.config.credentials.get('customer_id')
             url = f"{self.base_url}/customers/{customer_id}"
-            response = requests.get(url, headers=headers)
+            response = self._get(url, headers=headers)
             return response.status_code == 200
         except Exception:
             return False
@@ -47,44 +78,158 @@ class GoogleAdsSource(DataSource):
             raise ValueError("Not connected to Google Ads API")
         
         try:
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
-            
-            customer_id = self.config.credentials.get('customer_id')
-            
-            # Construct GAQL query
-            select_fields = ', '.join(dimensions + metrics)
-            date_range = f"segments.date BETWEEN '{start_date.strftime('%Y-%m-%d')}' AND '{end_date.strftime('%Y-%m-%d')}'"
-            query = f"SELECT {select_fields} FROM campaign WHERE {date_range}"
-            
-            url = f"{self.base_url}/customers/{customer_id}/googleAds:search"
-            params = {'query': query}
-            
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            return self._process_response(data)
+            return list(self.iter_rows(start_date, end_date, metrics, dimensions))
         except Exception as e:
             print(f"Failed to fetch data from Google Ads API: {str(e)}")
             return []
     
-    def _process_response(self, response_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Process the API response and convert it to standard format"""
-        results = []
-        for row in response_data.get('results', []):
-            processed_row = {}
-            # Flatten the nested structure
-            for key, value in row.items():
-                if isinstance(value, dict):
-                    for sub_key, sub_value in value.items():
-                        processed_row[f"{key}.{sub_key}"] = sub_value
-                else:
-                    processed_row[key] = value
-            results.append(processed_row)
+    def _iter_api_pages(self,
+                        start_date: datetime,
+                        end_date: datetime,
+                        metrics: List[str],
+                        dimensions: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        """Yield result pages of the GAQL query, raising on failure"""
+        if not self.token:
+            raise ValueError("Not connected to Google Ads API")
+        
+        headers = {
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': 'application/json'
+        }
+        
+        customer_id = self.config.credentials.get('customer_id')
+        
+        # Construct GAQL query against the coarsest resource holding every field
+        fields = dimensions + metrics
+        resource = self.config.settings.get('gaql_resource') or choose_resource(fields)
+        query = build_query(resource, fields, start_date, end_date)
+        
+        flatten = compile_flattener(
+            tuple(dimensions + metrics),
+            self.config.settings.get('convert_micros', True)
+        )
+        
+        # 'search' follows nextPageToken page by page; 'stream' uses searchStream
+        if self.config.settings.get('query_mode', 'search') == 'stream':
+            yield from self._iter_stream_pages(customer_id, query, headers, flatten)
+        else:
+            yield from self._iter_search_pages(customer_id, query, headers, flatten)
+    
+    def fetch_many(self,
+                   requests: Sequence[Tuple[datetime, datetime, List[str], List[str]]]) -> List[List[Dict[str, Any]]]:
+        """Fetch several (start_date, end_date, metrics, dimensions) reports with as few queries as possible.
+
+        Requests that share a date range, resource and segments are merged
+        into one wider query (see gaql_planner.plan_queries) and its rows are
+        split back into each request's fields. Returns one row list per
+        request, in order; raises on failure like iter_pages.
+        """
+        convert_micros = self.config.settings.get('convert_micros', True)
+        results: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        for planned in plan_queries(requests, self.config.settings.get('gaql_resource')):
+            for page in self.iter_pages(planned.start_date, planned.end_date,
+                                        planned.metrics, planned.dimensions):
+                for index, fields in planned.members:
+                    results[index].extend(split_rows(page, fields, convert_micros))
         return results
+    
+    def natural_key(self, metrics: List[str], dimensions: List[str]) -> List[str]:
+        """A row is one object of the queried resource per combination of the selected segments"""
+        resource = self.config.settings.get('gaql_resource') or choose_resource(list(dimensions) + list(metrics))
+        id_field = self.RESOURCE_ID_FIELDS.get(resource)
+        if id_field in dimensions:
+            return [id_field] + [field for field in dimensions if field.startswith('segments.')]
+        return super().natural_key(metrics, dimensions)
+    
+    def _cache_scope(self) -> Dict[str, Any]:
+        """Cache entries are per customer account, row conversion and forced resource"""
+        return {
+            'account': self.config.credentials.get('customer_id'),
+            'convert_micros': self.config.settings.get('convert_micros', True),
+            'resource': self.config.settings.get('gaql_resource')
+        }
+    
+    def _checkpoint_scope(self) -> Dict[str, Any]:
+        """Only 'search' mode pages by token"""
+        return dict(self._cache_scope(), query_mode=self.config.settings.get('query_mode', 'search'))
+    
+    def _account_id(self) -> str:
+        return self.config.credentials.get('customer_id') or ''
+    
+    def _observe_response(self, response) -> Optional[float]:
+        """Pause on RESOURCE_EXHAUSTED using the quota error's retryDelay"""
+        if response.status_code != 429:
+            return None
+        try:
+            delay = parse_google_retry_delay(response.json())
+        except ValueError:
+            delay = None
+        if delay is None:
+            delay = parse_duration(response.headers.get('Retry-After'))
+        return delay if delay is not None else self.config.settings.get('throttle_pause', 30.0)
+    
+    def _iter_search_pages(self, customer_id: str, query: str, headers: Dict[str, str],
+                           flatten: Callable) -> Iterator[List[Dict[str, Any]]]:
+        """Yield every page of a googleAds:search query"""
+        url = f"{self.base_url}/customers/{customer_id}/googleAds:search"
+        body = {'query': query}
+        page_size = self.config.settings.get('page_size')
+        if page_size:
+            body['pageSize'] = page_size
+        
+        # Continue an interrupted pull from its last committed page
+        resume = self._resume_cursor()
+        if resume is not None:
+            if not resume.get('page_token'):
+                return
+            body['pageToken'] = resume['page_token']
+        
+        incremental = self._incremental_decoding()
+        while True:
+            response = self._post(url, headers=headers, json=body, stream=incremental)
+            if incremental:
+                # Flatten each row as it is decoded from the byte stream
+                rest = {}
+                rows = self._decode_rows(response, 'results', rest, flatten)
+                next_page_token = rest.get('nextPageToken')
+            else:
+                response.raise_for_status()
+                data = self._decode_json(response)
+                rows = self._process_response(data, flatten)
+                next_page_token = data.get('nextPageToken')
+            self._next_cursor({'page_token': next_page_token})
+            yield rows
+            
+            if not next_page_token:
+                break
+            body = dict(body, pageToken=next_page_token)
+    
+    def _iter_stream_pages(self, customer_id: str, query: str, headers: Dict[str, str],
+                           flatten: Callable) -> Iterator[List[Dict[str, Any]]]:
+        """Yield each result batch of a googleAds:searchStream query as it arrives.
+
+        A failure after the stream started arrives as an element holding
+        ``error``, and a cut-off body fails to decode; both raise rather
+        than end the pull early.
+        """
+        url = f"{self.base_url}/customers/{customer_id}/googleAds:searchStream"
+        response = self._post(url, headers=headers, json={'query': query}, stream=True)
+        try:
+            response.raise_for_status()
+            chunk_size = self.config.settings.get('stream_chunk_size', 64 * 1024)
+            for batch in iter_json_array(response.iter_content(chunk_size=chunk_size)):
+                if 'error' in batch:
+                    error = batch['error']
+                    message = error.get('message', error) if isinstance(error, dict) else error
+                    raise RuntimeError(f"searchStream failed mid-stream: {message}")
+                yield self._process_response(batch, flatten)
+        finally:
+            response.close()
+    
+    def _process_response(self, response_data: Dict[str, Any],
+                          flatten: Callable) -> List[Dict[str, Any]]:
+        """Flatten and type the rows of one page with the query's compiled flattener"""
+        return [flatten(row) for row in response_data.get('results', [])]
 
 # Register the source with the factory
 from ..core.data_source import DataSourceFactory
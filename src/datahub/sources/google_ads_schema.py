@@ -0,0 +1,110 @@
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from decimal import Decimal
+from functools import lru_cache
+
+MICROS_SUFFIX = '_micros'
+
+# Metrics the API encodes as int64, which REST returns as JSON strings
+INT64_FIELDS = {
+    'metrics.impressions',
+    'metrics.clicks',
+    'metrics.interactions',
+    'metrics.engagements',
+    'metrics.video_views',
+    'metrics.active_view_impressions',
+    'metrics.active_view_measurable_impressions',
+}
+
+# Metrics the API encodes as double
+DOUBLE_FIELDS = {
+    'metrics.ctr',
+    'metrics.conversions',
+    'metrics.conversions_value',
+    'metrics.all_conversions',
+    'metrics.all_conversions_value',
+    'metrics.view_through_conversions',
+    'metrics.interaction_rate',
+    'metrics.engagement_rate',
+    'metrics.video_view_rate',
+    'metrics.conversions_from_interactions_rate',
+    'metrics.search_impression_share',
+    'metrics.average_cpc',
+    'metrics.average_cpm',
+    'metrics.average_cost',
+    'metrics.cost_per_conversion',
+}
+
+def _to_int(value: Any) -> int:
+    return int(value)
+
+def _to_float(value: Any) -> float:
+    return float(value)
+
+def _identity(value: Any) -> Any:
+    return value
+
+def _camel_case(segment: str) -> str:
+    """Convert a GAQL snake_case segment to the lowerCamelCase JSON key"""
+    head, *tail = segment.split('_')
+    return head + ''.join(part.capitalize() for part in tail)
+
+def field_converter(field: str) -> Tuple[Callable[[Any], Any], Any]:
+    """Return the (converter, default) pair for a GAQL field.
+
+    The REST API omits fields holding their default value, so a missing metric
+    defaults to zero while a missing attribute stays None.
+    """
+    if field in INT64_FIELDS or field.endswith(MICROS_SUFFIX):
+        return _to_int, (0 if field.startswith('metrics.') else None)
+    if field.endswith('.id'):
+        return _to_int, None
+    if field in DOUBLE_FIELDS:
+        return _to_float, 0.0
+    return _identity, None
+
+def micros_to_currency(micros: Optional[int]) -> Optional[Decimal]:
+    """Convert an amount in micros to a Decimal currency amount"""
+    if micros is None:
+        return None
+    return Decimal(micros).scaleb(-6)
+
+@lru_cache(maxsize=256)
+def compile_flattener(fields: Tuple[str, ...],
+                      convert_micros: bool = True) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Compile a function turning one nested API row into a flat, typed row.
+
+    Each requested field is read through a precomputed path of JSON keys, at
+    any depth, and converted to its declared type. With ``convert_micros``,
+    every ``*_micros`` field also gets a Decimal currency field without the
+    suffix, e.g. ``metrics.cost`` next to ``metrics.cost_micros``.
+    Flatteners are cached per field tuple, so each query compiles once.
+    """
+    specs: List[Tuple[str, Tuple[Tuple[str, str], ...], Callable[[Any], Any], Any, Optional[str]]] = []
+    for field in fields:
+        path = tuple((_camel_case(segment), segment) for segment in field.split('.'))
+        converter, default = field_converter(field)
+        currency_field = None
+        if convert_micros and field.endswith(MICROS_SUFFIX):
+            currency_field = field[:-len(MICROS_SUFFIX)]
+        specs.append((field, path, converter, default, currency_field))
+    specs = tuple(specs)
+
+    def flatten(row: Dict[str, Any]) -> Dict[str, Any]:
+        flat = {}
+        for field, path, converter, default, currency_field in specs:
+            value = row
+            for camel_key, snake_key in path:
+                child = value.get(camel_key)
+                if child is None:
+                    child = value.get(snake_key)
+                if child is None:
+                    value = None
+                    break
+                value = child
+            value = default if value is None else converter(value)
+            flat[field] = value
+            if currency_field is not None:
+                flat[currency_field] = micros_to_currency(value)
+        return flat
+
+    return flatten
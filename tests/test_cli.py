@@ -0,0 +1,175 @@
+import unittest
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from datahub import cli
+from datahub.core.config_manager import ConfigManager
+from datahub.core.data_source import DataSource, DataSourceFactory
+
+class DailySource(DataSource):
+    """Two rows per day, tagged with the worker process that produced them"""
+
+    def connect(self) -> bool:
+        return True
+
+    def validate_credentials(self) -> bool:
+        return True
+
+    def fetch_data(self, start_date, end_date, metrics, dimensions):
+        return []
+
+    def _iter_api_pages(self, start_date, end_date, metrics, dimensions):
+        if self.config.settings.get('fail'):
+            raise ConnectionError('connection reset')
+        marker = self.config.settings.get('exclusive_marker')
+        if marker:
+            # 同一账户的任务同时运行时创建标记文件会失败
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+            time.sleep(0.05)
+            os.remove(marker)
+        day = start_date
+        while day <= end_date:
+            yield [{'date': day.strftime('%Y-%m-%d'), 'campaign_id': str(index), 'pid': os.getpid(),
+                    'transport': id(self.transport), 'metrics': metrics}
+                   for index in range(2)]
+            day += timedelta(days=1)
+
+class TestSyncCommand(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'out')
+        self.config_path = os.path.join(self.directory, 'config.json')
+        DataSourceFactory.register('daily', DailySource)
+        self.config_manager = ConfigManager(self.config_path)
+        self.config_manager.add_data_source('daily_a', 'daily', {}, {'metrics': ['clicks']})
+        self.config_manager.add_data_source('daily_b', 'daily', {}, {'metrics': ['clicks']})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        DataSourceFactory._sources.pop('daily', None)
+
+    def _run(self, *args):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            code = cli.main(['sync', '--config', self.config_path, '--output', self.output] + list(args))
+        return code, stderr.getvalue()
+
+    def _rows(self):
+        rows = []
+        for directory, _, names in os.walk(self.output):
+            for name in names:
+                with gzip.open(os.path.join(directory, name), 'rt') as f:
+                    rows.extend((os.path.relpath(directory, self.output), json.loads(line)) for line in f)
+        return rows
+
+    def test_jobs_run_in_worker_processes(self):
+        code, output = self._run('--start', '2023-01-01', '--end', '2023-01-04', '--workers', '2')
+        self.assertEqual(code, 0)
+        rows = self._rows()
+        self.assertEqual(len(rows), 16)
+        self.assertIn('source=daily_b/date=2023-01-04', {directory for directory, _ in rows})
+        # 任务在子进程中执行，每个工作进程使用自己的 HTTP 传输
+        pids = {row['pid'] for _, row in rows}
+        self.assertNotIn(os.getpid(), pids)
+        self.assertLessEqual(len(pids), 2)
+        self.assertEqual(len({(row['pid'], row['transport']) for _, row in rows}), len(pids))
+        self.assertIn('[8/8]', output)
+        self.assertIn('8/8 jobs succeeded, 16 rows', output)
+
+    def test_failed_job_sets_exit_code(self):
+        self.config_manager.add_data_source('daily_b', 'daily', {}, {'metrics': ['clicks'], 'fail': True})
+        code, output = self._run('--start', '2023-01-01', '--end', '2023-01-02', '--window', 'week',
+                                 '--workers', '2')
+        self.assertEqual(code, 1)
+        self.assertIn('1/2 jobs succeeded', output)
+        self.assertIn('failed: daily_b 2023-01-01..2023-01-02: ConnectionError: connection reset', output)
+        # 失败的任务不留下部分输出
+        self.assertEqual({directory.split('/')[0] for directory, _ in self._rows()}, {'source=daily_a'})
+
+    def test_source_selection_and_field_overrides(self):
+        code, _ = self._run('--sources', 'daily_a', '--start', '2023-01-01', '--end', '2023-01-01',
+                            '--metrics', 'impressions,clicks', '--workers', '1')
+        self.assertEqual(code, 0)
+        rows = self._rows()
+        self.assertEqual({directory for directory, _ in rows}, {'source=daily_a/date=2023-01-01'})
+        self.assertEqual(rows[0][1]['metrics'], ['impressions', 'clicks'])
+
+    def test_usage_errors(self):
+        self.assertEqual(self._run('--sources', 'missing', '--start', '2023-01-01')[0], 2)
+        self.assertEqual(self._run('--start', '2023-01-05', '--end', '2023-01-01')[0], 2)
+        self.config_manager.add_data_source('no_metrics', 'daily', {}, {})
+        code, output = self._run('--start', '2023-01-01')
+        self.assertEqual(code, 2)
+        self.assertIn('No metrics for no_metrics', output)
+
+    def test_parquet_keeps_dimension_ids_as_strings(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow not installed')
+        self.config_manager.add_data_source('daily_a', 'daily', {},
+                                            {'metrics': ['clicks'], 'dimensions': ['campaign_id']})
+        code, _ = self._run('--sources', 'daily_a', '--start', '2023-01-01', '--end', '2023-01-01',
+                            '--format', 'parquet', '--workers', '1')
+        self.assertEqual(code, 0)
+        directory = os.path.join(self.output, 'source=daily_a', 'date=2023-01-01')
+        table = pq.read_table(os.path.join(directory, os.listdir(directory)[0]))
+        # 数字形式的 ID 仍按字符串保存，不会丢失前导零
+        self.assertEqual(table.column('campaign_id').to_pylist(), ['0', '1'])
+
+    def test_unsupported_window_is_a_usage_error(self):
+        code, output = self._run('--start', '2023-01-01', '--end', '2023-01-31', '--window', 'month')
+        self.assertEqual(code, 2)
+        self.assertIn('Unknown shard window: month', output)
+
+    def test_window_in_days(self):
+        code, output = self._run('--sources', 'daily_a', '--start', '2023-01-01', '--end', '2023-01-07',
+                                 '--window', '3', '--workers', '1')
+        self.assertEqual(code, 0)
+        self.assertIn('daily_a 2023-01-07..2023-01-07', output)
+        self.assertIn('daily_a 2023-01-01..2023-01-03', output)
+        self.assertIn('3/3 jobs succeeded, 14 rows', output)
+
+    def test_account_limit_applies_across_workers(self):
+        marker = os.path.join(self.directory, 'act_1.running')
+        settings = {'metrics': ['clicks'], 'exclusive_marker': marker}
+        self.config_manager.add_data_source('daily_a', 'daily', {'ad_account_id': 'act_1'}, settings)
+        self.config_manager.add_data_source('daily_b', 'daily', {'ad_account_id': 'act_1'}, settings)
+        code, output = self._run('--start', '2023-01-01', '--end', '2023-01-03', '--workers', '4')
+        # 两个数据源属于同一账户，即使有多个工作进程也不会同时拉取
+        self.assertEqual(code, 0, output)
+        self.assertIn('6/6 jobs succeeded', output)
+        self.assertEqual(self._run('--start', '2023-01-01', '--account-limit', '0')[0], 2)
+
+    def test_jobs_share_the_scheduler_plan(self):
+        jobs = cli.plan_jobs(self.config_manager, datetime(2023, 1, 1), datetime(2023, 1, 2), 'day',
+                             dimensions=['campaign_id'])
+        self.assertEqual({type(job).__name__ for job in jobs}, {'SyncJob'})
+        self.assertEqual([(job.source_id, job.start_date.day, job.metrics, job.dimensions) for job in jobs[:2]],
+                         [('daily_a', 2, ['clicks'], ['campaign_id']), ('daily_a', 1, ['clicks'], ['campaign_id'])])
+
+    def test_default_range_is_yesterday(self):
+        jobs = cli.plan_jobs(self.config_manager, *cli._date_range(cli.build_parser().parse_args(
+            ['sync', '--config', self.config_path, '--output', self.output, '--days', '3'])), 'day')
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        self.assertEqual(len(jobs), 6)
+        self.assertEqual(min(job.start_date for job in jobs), today - timedelta(days=3))
+        self.assertEqual(max(job.end_date for job in jobs), today - timedelta(days=1))
+
+    def test_module_entry_point(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        result = subprocess.run([sys.executable, '-m', 'datahub.cli', 'sync', '--help'],
+                                capture_output=True, text=True, env=env)
+        self.assertEqual(result.returncode, 0)
+        self.assertIn('--workers', result.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
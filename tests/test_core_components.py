@@ -2,10 +2,32 @@ import unittest
 from unittest.mock import Mock, patch
 import os
 import json
-from datetime import datetime
-from datahub.core.data_source import DataSource, DataSourceConfig, DataSourceFactory
+import math
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from datahub.core.data_source import DataSource, DataSourceConfig, DataSourceFactory, split_date_range
 from datahub.core.token_manager import TokenManager
+from datahub.core.transport import HttpTransport
+from datahub.core.decoding import iter_json_array, iter_json_object_array, get_decoder, JsonDecoder
+from datahub.core.incremental import IncrementalSync
+from datahub.core.sync_state import SyncStateManager, metric_set_key
+from datahub.core.cache import ResponseCache
+from datahub.core.checkpoint import CheckpointStore
+from datahub.core.columnar import ColumnarBatch
+from datahub.core.rollup import Rollup
+from datahub.core.row_store import KeyedRowStore
+from datahub.core.scheduler import SyncScheduler
+from datahub.core.source_pool import SourcePool
+from datahub.core.throttle import TokenBucket, RateLimiter, parse_facebook_usage, parse_google_retry_delay
 from datahub.core.config_manager import ConfigManager
+from datahub.core.instrumentation import (MetricsCollector, CompositeHooks, TracingHooks,
+                                          endpoint_name, set_default_hooks)
 
 class TestDataSourceConfig(unittest.TestCase):
     def setUp(self):
@@ -84,6 +106,94 @@ class TestConfigManager(unittest.TestCase):
         self.config_manager.remove_data_source(source_id)
         self.assertIsNone(self.config_manager.get_source_config(source_id))
 
+class TestStorageBackends(unittest.TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.config_dir, 'config.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def test_sqlite_config_and_tokens(self):
+        config_manager = ConfigManager(self.config_path, storage='sqlite')
+        config_manager.add_data_source('fb', 'facebook_ads', {'ad_account_id': '1'}, {'level': 'ad'})
+        config_manager.update_source_credentials('fb', {'access_token': 'tok'})
+
+        # 另一个实例（如另一个进程）能看到相同的数据
+        other = ConfigManager(self.config_path, storage='sqlite')
+        self.assertEqual(other.get_source_config('fb')['credentials'],
+                         {'ad_account_id': '1', 'access_token': 'tok'})
+        self.assertEqual(other.token_manager.get_token('fb')['access_token'], 'tok')
+        self.assertTrue(os.path.exists(os.path.join(self.config_dir, 'datahub.db')))
+        self.assertFalse(os.path.exists(self.config_path))
+
+        other.remove_data_source('fb')
+        self.assertIsNone(config_manager.get_source_config('fb'))
+        self.assertIsNone(config_manager.token_manager.get_token('fb'))
+
+    def test_sqlite_sync_state(self):
+        config_manager = ConfigManager(self.config_path, storage='sqlite')
+        config_manager.sync_state.set_watermark('fb', 'clicks|', datetime(2023, 1, 31))
+        config_manager.sync_state.set_watermark('fb', 'spend|', datetime(2023, 1, 15))
+        # 水位线也写入 datahub.db，不再整体重写 sync_state.json
+        other = ConfigManager(self.config_path, storage='sqlite')
+        self.assertEqual(other.sync_state.get_watermark('fb', 'clicks|'), datetime(2023, 1, 31))
+        self.assertEqual(sorted(other.sync_state.state['fb']), ['clicks|', 'spend|'])
+        self.assertFalse(os.path.exists(os.path.join(self.config_dir, 'sync_state.json')))
+
+    def test_config_snapshot_is_read_only(self):
+        config_manager = ConfigManager(self.config_path)
+        config_manager.add_data_source('s', 'test_type', {}, {})
+        self.assertEqual(config_manager.config['sources']['s']['type'], 'test_type')
+        with self.assertRaises(TypeError):
+            config_manager.config['sources']['t'] = {'type': 'test_type'}
+
+    def test_batch_writes_json_once(self):
+        config_manager = ConfigManager(self.config_path)
+        with patch('datahub.core.storage.os.replace', wraps=os.replace) as replace:
+            with config_manager.batch():
+                for i in range(20):
+                    config_manager.add_data_source(f"s{i}", 'test_type', {}, {})
+        self.assertEqual(replace.call_count, 1)
+
+        with open(self.config_path) as f:
+            self.assertEqual(len(json.load(f)['sources']), 20)
+
+    def test_failed_batch_rolls_back(self):
+        for storage in ('json', 'sqlite'):
+            config_manager = ConfigManager(self.config_path, storage=storage)
+            config_manager.add_data_source('kept', 'test_type', {}, {})
+            with self.assertRaises(RuntimeError):
+                with config_manager.batch():
+                    config_manager.add_data_sources({'lost': {'type': 'test_type'}})
+                    raise RuntimeError('boom')
+            self.assertEqual(list(ConfigManager(self.config_path, storage=storage).list_sources()), ['kept'])
+
+    def test_json_keeps_other_top_level_keys(self):
+        with open(self.config_path, 'w') as f:
+            json.dump({'sources': {}, 'schedule': {'hour': 3}}, f)
+        config_manager = ConfigManager(self.config_path)
+        config_manager.add_data_source('s', 'test_type', {}, {})
+
+        with open(self.config_path) as f:
+            document = json.load(f)
+        self.assertEqual(document['schedule'], {'hour': 3})
+        self.assertIn('s', document['sources'])
+
+    def test_sqlite_concurrent_writers(self):
+        config_manager = ConfigManager(self.config_path, storage='sqlite')
+
+        def onboard(worker):
+            for i in range(25):
+                config_manager.add_data_source(f"w{worker}-{i}", 'test_type', {}, {})
+
+        threads = [threading.Thread(target=onboard, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(config_manager.list_sources()), 100)
+
 class MockDataSource(DataSource):
     def __init__(self, config):
         super().__init__(config)
@@ -114,5 +224,1043 @@ class TestDataSourceFactory(unittest.TestCase):
         with self.assertRaises(ValueError):
             DataSourceFactory.create('unknown_source', self.config)
 
+    def test_create_with_transport(self):
+        DataSourceFactory.register('mock_source', MockDataSource)
+        transport = HttpTransport()
+        source = DataSourceFactory.create('mock_source', self.config, transport=transport)
+        self.assertIs(source.transport, transport)
+
+    def test_builtin_sources_load_on_first_use(self):
+        source = DataSourceFactory.create('facebook_ads', self.config)
+        self.assertEqual(type(source).__name__, 'FacebookAdsSource')
+        self.assertIn('google_ads', DataSourceFactory.available_types())
+
+    def test_register_lazy(self):
+        DataSourceFactory.register_lazy('lazy_mock', f'{__name__}:MockDataSource')
+        self.addCleanup(DataSourceFactory._lazy.pop, 'lazy_mock')
+        self.assertIsInstance(DataSourceFactory.create('lazy_mock', self.config), MockDataSource)
+
+    def test_entry_point_sources(self):
+        entry_point = Mock(value=f'{__name__}:MockDataSource')
+        entry_point.name = 'plugin_source'
+        self.addCleanup(DataSourceFactory._lazy.pop, 'plugin_source', None)
+        with patch.object(DataSourceFactory, '_entry_points_loaded', False), \
+                patch('importlib.metadata.entry_points', return_value=[entry_point]) as entry_points:
+            source = DataSourceFactory.create('plugin_source', self.config)
+            DataSourceFactory.create('plugin_source', self.config)
+        self.assertIsInstance(source, MockDataSource)
+        entry_points.assert_called_once_with(group='datahub.sources')
+
+    def test_entry_points_before_python_310(self):
+        entry_point = Mock(value=f'{__name__}:MockDataSource')
+        entry_point.name = 'legacy_plugin'
+        self.addCleanup(DataSourceFactory._lazy.pop, 'legacy_plugin', None)
+
+        def legacy_entry_points():
+            # Python 3.8/3.9 的 entry_points() 不接受参数，返回按组划分的字典
+            return {'datahub.sources': [entry_point]}
+
+        with patch.object(DataSourceFactory, '_entry_points_loaded', False), \
+                patch('importlib.metadata.entry_points', legacy_entry_points):
+            self.assertIsInstance(DataSourceFactory.create('legacy_plugin', self.config), MockDataSource)
+            with self.assertRaisesRegex(ValueError, 'Unknown data source type'):
+                DataSourceFactory.create('missing_plugin', self.config)
+
+    def test_import_is_cheap(self):
+        # 导入核心模块时不应加载 requests、numpy 或任何数据源模块
+        code = ('import sys, datahub.core.config_manager; '
+                'print(sorted(m for m in ("requests", "numpy", "pyarrow", "datahub.sources.facebook_ads") '
+                'if m in sys.modules))')
+        env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), '..', 'src'))
+        output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), '[]')
+
+class TestHttpTransport(unittest.TestCase):
+    def tearDown(self):
+        HttpTransport.close_shared()
+
+    def test_sources_with_same_settings_share_transport(self):
+        first = MockDataSource(DataSourceConfig({}, {'http_pool_size': 20}))
+        second = MockDataSource(DataSourceConfig({}, {'http_pool_size': 20}))
+        other = MockDataSource(DataSourceConfig({}, {'http_pool_size': 5}))
+        self.assertIs(first.transport, second.transport)
+        self.assertIsNot(first.transport, other.transport)
+
+    def test_transport_from_settings_object(self):
+        transport = HttpTransport()
+        source = MockDataSource(DataSourceConfig({}, {'transport': transport}))
+        self.assertIs(source.transport, transport)
+
+    def test_pool_and_retry_configuration(self):
+        transport = HttpTransport.from_settings({
+            'http_pool_size': 32,
+            'http_max_retries': 5,
+            'http_backoff_factor': 0.1,
+            'http_retry_statuses': [429, 503]
+        })
+        adapter = transport.session.get_adapter('https://graph.facebook.com')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertEqual(adapter.max_retries.backoff_factor, 0.1)
+        self.assertEqual(set(adapter.max_retries.status_forcelist), {429, 503})
+
+    def test_request_applies_default_timeout(self):
+        transport = HttpTransport(timeout=12)
+        with patch.object(transport.session, 'request') as mock_request:
+            transport.get('https://example.com', params={'a': 1})
+        mock_request.assert_called_once_with(
+            'GET', 'https://example.com', params={'a': 1}, timeout=12
+        )
+
+class TestDataSourceIterators(unittest.TestCase):
+    def test_default_iter_pages_wraps_fetch_data(self):
+        source = MockDataSource(DataSourceConfig({}, {}))
+        pages = list(source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 2), [], []))
+        self.assertEqual(pages, [[{'metric1': 100, 'dimension1': 'test'}]])
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 2), [], []))
+        self.assertEqual(rows, [{'metric1': 100, 'dimension1': 'test'}])
+
+class WindowRecordingSource(MockDataSource):
+    """Returns one row per window and fails the first attempt of selected windows"""
+    date_field = 'd'
+
+    def __init__(self, config, fail_once=()):
+        super().__init__(config)
+        self.fail_once = set(fail_once)
+        self.calls = []
+
+    def _fetch_window(self, start_date, end_date, metrics, dimensions):
+        self.calls.append(start_date)
+        if start_date in self.fail_once:
+            self.fail_once.discard(start_date)
+            raise IOError('transient failure')
+        return [{'start': start_date, 'end': end_date}]
+
+class TestShardedFetch(unittest.TestCase):
+    def setUp(self):
+        self.config = DataSourceConfig(
+            credentials={'access_token': 'test_token'},
+            settings={'shard_retry_backoff': 0}
+        )
+
+    def test_split_date_range_by_day(self):
+        windows = split_date_range(datetime(2023, 1, 1), datetime(2023, 1, 3), 'day')
+        self.assertEqual(windows, [
+            (datetime(2023, 1, 1), datetime(2023, 1, 1)),
+            (datetime(2023, 1, 2), datetime(2023, 1, 2)),
+            (datetime(2023, 1, 3), datetime(2023, 1, 3)),
+        ])
+
+    def test_split_date_range_clips_last_window(self):
+        windows = split_date_range(datetime(2023, 1, 1), datetime(2023, 1, 10), 'week')
+        self.assertEqual(windows, [
+            (datetime(2023, 1, 1), datetime(2023, 1, 7)),
+            (datetime(2023, 1, 8), datetime(2023, 1, 10)),
+        ])
+        self.assertEqual(
+            split_date_range(datetime(2023, 1, 1), datetime(2023, 1, 10), timedelta(days=5)),
+            split_date_range(datetime(2023, 1, 1), datetime(2023, 1, 10), 5)
+        )
+
+    def test_split_date_range_rejects_invalid_window(self):
+        with self.assertRaises(ValueError):
+            split_date_range(datetime(2023, 1, 1), datetime(2023, 1, 2), 'fortnight')
+        with self.assertRaises(ValueError):
+            split_date_range(datetime(2023, 1, 2), datetime(2023, 1, 1), 'day')
+
+    def test_sharded_fetch_merges_in_order(self):
+        source = WindowRecordingSource(self.config)
+        results = source.fetch_data_sharded(
+            datetime(2023, 1, 1), datetime(2023, 1, 30), ['m'], ['d'],
+            window='week', max_workers=3
+        )
+        self.assertEqual([row['start'] for row in results], [
+            datetime(2023, 1, 1), datetime(2023, 1, 8), datetime(2023, 1, 15),
+            datetime(2023, 1, 22), datetime(2023, 1, 29),
+        ])
+        self.assertEqual(results[-1]['end'], datetime(2023, 1, 30))
+
+    def test_sharded_fetch_retries_failed_window(self):
+        source = WindowRecordingSource(self.config, fail_once=[datetime(2023, 1, 2)])
+        results = source.fetch_data_sharded(
+            datetime(2023, 1, 1), datetime(2023, 1, 3), ['m'], ['d'], max_retries=1
+        )
+        self.assertEqual(len(results), 3)
+        self.assertEqual(source.calls.count(datetime(2023, 1, 2)), 2)
+
+    def test_sharded_fetch_requires_daily_rows(self):
+        source = WindowRecordingSource(self.config)
+        # 每个窗口的汇总行合并后无法区分，因此拒绝按区间汇总的查询
+        with self.assertRaises(ValueError):
+            source.fetch_data_sharded(datetime(2023, 1, 1), datetime(2023, 1, 3), ['m'], ['campaign'])
+        self.assertEqual(source.calls, [])
+
+    def test_sharded_fetch_raises_after_retries(self):
+        source = WindowRecordingSource(self.config, fail_once=[datetime(2023, 1, 1)])
+        with self.assertRaises(IOError):
+            source.fetch_data_sharded(
+                datetime(2023, 1, 1), datetime(2023, 1, 2), ['m'], ['d'], max_retries=0
+            )
+
+class RangeRecordingSource(MockDataSource):
+    requested_ranges = []
+    fail = False
+
+    def iter_pages(self, start_date, end_date, metrics, dimensions):
+        RangeRecordingSource.requested_ranges.append((start_date, end_date))
+        if RangeRecordingSource.fail:
+            raise IOError('API unavailable')
+        yield [{'date': start_date}]
+
+class TestIncrementalSync(unittest.TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.config_manager = ConfigManager(os.path.join(self.config_dir, 'config.json'))
+        self.config_manager.add_data_source(
+            'recording_main', 'recording_source',
+            {'access_token': 'test_token'}, {'lookback_days': 3}
+        )
+        DataSourceFactory.register('recording_source', RangeRecordingSource)
+        RangeRecordingSource.requested_ranges = []
+        RangeRecordingSource.fail = False
+        self.sync = IncrementalSync(self.config_manager)
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def test_first_run_uses_initial_start_and_sets_watermark(self):
+        self.sync.run('recording_main', ['clicks'], ['campaign'],
+                      end_date=datetime(2023, 1, 31), initial_start_date=datetime(2023, 1, 1))
+        self.assertEqual(RangeRecordingSource.requested_ranges,
+                         [(datetime(2023, 1, 1), datetime(2023, 1, 31))])
+        # 水位线持久化在 config.json 同目录
+        reloaded = SyncStateManager(os.path.join(self.config_dir, 'sync_state.json'))
+        self.assertEqual(
+            reloaded.get_watermark('recording_main', metric_set_key(['clicks'], ['campaign'])),
+            datetime(2023, 1, 31)
+        )
+
+    def test_next_run_fetches_after_watermark_with_lookback(self):
+        self.sync.run('recording_main', ['clicks'], ['campaign'],
+                      end_date=datetime(2023, 1, 31), initial_start_date=datetime(2023, 1, 1))
+        self.sync.run('recording_main', ['clicks'], ['campaign'], end_date=datetime(2023, 2, 2, 15, 30))
+        self.assertEqual(RangeRecordingSource.requested_ranges[-1],
+                         (datetime(2023, 1, 29), datetime(2023, 2, 2)))
+
+    def test_watermarks_are_per_metric_set(self):
+        self.sync.run('recording_main', ['clicks'], ['campaign'],
+                      end_date=datetime(2023, 1, 31), initial_start_date=datetime(2023, 1, 1))
+        with self.assertRaises(ValueError):
+            self.sync.plan_range('recording_main', ['spend'], ['campaign'], datetime(2023, 2, 1))
+        self.assertEqual(
+            self.sync.plan_range('recording_main', ['clicks'], ['campaign'], datetime(2023, 2, 1)),
+            (datetime(2023, 1, 29), datetime(2023, 2, 1))
+        )
+
+    def test_failed_run_keeps_watermark(self):
+        self.sync.run('recording_main', ['clicks'], ['campaign'],
+                      end_date=datetime(2023, 1, 31), initial_start_date=datetime(2023, 1, 1))
+        RangeRecordingSource.fail = True
+        with self.assertRaises(IOError):
+            self.sync.run('recording_main', ['clicks'], ['campaign'], end_date=datetime(2023, 2, 10))
+        self.assertEqual(
+            self.config_manager.sync_state.get_watermark(
+                'recording_main', metric_set_key(['clicks'], ['campaign'])),
+            datetime(2023, 1, 31)
+        )
+
+    def test_up_to_date_run_fetches_nothing(self):
+        sync = IncrementalSync(self.config_manager, lookback_days=0)
+        sync.run('recording_main', ['clicks'], ['campaign'],
+                 end_date=datetime(2023, 1, 31), initial_start_date=datetime(2023, 1, 1))
+        self.assertEqual(sync.run('recording_main', ['clicks'], ['campaign'],
+                                  end_date=datetime(2023, 1, 31)), [])
+        self.assertEqual(len(RangeRecordingSource.requested_ranges), 1)
+
+class CountingSource(MockDataSource):
+    source_type = 'counting_source'
+    date_field = 'date'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.api_calls = []
+
+    def _iter_api_pages(self, start_date, end_date, metrics, dimensions):
+        self.api_calls.append((start_date, end_date))
+        if 'date' not in dimensions:
+            yield [{'clicks': (end_date - start_date).days + 1}]
+            return
+        yield [{'date': day.strftime('%Y-%m-%d'), 'clicks': 1}
+               for day, _ in split_date_range(start_date, end_date, 'day')]
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        ResponseCache._shared = {}
+
+    def _key(self, day, metrics=('clicks',)):
+        return ResponseCache.make_key('facebook_ads', {'account': 'act_1'}, list(metrics), ['ad_id'], day)
+
+    def test_keys_differ_by_query(self):
+        day = datetime(2023, 1, 1)
+        self.assertEqual(self._key(day), self._key(day))
+        self.assertNotEqual(self._key(day), self._key(day, metrics=('spend',)))
+        self.assertNotEqual(self._key(day), self._key(datetime(2023, 1, 2)))
+
+    def test_recent_days_expire_finalized_days_do_not(self):
+        cache = ResponseCache(self.cache_dir, recent_ttl=60, finalized_after_days=28)
+        old_day = datetime.now() - timedelta(days=60)
+        recent_day = datetime.now() - timedelta(days=1)
+        cache.put(self._key(old_day), old_day, [{'clicks': 1}])
+        cache.put(self._key(recent_day), recent_day, [{'clicks': 2}])
+
+        with patch('datahub.core.cache.time.time', return_value=time.time() + 3600):
+            self.assertEqual(cache.get(self._key(old_day)), [{'clicks': 1}])
+            self.assertIsNone(cache.get(self._key(recent_day)))
+
+    def test_decimal_values_round_trip(self):
+        cache = ResponseCache(self.cache_dir)
+        day = datetime(2023, 1, 1)
+        cache.put(self._key(day), day, [{'metrics.cost': Decimal('1.234567')}])
+        self.assertEqual(cache.get(self._key(day)), [{'metrics.cost': Decimal('1.234567')}])
+
+    @patch('datahub.core.cache.time.time', return_value=1700000000.0)
+    def test_lru_eviction(self, mock_time):
+        # 固定写入时间，使每个条目大小一致
+        cache = ResponseCache(self.cache_dir, max_bytes=10 ** 6)
+        days = [datetime(2023, 1, day) for day in range(1, 4)]
+        for offset, day in enumerate(days):
+            cache.put(self._key(day), day, [{'clicks': 1}])
+            path = cache._path(self._key(day))
+            os.utime(path, (1000 + offset, 1000 + offset))
+        # 访问最早的条目，使其成为最近使用
+        self.assertIsNotNone(cache.get(self._key(days[0])))
+
+        cache.max_bytes = 2 * os.path.getsize(cache._path(self._key(days[0])))
+        cache.put(self._key(datetime(2023, 1, 4)), datetime(2023, 1, 4), [{'clicks': 1}])
+
+        self.assertIsNotNone(cache.get(self._key(days[0])))
+        self.assertIsNone(cache.get(self._key(days[1])))
+        self.assertIsNone(cache.get(self._key(days[2])))
+
+    def test_source_serves_cached_days_without_api_calls(self):
+        config = DataSourceConfig({}, {'cache_dir': self.cache_dir})
+        source = CountingSource(config)
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 3), ['clicks'], ['date']))
+        self.assertEqual(len(rows), 3)
+        # 连续缺失的日期合并为一次请求
+        self.assertEqual(source.api_calls, [(datetime(2023, 1, 1), datetime(2023, 1, 3))])
+
+        source = CountingSource(config)
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 4), ['clicks'], ['date']))
+        self.assertEqual([row['date'] for row in rows],
+                         ['2023-01-01', '2023-01-02', '2023-01-03', '2023-01-04'])
+        self.assertEqual(source.api_calls, [(datetime(2023, 1, 4), datetime(2023, 1, 4))])
+
+    def test_cached_day_splits_missing_runs(self):
+        config = DataSourceConfig({}, {'cache_dir': self.cache_dir})
+        list(CountingSource(config).iter_rows(datetime(2023, 1, 3), datetime(2023, 1, 3), ['clicks'], ['date']))
+
+        source = CountingSource(config)
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 5), ['clicks'], ['date']))
+        self.assertEqual([row['date'] for row in rows],
+                         ['2023-01-01', '2023-01-02', '2023-01-03', '2023-01-04', '2023-01-05'])
+        self.assertEqual(source.api_calls, [(datetime(2023, 1, 1), datetime(2023, 1, 2)),
+                                            (datetime(2023, 1, 4), datetime(2023, 1, 5))])
+        # 每天单独缓存，之后的任意子区间都不再请求
+        list(source.iter_rows(datetime(2023, 1, 2), datetime(2023, 1, 4), ['clicks'], ['date']))
+        self.assertEqual(len(source.api_calls), 2)
+
+    def test_non_daily_query_is_cached_per_range(self):
+        config = DataSourceConfig({}, {'cache_dir': self.cache_dir})
+        source = CountingSource(config)
+        # 未按天分组的查询按整个区间缓存，不拆分成逐日请求
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 31), ['clicks'], []))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(source.api_calls, [(datetime(2023, 1, 1), datetime(2023, 1, 31))])
+
+        self.assertEqual(len(list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 31), ['clicks'], []))), 1)
+        self.assertEqual(len(source.api_calls), 1)
+        list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 30), ['clicks'], []))
+        self.assertEqual(source.api_calls[-1], (datetime(2023, 1, 1), datetime(2023, 1, 30)))
+
+class CursorSource(MockDataSource):
+    """Pages 0..4 addressed by an integer cursor; fails once at fail_at"""
+    source_type = 'cursor_source'
+    date_field = 'date'
+
+    def __init__(self, config, fail_at=None, cursors=True):
+        super().__init__(config)
+        self.fail_at = fail_at
+        self.cursors = cursors
+        self.requested = []
+
+    def _iter_api_pages(self, start_date, end_date, metrics, dimensions):
+        resume = self._resume_cursor()
+        page = resume['page'] if resume else 0
+        while page is not None:
+            self.requested.append(page)
+            if page == self.fail_at:
+                self.fail_at = None
+                raise ConnectionError('connection reset')
+            next_page = page + 1 if page < 4 else None
+            if self.cursors:
+                self._next_cursor({'page': next_page})
+            yield [{'page': page, 'cost': Decimal('0.5')}]
+            page = next_page
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = DataSourceConfig({}, {'checkpoint_dir': self.directory})
+        self.start, self.end = datetime(2023, 1, 1), datetime(2023, 1, 31)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        CheckpointStore._shared = {}
+
+    def test_resume_after_failure_refetches_one_page(self):
+        source = CursorSource(self.config, fail_at=3)
+        with self.assertRaises(ConnectionError):
+            list(source.iter_rows(self.start, self.end, ['cost'], []))
+        self.assertEqual(len(source.checkpoints.pending()), 1)
+
+        rows = list(source.iter_rows(self.start, self.end, ['cost'], []))
+
+        # 前三页从 spool 回放，只有失败的那一页和之后的页重新请求
+        self.assertEqual([row['page'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(rows[0]['cost'], Decimal('0.5'))
+        self.assertEqual(source.requested, [0, 1, 2, 3, 3, 4])
+        self.assertEqual(source.checkpoints.pending(), {})
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'spool')), [])
+
+    def test_sharded_retry_resumes_window(self):
+        self.config.settings['shard_retry_backoff'] = 0
+        source = CursorSource(self.config, fail_at=2)
+        rows = source.fetch_data_sharded(self.start, self.end, ['cost'], ['date'], window='week')
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(source.requested.count(0), 5)
+        self.assertEqual(source.requested.count(2), 6)
+
+    def test_uncommitted_page_is_dropped_from_spool(self):
+        source = CursorSource(self.config)
+        pages = source.iter_pages(self.start, self.end, ['cost'], [])
+        next(pages)
+        next(pages)
+        key = next(iter(source.checkpoints.pending()))
+        # 模拟在写入 spool 之后、保存 checkpoint 之前崩溃
+        with open(source.checkpoints.spool_path(key), 'ab') as f:
+            f.write(b'[{"page": 99}]\n')
+
+        resumed = CursorSource(self.config)
+        rows = list(resumed.iter_rows(self.start, self.end, ['cost'], []))
+        self.assertEqual([row['page'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(resumed.requested, [2, 3, 4])
+
+    def test_stale_and_non_resumable_pulls_start_over(self):
+        clock = FakeClock()
+        store = CheckpointStore(self.directory, max_age=60, clock=clock)
+        key = store.make_key('cursor_source', {}, ['cost'], [], self.start, self.end)
+        session = store.open(key, self.start, self.end)
+        session.pending_cursor = {'page': 1}
+        session.commit([{'page': 0}])
+        self.assertTrue(store.open(key, self.start, self.end).resumed)
+        clock.now += 61
+        self.assertFalse(store.open(key, self.start, self.end).resumed)
+
+        source = CursorSource(self.config, fail_at=2, cursors=False)
+        with self.assertRaises(ConnectionError):
+            list(source.iter_rows(self.start, self.end, ['cost'], []))
+        self.assertEqual(source.checkpoints.pending(), {})
+
+    def test_sqlite_storage(self):
+        self.config.settings['checkpoint_storage'] = 'sqlite'
+        source = CursorSource(self.config, fail_at=4)
+        with self.assertRaises(ConnectionError):
+            list(source.iter_rows(self.start, self.end, ['cost'], []))
+        record = next(iter(source.checkpoints.pending().values()))
+        self.assertEqual((record['pages'], record['cursor']), (4, {'page': 4}))
+        self.assertEqual(len(list(source.iter_rows(self.start, self.end, ['cost'], []))), 5)
+
+class TestColumnarBatch(unittest.TestCase):
+    def setUp(self):
+        self.rows = [
+            {'campaign_name': 'A', 'ad_id': '101', 'impressions': '10', 'spend': '1.50'},
+            {'campaign_name': 'B', 'ad_id': '102', 'impressions': '20', 'spend': None},
+            {'campaign_name': 'A', 'ad_id': None, 'impressions': '5', 'spend': '2'},
+        ]
+
+    def test_typed_columns_and_interned_dimensions(self):
+        batch = ColumnarBatch.from_rows(self.rows, dimensions=['ad_id'])
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.field_type('impressions'), 'int64')
+        self.assertEqual(batch.field_type('spend'), 'float64')
+        self.assertEqual(batch.field_type('ad_id'), 'string')
+        self.assertEqual(batch.columns['campaign_name'].categories, ['A', 'B'])
+        self.assertEqual(list(batch.columns['campaign_name'].codes), [0, 1, 0])
+        self.assertEqual(batch.column('ad_id'), ['101', '102', None])
+        self.assertEqual(batch.column('impressions'), [10, 20, 5])
+
+    def test_fallback_without_numpy(self):
+        with patch('datahub.core.columnar.np', None):
+            batch = ColumnarBatch.from_rows(self.rows)
+            merged = ColumnarBatch.concat([batch, batch])
+        self.assertEqual(batch.columns['impressions'].typecode, 'q')
+        self.assertEqual(merged.column('impressions'), [10, 20, 5, 10, 20, 5])
+        self.assertEqual(merged.column('campaign_name'), ['A', 'B', 'A'] * 2)
+
+    def test_concat_merges_categories(self):
+        first = ColumnarBatch.from_rows(self.rows[:2])
+        second = ColumnarBatch.from_rows([{'campaign_name': 'C', 'impressions': 1, 'spend': 0.5}])
+        merged = ColumnarBatch.concat([first, second])
+        self.assertEqual(len(merged), 3)
+        self.assertEqual(merged.column('campaign_name'), ['A', 'B', 'C'])
+        self.assertEqual(merged.column('ad_id'), ['101', '102', None])
+        self.assertEqual(merged.column('impressions'), [10, 20, 1])
+
+    def test_nested_fields_are_json_encoded(self):
+        # Facebook insights 的 actions 字段是字典列表
+        rows = [
+            {'ad_id': '1', 'actions': [{'action_type': 'link_click', 'value': '3'},
+                                       {'action_type': 'purchase', 'value': '1'}]},
+            {'ad_id': '2', 'actions': [{'value': '1', 'action_type': 'purchase'}]},
+            {'ad_id': '3', 'actions': None},
+        ]
+        batch = ColumnarBatch.from_rows(rows, dimensions=['ad_id'])
+        self.assertEqual(batch.field_type('actions'), 'string')
+        actions = batch.column('actions')
+        self.assertEqual(json.loads(actions[0])[0], {'action_type': 'link_click', 'value': '3'})
+        self.assertEqual(actions[1], '[{"action_type":"purchase","value":"1"}]')
+        self.assertIsNone(actions[2])
+
+    def test_to_pandas_and_arrow(self):
+        batch = ColumnarBatch.from_rows(self.rows, dimensions=['ad_id'])
+        try:
+            frame = batch.to_pandas()
+        except ImportError:
+            self.skipTest('pandas not installed')
+        self.assertEqual(str(frame['campaign_name'].dtype), 'category')
+        self.assertEqual(frame['impressions'].sum(), 35)
+
+        try:
+            table = batch.to_arrow()
+        except ImportError:
+            self.skipTest('pyarrow not installed')
+        self.assertEqual(table.column('ad_id').to_pylist(), ['101', '102', None])
+        self.assertEqual(table.column('spend').null_count, 1)
+
+    def test_source_iter_batches(self):
+        source = MockDataSource(DataSourceConfig({}, {}))
+        batch = source.fetch_columnar(datetime(2023, 1, 1), datetime(2023, 1, 1), ['metric1'], ['dimension1'])
+        self.assertEqual(batch.column('metric1'), [100])
+        self.assertEqual(batch.field_type('dimension1'), 'string')
+
+class TestRollup(unittest.TestCase):
+    def setUp(self):
+        self.facebook_rows = [
+            {'date_start': '2023-01-01', 'campaign_id': '1', 'impressions': '1000', 'clicks': '10', 'spend': '5.00'},
+            {'date_start': '2023-01-01', 'campaign_id': '1', 'impressions': '1000', 'clicks': '30', 'spend': '15.00'},
+            {'date_start': '2023-01-02', 'campaign_id': '2', 'impressions': '0', 'clicks': '0', 'spend': '0'},
+        ]
+        self.google_rows = [
+            {'segments.date': '2023-01-01', 'campaign.id': 1, 'metrics.impressions': 500,
+             'metrics.clicks': 5, 'metrics.cost_micros': 2500000, 'metrics.cost': Decimal('2.5')},
+        ]
+
+    def test_sums_and_ratios_across_sources(self):
+        rollup = Rollup(('date', 'campaign_id'))
+        self.assertEqual(rollup.update('facebook_ads', self.facebook_rows), ['2023-01-01', '2023-01-02'])
+        rollup.update('google_ads', self.google_rows)
+
+        first, second = rollup.to_rows()
+        self.assertEqual((first['date'], first['campaign_id']), ('2023-01-01', '1'))
+        self.assertEqual((first['impressions'], first['clicks']), (2500, 45))
+        self.assertAlmostEqual(first['cost'], 22.5)
+        self.assertAlmostEqual(first['ctr'], 0.018)
+        self.assertAlmostEqual(first['cpc'], 0.5)
+        self.assertAlmostEqual(first['cpm'], 9.0)
+        # 分母为零时比率为 NaN
+        self.assertTrue(math.isnan(second['ctr']))
+
+        by_source = Rollup(('source_type',))
+        by_source.update('facebook_ads', self.facebook_rows)
+        by_source.update('google_ads', self.google_rows)
+        self.assertEqual({row['source_type']: row['clicks'] for row in by_source.to_rows()},
+                         {'facebook_ads': 40, 'google_ads': 5})
+
+    def test_refetched_day_replaces_only_that_day(self):
+        rollup = Rollup(('campaign_id',))
+        rollup.update('facebook_ads', self.facebook_rows)
+        rollup.update('google_ads', self.google_rows)
+
+        restated = [{'date_start': '2023-01-01', 'campaign_id': '1', 'impressions': '3000', 'clicks': '50', 'spend': '30'}]
+        with patch.object(rollup, '_group', wraps=rollup._group) as group:
+            self.assertEqual(rollup.update('facebook_ads', restated), ['2023-01-01'])
+        # 只聚合新拉取的页面，不重新计算历史
+        self.assertEqual(group.call_count, 1)
+        self.assertEqual(len(group.call_args.args[0]), 1)
+
+        rows = {row['campaign_id']: row for row in rollup.to_rows()}
+        self.assertEqual(rows['1']['clicks'], 55)
+        self.assertEqual(rows['2']['impressions'], 0)
+        self.assertEqual(rollup.days('facebook_ads'), ['2023-01-01', '2023-01-02'])
+        self.assertEqual([row['campaign_id'] for row in rollup.to_rows(start_date='2023-01-02')], ['2'])
+        self.assertEqual(rollup.to_rows(source_types=['google_ads'])[0]['clicks'], 5)
+
+    def test_only_mapped_fields_are_converted(self):
+        rows = [dict(row, actions=[{'action_type': 'purchase', 'value': '1'}], adset_name='x')
+                for row in self.facebook_rows]
+        rollup = Rollup(('date', 'campaign_id'))
+        with patch.object(ColumnarBatch, 'from_rows', wraps=ColumnarBatch.from_rows) as from_rows:
+            rollup.update('facebook_ads', rows)
+        self.assertEqual(from_rows.call_args.kwargs['fields'],
+                         ['date_start', 'campaign_id', 'account_id', 'date_stop', 'impressions', 'clicks', 'spend'])
+        self.assertEqual(rollup.to_rows()[0]['clicks'], 40)
+
+    def test_accounts_of_one_platform_add_up(self):
+        rollup = Rollup(('date',))
+        account_a = [dict(row, account_id='act_a') for row in self.facebook_rows]
+        account_b = [{'date_start': '2023-01-01', 'account_id': 'act_b', 'campaign_id': '9',
+                      'impressions': '100', 'clicks': '7', 'spend': '1'}]
+        rollup.update('facebook_ads', account_a)
+        rollup.update('facebook_ads', account_b)
+        self.assertEqual(rollup.to_rows()[0]['clicks'], 47)
+        # 重新拉取某个账户只替换该账户的当天结果
+        rollup.update('facebook_ads', [dict(account_b[0], clicks='8')])
+        self.assertEqual(rollup.to_rows()[0]['clicks'], 48)
+        # 行中没有账户字段时，可以由调用方指定范围
+        rollup.update('facebook_ads', self.facebook_rows[:1], scope='act_c')
+        self.assertEqual(rollup.to_rows()[0]['clicks'], 58)
+
+    def test_range_rows_are_rejected(self):
+        rollup = Rollup(('date',))
+        rows = [dict(row, date_stop='2023-01-07') for row in self.facebook_rows]
+        with self.assertRaises(ValueError):
+            rollup.update('facebook_ads', rows)
+        self.assertEqual(rollup.days(), [])
+        rollup.update('facebook_ads', [dict(row, date_stop=row['date_start']) for row in self.facebook_rows])
+        self.assertEqual(rollup.days(), ['2023-01-01', '2023-01-02'])
+
+    def test_pages_of_one_day_are_combined(self):
+        rollup = Rollup(('date',))
+        rollup.update_pages('facebook_ads', [self.facebook_rows[:1], self.facebook_rows[1:]])
+        self.assertEqual(rollup.to_rows()[0]['clicks'], 40)
+
+    def test_persisted_partials(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for storage in ('json', 'sqlite'):
+                rollup = Rollup.open(directory, ('date', 'campaign_id'), storage=storage)
+                rollup.update('facebook_ads', self.facebook_rows)
+                reopened = Rollup.open(directory, ('date', 'campaign_id'), storage=storage)
+                self.assertEqual(reopened.days(), ['2023-01-01', '2023-01-02'])
+                self.assertEqual(reopened.to_rows()[0]['clicks'], 40)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_invalid_group_by(self):
+        with self.assertRaises(ValueError):
+            Rollup(('clicks',))
+
+class LookbackSource(MockDataSource):
+    source_type = 'lookback_source'
+    date_field = 'date'
+
+    def __init__(self, config, pages):
+        super().__init__(config)
+        self.pages = pages
+
+    def _iter_api_pages(self, start_date, end_date, metrics, dimensions):
+        yield from self.pages
+
+class TestKeyedRowStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = KeyedRowStore(os.path.join(self.directory, 'rows.db'))
+        self.rows = [
+            {'date': '2023-01-01', 'campaign_id': '1', 'cost': Decimal('1.50'), 'clicks': 10},
+            {'date': '2023-01-01', 'campaign_id': '2', 'cost': Decimal('2.00'), 'clicks': 20},
+            {'date': '2023-01-02', 'campaign_id': '1', 'cost': Decimal('3.00'), 'clicks': 30},
+        ]
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_only_changed_rows_are_emitted(self):
+        first = self.store.upsert('ns', self.rows, ['date', 'campaign_id'], 'date')
+        self.assertEqual((first.inserted, first.updated, first.unchanged), (3, 0, 0))
+
+        # 回溯窗口重新拉取：一行数值变化，一行新增
+        refetched = [dict(row) for row in self.rows] + [
+            {'date': '2023-01-02', 'campaign_id': '2', 'cost': Decimal('0.10'), 'clicks': 1}]
+        refetched[0]['clicks'] = 12
+        second = self.store.upsert_pages('ns', [refetched[:2], refetched[2:]], ['date', 'campaign_id'], 'date')
+        self.assertEqual((second.inserted, second.updated, second.unchanged), (1, 1, 2))
+        self.assertEqual([(row['campaign_id'], row['clicks']) for row in second.changed], [('1', 12), ('2', 1)])
+
+        stored = self.store.rows('ns', datetime(2023, 1, 2), datetime(2023, 1, 2))
+        self.assertEqual(len(stored), 2)
+        self.assertEqual(stored[0]['cost'], Decimal('3.00'))
+        self.assertEqual(self.store.count('other'), 0)
+
+    def test_window_deletes_rows_no_longer_returned(self):
+        self.store.upsert('ns', self.rows, ['date', 'campaign_id'], 'date')
+        result = self.store.upsert('ns', self.rows[:1], ['date', 'campaign_id'], 'date',
+                                   (datetime(2023, 1, 1), datetime(2023, 1, 1)))
+        # 只删除窗口内未再返回的行，窗口外的行保留
+        self.assertEqual([row['campaign_id'] for row in result.deleted], ['2'])
+        self.assertEqual(result.unchanged, 1)
+        self.assertEqual(self.store.count('ns'), 2)
+
+    def test_duplicate_keys_in_pages_keep_last(self):
+        duplicate = dict(self.rows[0], clicks=99)
+        result = self.store.upsert('ns', [self.rows[0], duplicate], ['date', 'campaign_id'], 'date')
+        self.assertEqual(result.inserted, 1)
+        self.assertEqual(self.store.rows('ns')[0]['clicks'], 99)
+
+    def test_source_fetch_changes(self):
+        config = DataSourceConfig({}, {})
+        source = LookbackSource(config, [self.rows[:2], self.rows[2:]])
+        dimensions = ['date', 'campaign_id']
+        self.assertEqual(source.natural_key(['cost'], dimensions), ['date', 'campaign_id'])
+        window = (datetime(2023, 1, 1), datetime(2023, 1, 2))
+        self.assertEqual(len(source.fetch_changes(self.store, *window, ['cost'], dimensions).changed), 3)
+
+        source.pages = [self.rows[:1], [dict(self.rows[2], clicks=31)]]
+        result = source.fetch_changes(self.store, *window, ['cost'], dimensions)
+        self.assertEqual([row['clicks'] for row in result.changed], [31])
+        self.assertEqual([row['campaign_id'] for row in result.deleted], ['2'])
+        # 不同的查询使用不同的命名空间
+        self.assertEqual(len(source.fetch_changes(self.store, *window, ['clicks'], dimensions).changed), 2)
+        # 未按天分组的查询无法按自然键对齐
+        with self.assertRaises(ValueError):
+            source.fetch_changes(self.store, *window, ['cost'], ['campaign_id'])
+
+class TestSyncScheduler(unittest.TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.config_manager = ConfigManager(os.path.join(self.config_dir, 'config.json'))
+        DataSourceFactory.register('mock_source', MockDataSource)
+        for index in range(3):
+            self.config_manager.add_data_source(
+                f'fb_{index}', 'mock_source',
+                {'ad_account_id': f'act_{index}', 'access_token': 'test_token'},
+                {'metrics': ['clicks'], 'dimensions': ['campaign']}
+            )
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.order = []
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _handler(self, source, job):
+        with self.lock:
+            self.order.append((job.source_id, job.start_date))
+            for key in (job.source_type, job.account_id):
+                self.running[key] = self.running.get(key, 0) + 1
+                self.max_running[key] = max(self.max_running.get(key, 0), self.running[key])
+        time.sleep(0.01)
+        with self.lock:
+            for key in (job.source_type, job.account_id):
+                self.running[key] -= 1
+        return job.start_date
+
+    def test_build_jobs_freshest_window_first(self):
+        scheduler = SyncScheduler(self.config_manager)
+        jobs = scheduler.build_jobs(datetime(2023, 1, 1), datetime(2023, 1, 3), source_ids=['fb_0'])
+        self.assertEqual([job.start_date.day for job in jobs], [3, 2, 1])
+        self.assertEqual([job.priority for job in jobs], [0, 1, 2])
+        self.assertEqual(jobs[0].account_id, 'mock_source:act_0')
+        self.assertEqual(jobs[0].metrics, ['clicks'])
+
+    def test_run_respects_platform_and_account_limits(self):
+        scheduler = SyncScheduler(self.config_manager, platform_limits={'mock_source': 2}, account_limit=1)
+        jobs = scheduler.build_jobs(datetime(2023, 1, 1), datetime(2023, 1, 4))
+        scheduler.run(jobs, handler=self._handler)
+
+        self.assertTrue(all(job.succeeded for job in jobs))
+        self.assertEqual(self.max_running['mock_source'], 2)
+        for index in range(3):
+            self.assertEqual(self.max_running[f'mock_source:act_{index}'], 1)
+        # 最新日期优先，且各账户轮流执行
+        self.assertEqual({day for _, day in self.order[:3]}, {datetime(2023, 1, 4)})
+        self.assertEqual({source_id for source_id, _ in self.order[:3]}, {'fb_0', 'fb_1', 'fb_2'})
+
+    def test_limits_below_one_are_rejected(self):
+        # 限制为 0 时任务永远无法开始，run() 会一直空转
+        for options in ({'account_limit': 0}, {'default_platform_limit': 0},
+                        {'platform_limits': {'mock_source': 0}}):
+            with self.assertRaises(ValueError):
+                SyncScheduler(self.config_manager, **options)
+
+    def test_failed_jobs_are_retried(self):
+        attempts = []
+
+        def flaky_handler(source, job):
+            attempts.append(job.source_id)
+            if job.attempts == 1:
+                raise IOError('transient failure')
+            return 'ok'
+
+        scheduler = SyncScheduler(self.config_manager, max_retries=1)
+        jobs = scheduler.build_jobs(datetime(2023, 1, 1), datetime(2023, 1, 1), source_ids=['fb_0'])
+        scheduler.run(jobs, handler=flaky_handler)
+        self.assertEqual(jobs[0].result, 'ok')
+        self.assertEqual(jobs[0].attempts, 2)
+
+        scheduler = SyncScheduler(self.config_manager, max_retries=0)
+        jobs = scheduler.build_jobs(datetime(2023, 1, 1), datetime(2023, 1, 1), source_ids=['fb_1'])
+        scheduler.run(jobs, handler=flaky_handler)
+        self.assertIsInstance(jobs[0].error, IOError)
+        self.assertFalse(jobs[0].succeeded)
+
+class ValidatingSource(MockDataSource):
+    validations = 0
+
+    def connect(self) -> bool:
+        return self._check_credentials()
+
+    def validate_credentials(self) -> bool:
+        ValidatingSource.validations += 1
+        return self.config.credentials.get('access_token') != 'bad_token'
+
+class TestSourcePool(unittest.TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.config_manager = ConfigManager(os.path.join(self.config_dir, 'config.json'))
+        DataSourceFactory.register('validating_source', ValidatingSource)
+        ValidatingSource.validations = 0
+        self.config_manager.add_data_source('src', 'validating_source', {'access_token': 'tok'}, {})
+        self.clock = FakeClock()
+        self.pool = SourcePool(self.config_manager, validation_ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def test_reuses_connected_instance(self):
+        source = self.pool.get('src')
+        self.assertIs(self.pool.get('src'), source)
+        self.assertEqual(ValidatingSource.validations, 1)
+
+    def test_validation_cached_until_ttl(self):
+        self.pool.get('src')
+        # 新实例，但凭证未变，TTL内不再校验
+        source = self.config_manager.get_data_source('validating_source', 'src')
+        source.validation_cache = self.pool.validation_cache
+        self.assertTrue(source.connect())
+        self.assertEqual(ValidatingSource.validations, 1)
+
+        self.clock.now += 61
+        self.assertTrue(source.connect())
+        self.assertEqual(ValidatingSource.validations, 2)
+
+    def test_credential_change_rebuilds_and_revalidates(self):
+        first = self.pool.get('src')
+        self.config_manager.update_source_credentials('src', {'access_token': 'new_tok'})
+        second = self.pool.get('src')
+        self.assertIsNot(first, second)
+        self.assertEqual(second.config.credentials['access_token'], 'new_tok')
+        self.assertEqual(ValidatingSource.validations, 2)
+
+        self.config_manager.update_source_credentials('src', {'access_token': 'bad_token'})
+        with self.assertRaises(ConnectionError):
+            self.pool.get('src')
+        with self.assertRaises(ConnectionError):
+            self.pool.get('missing')
+
+    def test_get_data_source_does_not_mutate_stored_credentials(self):
+        self.config_manager.token_manager.store_token('src', {'access_token': 'stored'})
+        source = self.config_manager.get_data_source('validating_source', 'src')
+        self.assertEqual(source.config.credentials['access_token'], 'stored')
+        self.assertEqual(self.config_manager.get_source_config('src')['credentials'], {'access_token': 'tok'})
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class TestThrottle(unittest.TestCase):
+    def test_token_bucket_waits_for_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+
+        bucket.block_for(10)
+        self.assertAlmostEqual(bucket.acquire(), 10.5)
+
+    def test_usage_above_threshold_slows_rate(self):
+        limiter = RateLimiter(account_rate=10, slowdown_pct=80, min_rate_fraction=0.1)
+        limiter.observe_usage('account', 'act_1', 50)
+        self.assertEqual(limiter.bucket('account', 'act_1').rate, 10)
+        limiter.observe_usage('account', 'act_1', 90)
+        self.assertAlmostEqual(limiter.bucket('account', 'act_1').rate, 5)
+        limiter.observe_usage('account', 'act_1', 100)
+        self.assertAlmostEqual(limiter.bucket('account', 'act_1').rate, 1)
+
+    def test_parse_facebook_usage_headers(self):
+        usage = parse_facebook_usage({
+            'X-App-Usage': json.dumps({'call_count': 12, 'total_time': 30, 'total_cputime': 5}),
+            'X-Business-Use-Case-Usage': json.dumps({'1234': [{
+                'type': 'ads_insights', 'call_count': 95, 'total_time': 20,
+                'total_cputime': 10, 'estimated_time_to_regain_access': 2
+            }]})
+        })
+        self.assertEqual(usage, {'app_pct': 30.0, 'account_pct': 95.0, 'regain_seconds': 120})
+        self.assertEqual(parse_facebook_usage({}), {})
+
+    def test_parse_google_retry_delay(self):
+        body = {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED', 'details': [{
+            'errors': [{
+                'errorCode': {'quotaError': 'RESOURCE_EXHAUSTED'},
+                'details': {'quotaErrorDetails': {'rateScope': 'ACCOUNT', 'retryDelay': '27s'}}
+            }]
+        }]}}
+        self.assertEqual(parse_google_retry_delay(body), 27.0)
+        self.assertIsNone(parse_google_retry_delay({'error': {'code': 400}}))
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.collector = MetricsCollector()
+        self.clock = FakeClock()
+        config = DataSourceConfig({'access_token': 'test_token'}, {'instrumentation': self.collector})
+        self.source = MockDataSource(config)
+        self.source.transport = Mock()
+        self.source.base_url = 'https://graph.example.com/v12.0'
+        self.source.throttle = RateLimiter(clock=self.clock, sleep=self.clock.sleep)
+
+    def test_endpoint_name(self):
+        base_url = 'https://graph.example.com/v12.0'
+        self.assertEqual(endpoint_name(f'{base_url}/act_123/insights?after=abc', base_url), '/{id}/insights')
+        self.assertEqual(endpoint_name('https://ads.example.com/v9/customers/42/googleAds:search'),
+                         '/v9/customers/{id}/googleAds:search')
+
+    def test_rows_and_pages_are_counted(self):
+        rows = list(self.source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 1), ['m'], ['d']))
+        self.assertEqual(len(rows), 1)
+        snapshot = self.collector.snapshot()
+        self.assertEqual(snapshot['datahub_rows_total'], {('MockDataSource', '', 'false'): 1})
+        self.assertEqual(snapshot['datahub_page_rows'][('MockDataSource', '')]['count'], 1)
+
+    def test_requests_retries_and_throttle_events(self):
+        limited = Mock(status_code=429, headers={'Retry-After': '2'})
+        ok = Mock(status_code=200, headers={'Content-Length': '2048'})
+        self.source.transport.get.side_effect = [limited, ok]
+
+        self.assertIs(self.source._get(f'{self.source.base_url}/act_1/insights'), ok)
+        snapshot = self.collector.snapshot()
+        self.assertEqual(snapshot['datahub_requests_total'], {
+            ('MockDataSource', '', '/{id}/insights', 'GET', '429'): 1,
+            ('MockDataSource', '', '/{id}/insights', 'GET', '200'): 1,
+        })
+        self.assertEqual(snapshot['datahub_retries_total'], {('MockDataSource', '', 'rate_limit'): 1})
+        self.assertEqual(snapshot['datahub_throttle_seconds_total'][('MockDataSource', '', 'pause')], 2.0)
+        self.assertEqual(snapshot['datahub_response_bytes'][('MockDataSource', '', '/{id}/insights')]['count'], 1)
+
+        text = self.collector.to_prometheus()
+        self.assertIn('# TYPE datahub_request_duration_seconds histogram', text)
+        self.assertIn('datahub_requests_total{source="MockDataSource",account="",'
+                      'endpoint="/{id}/insights",method="GET",status="429"} 1', text)
+        self.assertIn('datahub_response_bytes_bucket{source="MockDataSource",account="",'
+                      'endpoint="/{id}/insights",le="10240"} 1', text)
+
+    def test_failed_request_and_default_hooks(self):
+        self.source._hooks = None
+        set_default_hooks(self.collector)
+        self.addCleanup(set_default_hooks, None)
+        self.source.transport.get.side_effect = ConnectionError('down')
+        with self.assertRaises(ConnectionError):
+            self.source._get(f'{self.source.base_url}/me')
+        self.assertEqual(self.collector.snapshot()['datahub_requests_total'],
+                         {('MockDataSource', '', '/me', 'GET', 'error'): 1})
+
+    def test_tracing_spans(self):
+        tracer = Mock()
+        hooks = CompositeHooks(self.collector, TracingHooks(tracer))
+        self.source._hooks = hooks
+        self.source.transport.get.return_value = Mock(status_code=200, headers={})
+        self.source._get(f'{self.source.base_url}/me')
+
+        tracer.start_span.assert_called_once()
+        self.assertEqual(tracer.start_span.call_args[0][0], 'GET /me')
+        span = tracer.start_span.return_value
+        span.set_attribute.assert_called_with('http.status_code', '200')
+        span.end.assert_called_once()
+
+class TestIterJsonArray(unittest.TestCase):
+    def test_decodes_elements_across_chunk_boundaries(self):
+        payload = [{'results': [{'name': 'caf\u00e9 ]},', 'value': i}]} for i in range(20)]
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        for size in (1, 5, 64, len(body)):
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            self.assertEqual(list(iter_json_array(chunks)), payload)
+
+    def test_numbers_split_between_chunks(self):
+        self.assertEqual(list(iter_json_array([b'[1, 2', b'3, 4]'])), [1, 23, 4])
+        self.assertEqual(list(iter_json_array([b'  [ ]'])), [])
+
+    def test_rejects_non_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"results": []}']))
+
+    def test_rejects_truncated_body(self):
+        # 截断的响应不能被当作完整结果
+        for chunks in ([b'[{"results":[1]},'], [b'[1, 2'], [b'['], [b'']):
+            with self.assertRaises(ValueError):
+                list(iter_json_array(chunks))
+        for body in (b'{"data":[{"a":1},{"a":2}', b'{"data":[1],"paging":', b'{"data":[1]'):
+            with self.assertRaises(ValueError):
+                list(iter_json_object_array([body], 'data'))
+
+    def test_rejects_trailing_data(self):
+        self.assertEqual(list(iter_json_array([b'[1]', b' \n'])), [1])
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[1]', b' x']))
+        with self.assertRaises(ValueError):
+            list(iter_json_object_array([b'{"data":[1]}{"data":[2]}'], 'data'))
+
+class TestJsonDecoders(unittest.TestCase):
+    def test_get_decoder(self):
+        self.assertIsInstance(get_decoder('json'), JsonDecoder)
+        self.assertIs(get_decoder('auto'), get_decoder('auto'))
+        self.assertIn(get_decoder('auto').name, ('orjson', 'msgspec', 'json'))
+        self.assertEqual(get_decoder('auto').loads(b'{"a": [1, 2.5, "x"]}'), {'a': [1, 2.5, 'x']})
+        with self.assertRaises(ValueError):
+            get_decoder('yaml')
+
+    def test_object_array_across_chunk_boundaries(self):
+        payload = {'data': [{'name': 'caf\u00e9 ]},{', 'value': i} for i in range(20)],
+                   'paging': {'cursors': {'after': 'x'}, 'count': 12345}}
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        for size in (1, 7, len(body)):
+            rest = {}
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            self.assertEqual(list(iter_json_object_array(chunks, 'data', rest)), payload['data'])
+            self.assertEqual(rest, {'paging': payload['paging']})
+
+    def test_object_array_members_in_any_order(self):
+        rest = {}
+        rows = list(iter_json_object_array([b'{"nextPageToken": "t", "results": [1, 2], "fieldMask": "a"}'],
+                                           'results', rest))
+        self.assertEqual(rows, [1, 2])
+        self.assertEqual(rest, {'nextPageToken': 't', 'fieldMask': 'a'})
+        self.assertEqual(list(iter_json_object_array([b'{}'], 'results')), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_object_array([b'[1]'], 'results'))
+
 if __name__ == '__main__':
     unittest.main()
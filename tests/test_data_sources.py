@@ -1,10 +1,35 @@
 import unittest
 from unittest.mock import Mock, patch
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
 from datahub.core.data_source import DataSourceConfig
 from datahub.sources.google_ads import GoogleAdsSource
+from datahub.sources.google_ads_schema import compile_flattener
+from datahub.sources.gaql_planner import choose_resource, plan_queries, split_rows
+from datahub.core.columnar import ColumnarBatch
+from datahub.core.normalization import SchemaNormalizer, CANONICAL_SCHEMA
+from datahub.core.throttle import RateLimiter
+from datahub.core.cache import ResponseCache
+from datahub.core.checkpoint import CheckpointStore
+from datahub.core.row_store import KeyedRowStore
 from datahub.sources.facebook_ads import FacebookAdsSource
 
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
 class TestGoogleAdsSource(unittest.TestCase):
     def setUp(self):
         self.config = DataSourceConfig(
@@ -16,10 +41,13 @@ class TestGoogleAdsSource(unittest.TestCase):
                 'api_version': 'v9'
             }
         )
-        self.source = GoogleAdsSource(self.config)
+        self.transport = Mock()
+        self.source = GoogleAdsSource(self.config, transport=self.transport)
+        # 模拟已连接状态
+        self.source.token = 'test_token'
 
-    @patch('requests.get')
-    def test_validate_credentials(self, mock_get):
+    def test_validate_credentials(self):
+        mock_get = self.transport.get
         # 模拟成功的API响应
         mock_response = Mock()
         mock_response.status_code = 200
@@ -36,8 +64,18 @@ class TestGoogleAdsSource(unittest.TestCase):
             'Bearer test_token'
         )
 
-    @patch('requests.get')
-    def test_fetch_data(self, mock_get):
+    def test_base_url_setting(self):
+        # 基准测试通过 base_url 指向本地模拟服务
+        config = DataSourceConfig(self.config.credentials, {'base_url': 'http://127.0.0.1:8765/google'})
+        source = GoogleAdsSource(config, transport=self.transport)
+        self.transport.get.return_value = Mock(status_code=200)
+        source.token = 'test_token'
+        self.assertTrue(source.validate_credentials())
+        self.assertEqual(self.transport.get.call_args[0][0],
+                         'http://127.0.0.1:8765/google/customers/test_customer')
+
+    def test_fetch_data(self):
+        mock_post = self.transport.post
         # 模拟API响应数据
         mock_response = Mock()
         mock_response.status_code = 200
@@ -52,7 +90,7 @@ class TestGoogleAdsSource(unittest.TestCase):
                 }
             ]
         }
-        mock_get.return_value = mock_response
+        mock_post.return_value = mock_response
 
         # 执行数据获取
         start_date = datetime(2023, 1, 1)
@@ -76,6 +114,134 @@ class TestGoogleAdsSource(unittest.TestCase):
         self.assertEqual(results[0]['metrics.clicks'], 100)
         self.assertEqual(results[0]['metrics.impressions'], 1000)
 
+    def test_fetch_data_follows_next_page_token(self):
+        first_response = Mock()
+        first_response.json.return_value = {
+            'results': [{'campaign': {'name': 'Campaign 1'}}],
+            'nextPageToken': 'token-2'
+        }
+        second_response = Mock()
+        second_response.json.return_value = {
+            'results': [{'campaign': {'name': 'Campaign 2'}}]
+        }
+        self.transport.post.side_effect = [first_response, second_response]
+
+        results = self.source.fetch_data(
+            start_date=datetime(2023, 1, 1),
+            end_date=datetime(2023, 1, 31),
+            metrics=['metrics.clicks'],
+            dimensions=['campaign.name']
+        )
+
+        self.assertEqual([row['campaign.name'] for row in results], ['Campaign 1', 'Campaign 2'])
+        first_call, second_call = self.transport.post.call_args_list
+        self.assertTrue(first_call.args[0].endswith('/googleAds:search'))
+        self.assertNotIn('pageToken', first_call.kwargs['json'])
+        self.assertEqual(second_call.kwargs['json']['pageToken'], 'token-2')
+        self.assertEqual(second_call.kwargs['json']['query'], first_call.kwargs['json']['query'])
+
+    def test_fetch_data_search_stream(self):
+        self.config.settings['query_mode'] = 'stream'
+        body = json.dumps([
+            {'results': [{'campaign': {'name': 'Campaign 1'}, 'metrics': {'clicks': 1}}]},
+            {'results': [{'campaign': {'name': 'Campaign 2'}, 'metrics': {'clicks': 2}}]}
+        ]).encode()
+        mock_response = Mock()
+        # 模拟分块到达的响应体
+        mock_response.iter_content.return_value = [body[i:i + 16] for i in range(0, len(body), 16)]
+        self.transport.post.return_value = mock_response
+
+        pages = list(self.source.iter_pages(
+            datetime(2023, 1, 1), datetime(2023, 1, 31), ['metrics.clicks'], ['campaign.name']
+        ))
+
+        self.assertEqual(pages, [
+            [{'campaign.name': 'Campaign 1', 'metrics.clicks': 1}],
+            [{'campaign.name': 'Campaign 2', 'metrics.clicks': 2}]
+        ])
+        args, kwargs = self.transport.post.call_args
+        self.assertTrue(args[0].endswith('/googleAds:searchStream'))
+        self.assertTrue(kwargs['stream'])
+        mock_response.close.assert_called_once()
+
+    def test_search_stream_failures_raise(self):
+        self.config.settings['query_mode'] = 'stream'
+        first = {'results': [{'campaign': {'name': 'Campaign 1'}, 'metrics': {'clicks': 1}}]}
+        bodies = [
+            # 流中途返回的错误元素
+            json.dumps([first, {'error': {'code': 500, 'message': 'Internal error encountered.'}}]).encode(),
+            # 被截断的响应体
+            json.dumps([first, first]).encode()[:-30],
+        ]
+        for body in bodies:
+            mock_response = Mock()
+            mock_response.iter_content.return_value = [body]
+            self.transport.post.return_value = mock_response
+            pages = self.source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 31),
+                                           ['metrics.clicks'], ['campaign.name'])
+            self.assertEqual(next(pages), [{'campaign.name': 'Campaign 1', 'metrics.clicks': 1}])
+            with self.assertRaises((RuntimeError, ValueError)):
+                next(pages)
+            mock_response.close.assert_called_once()
+
+    def test_quota_error_waits_for_retry_delay(self):
+        clock = FakeClock()
+        sleeps = clock.sleeps
+        self.source.throttle = RateLimiter(clock=clock, sleep=clock.sleep)
+        exhausted = Mock()
+        exhausted.status_code = 429
+        exhausted.headers = {}
+        exhausted.json.return_value = {'error': {'code': 429, 'details': [{'errors': [{
+            'details': {'quotaErrorDetails': {'retryDelay': '15s'}}
+        }]}]}}
+        ok = Mock()
+        ok.status_code = 200
+        ok.json.return_value = {'results': [{'campaign': {'name': 'Campaign 1'}}]}
+        self.transport.post.side_effect = [exhausted, ok]
+
+        rows = list(self.source.iter_rows(
+            datetime(2023, 1, 1), datetime(2023, 1, 1), ['metrics.clicks'], ['campaign.name']
+        ))
+
+        self.assertEqual(rows[0]['campaign.name'], 'Campaign 1')
+        self.assertEqual(self.transport.post.call_count, 2)
+        self.assertAlmostEqual(sum(sleeps), 15, delta=0.1)
+
+class TestGoogleAdsFlattener(unittest.TestCase):
+    def test_nested_fields_and_typed_conversion(self):
+        flatten = compile_flattener((
+            'campaign.id', 'campaign.name', 'ad_group_ad.ad.id', 'segments.date',
+            'metrics.impressions', 'metrics.cost_micros', 'metrics.ctr'
+        ))
+        row = flatten({
+            'campaign': {'resourceName': 'customers/1/campaigns/2', 'id': '2', 'name': 'Brand'},
+            'adGroupAd': {'ad': {'id': '345'}},
+            'segments': {'date': '2023-01-01'},
+            'metrics': {'impressions': '1000', 'costMicros': '1234567', 'ctr': 0.05}
+        })
+        self.assertEqual(row, {
+            'campaign.id': 2,
+            'campaign.name': 'Brand',
+            'ad_group_ad.ad.id': 345,
+            'segments.date': '2023-01-01',
+            'metrics.impressions': 1000,
+            'metrics.cost_micros': 1234567,
+            'metrics.cost': Decimal('1.234567'),
+            'metrics.ctr': 0.05
+        })
+
+    def test_omitted_fields_use_defaults(self):
+        flatten = compile_flattener(('campaign.name', 'metrics.clicks', 'metrics.cost_micros'), False)
+        self.assertEqual(flatten({'campaign': {}}), {
+            'campaign.name': None,
+            'metrics.clicks': 0,
+            'metrics.cost_micros': 0
+        })
+
+    def test_flattener_is_compiled_once_per_query(self):
+        fields = ('campaign.name', 'metrics.clicks')
+        self.assertIs(compile_flattener(fields), compile_flattener(fields))
+
 class TestFacebookAdsSource(unittest.TestCase):
     def setUp(self):
         self.config = DataSourceConfig(
@@ -84,13 +250,17 @@ class TestFacebookAdsSource(unittest.TestCase):
                 'access_token': 'test_token'
             },
             settings={
-                'api_version': 'v12.0'
+                'api_version': 'v12.0',
+                'insights_mode': 'sync'
             }
         )
-        self.source = FacebookAdsSource(self.config)
+        self.transport = Mock()
+        self.source = FacebookAdsSource(self.config, transport=self.transport)
+        # 模拟已连接状态
+        self.source.token = 'test_token'
 
-    @patch('requests.get')
-    def test_validate_credentials(self, mock_get):
+    def test_validate_credentials(self):
+        mock_get = self.transport.get
         # 模拟成功的API响应
         mock_response = Mock()
         mock_response.status_code = 200
@@ -107,8 +277,8 @@ class TestFacebookAdsSource(unittest.TestCase):
             'Bearer test_token'
         )
 
-    @patch('requests.get')
-    def test_fetch_data(self, mock_get):
+    def test_fetch_data(self):
+        mock_get = self.transport.get
         # 模拟API响应数据
         mock_response = Mock()
         mock_response.status_code = 200
@@ -149,8 +319,8 @@ class TestFacebookAdsSource(unittest.TestCase):
         self.assertEqual(results[0]['impressions'], 1000)
         self.assertEqual(results[0]['clicks'], 100)
 
-    @patch('requests.get')
-    def test_fetch_data_with_pagination(self, mock_get):
+    def test_fetch_data_with_pagination(self):
+        mock_get = self.transport.get
         # 模拟带分页的API响应
         first_response = Mock()
         first_response.status_code = 200
@@ -184,5 +354,628 @@ class TestFacebookAdsSource(unittest.TestCase):
         self.assertEqual(results[0]['campaign_name'], 'Campaign 1')
         self.assertEqual(results[1]['campaign_name'], 'Campaign 2')
 
+    def test_iter_pages_is_lazy(self):
+        first_response = Mock()
+        first_response.json.return_value = {
+            'data': [{'campaign_name': 'Campaign 1'}],
+            'paging': {'next': 'https://next.page.url'}
+        }
+        second_response = Mock()
+        second_response.json.return_value = {
+            'data': [{'campaign_name': 'Campaign 2'}, {'campaign_name': 'Campaign 3'}],
+            'paging': {}
+        }
+        self.transport.get.side_effect = [first_response, second_response]
+
+        pages = self.source.iter_pages(
+            datetime(2023, 1, 1), datetime(2023, 1, 31), ['impressions'], ['campaign_name']
+        )
+        self.assertEqual(next(pages), [{'campaign_name': 'Campaign 1'}])
+        # 第二页只有在消费时才请求
+        self.assertEqual(self.transport.get.call_count, 1)
+        self.assertEqual(len(next(pages)), 2)
+        self.assertEqual(self.transport.get.call_count, 2)
+
+    def test_iter_rows_raises_on_http_error(self):
+        failing_response = Mock()
+        failing_response.raise_for_status.side_effect = IOError('429 Too Many Requests')
+        self.transport.get.return_value = failing_response
+
+        rows = self.source.iter_rows(
+            datetime(2023, 1, 1), datetime(2023, 1, 31), ['impressions'], ['campaign_name']
+        )
+        with self.assertRaises(IOError):
+            list(rows)
+        # fetch_data 保持原有行为：记录错误并返回空列表
+        self.assertEqual(self.source.fetch_data(
+            datetime(2023, 1, 1), datetime(2023, 1, 31), ['impressions'], ['campaign_name']
+        ), [])
+
+    def test_usage_headers_slow_down_account(self):
+        self.source.throttle = RateLimiter(account_rate=10, slowdown_pct=75)
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.headers = {
+            'X-Business-Use-Case-Usage': json.dumps({'1': [{'call_count': 95, 'total_time': 10}]})
+        }
+        mock_response.json.return_value = {'data': [], 'paging': {}}
+        self.transport.get.return_value = mock_response
+
+        list(self.source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 1), ['impressions'], []))
+
+        self.assertAlmostEqual(self.source.throttle.bucket('account', 'test_account').rate, 2)
+
+    def test_rate_limit_error_is_retried_not_swallowed(self):
+        clock = FakeClock()
+        sleeps = clock.sleeps
+        self.source.throttle = RateLimiter(clock=clock, sleep=clock.sleep)
+        self.config.settings['throttle_pause'] = 5
+        limited = Mock()
+        limited.status_code = 400
+        limited.headers = {}
+        limited.json.return_value = {'error': {'code': 80000, 'message': 'too many calls'}}
+        ok = Mock()
+        ok.status_code = 200
+        ok.headers = {}
+        ok.json.return_value = {'data': [{'ad_id': '1'}], 'paging': {}}
+        self.transport.get.side_effect = [limited, ok]
+
+        results = self.source.fetch_data(datetime(2023, 1, 1), datetime(2023, 1, 1), ['impressions'], ['ad_id'])
+
+        self.assertEqual(results, [{'ad_id': '1'}])
+        self.assertAlmostEqual(sum(sleeps), 5, delta=0.1)
+
+    def test_cache_keeps_range_aggregates(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(setattr, ResponseCache, '_shared', {})
+        response = Mock()
+        response.status_code = 200
+        response.headers = {}
+        response.json.return_value = {'data': [{'ad_id': '1', 'clicks': '31'}], 'paging': {}}
+        self.transport.get.return_value = response
+        self.config.settings['cache_dir'] = cache_dir
+        self.source = FacebookAdsSource(self.config, transport=self.transport)
+        self.source.token = 'test_token'
+
+        # 未设置 time_increment 时整个区间只请求一次，结果与不使用缓存时一致
+        rows = self.source.fetch_data(datetime(2023, 1, 1), datetime(2023, 1, 31), ['clicks'], ['ad_id'])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(self.transport.get.call_count, 1)
+        self.assertNotIn('time_increment', self.transport.get.call_args.kwargs['params'])
+        self.source.fetch_data(datetime(2023, 1, 1), datetime(2023, 1, 31), ['clicks'], ['ad_id'])
+        self.assertEqual(self.transport.get.call_count, 1)
+
+        # time_increment=1 时每行对应一天，缺失的日期一次请求后按天缓存
+        self.config.settings['time_increment'] = 1
+        response.json.return_value = {'data': [
+            {'date_start': f'2023-01-0{day}', 'date_stop': f'2023-01-0{day}', 'ad_id': '1', 'clicks': '1'}
+            for day in (1, 2, 3)
+        ], 'paging': {}}
+        self.source.fetch_data(datetime(2023, 1, 1), datetime(2023, 1, 3), ['clicks'], ['ad_id'])
+        self.assertEqual(self.transport.get.call_count, 2)
+        self.assertEqual(self.transport.get.call_args.kwargs['params']['time_increment'], 1)
+        rows = self.source.fetch_data(datetime(2023, 1, 2), datetime(2023, 1, 3), ['clicks'], ['ad_id'])
+        self.assertEqual([row['date_start'] for row in rows], ['2023-01-02', '2023-01-03'])
+        self.assertEqual(self.transport.get.call_count, 2)
+
+class TestFacebookAsyncInsights(unittest.TestCase):
+    def setUp(self):
+        self.config = DataSourceConfig(
+            credentials={
+                'ad_account_id': 'act_1',
+                'access_token': 'test_token'
+            },
+            settings={
+                'api_version': 'v12.0'
+            }
+        )
+        self.transport = Mock()
+        self.source = FacebookAdsSource(self.config, transport=self.transport)
+        self.source.token = 'test_token'
+
+    def _json_response(self, payload):
+        response = Mock()
+        response.json.return_value = payload
+        return response
+
+    def test_auto_mode_selection(self):
+        start = datetime(2023, 1, 1)
+        self.assertFalse(self.source._use_async_report(start, datetime(2023, 1, 7), 'ad'))
+        self.assertTrue(self.source._use_async_report(start, datetime(2023, 1, 31), 'ad'))
+        self.assertFalse(self.source._use_async_report(start, datetime(2023, 1, 31), 'campaign'))
+        self.assertFalse(self.source._use_async_report(start, datetime(2023, 12, 31), 'account'))
+
+        self.config.settings['insights_mode'] = 'async'
+        self.assertTrue(self.source._use_async_report(start, datetime(2023, 1, 1), 'account'))
+        self.config.settings['insights_mode'] = 'auto'
+        self.config.settings['async_min_days'] = 3
+        self.assertTrue(self.source._use_async_report(start, datetime(2023, 1, 3), 'account'))
+
+    @patch('datahub.sources.facebook_ads.time.sleep')
+    def test_async_report_flow(self, mock_sleep):
+        self.transport.post.return_value = self._json_response({'report_run_id': 'run_1'})
+        self.transport.get.side_effect = [
+            self._json_response({'async_status': 'Job Running', 'async_percent_completion': 0}),
+            self._json_response({'async_status': 'Job Running', 'async_percent_completion': 50}),
+            self._json_response({'async_status': 'Job Completed', 'async_percent_completion': 100}),
+            self._json_response({
+                'data': [{'ad_id': '1'}],
+                'paging': {'next': 'https://graph.facebook.com/v12.0/run_1/insights?after=x'}
+            }),
+            self._json_response({'data': [{'ad_id': '2'}], 'paging': {}}),
+        ]
+
+        pages = list(self.source.iter_pages(
+            datetime(2023, 1, 1), datetime(2023, 3, 31), ['impressions'], ['ad_id']
+        ))
+
+        self.assertEqual(pages, [[{'ad_id': '1'}], [{'ad_id': '2'}]])
+        post_args, post_kwargs = self.transport.post.call_args
+        self.assertTrue(post_args[0].endswith('/act_1/insights'))
+        self.assertEqual(post_kwargs['data']['level'], 'ad')
+        self.assertEqual(json.loads(post_kwargs['data']['time_range']), {
+            'start_date': '2023-01-01', 'end_date': '2023-03-31'
+        })
+        self.assertTrue(self.transport.get.call_args_list[0].args[0].endswith('/run_1'))
+        self.assertTrue(self.transport.get.call_args_list[3].args[0].endswith('/run_1/insights'))
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('datahub.sources.facebook_ads.time.sleep')
+    def test_async_report_failure_raises(self, mock_sleep):
+        self.config.settings['insights_mode'] = 'async'
+        self.transport.post.return_value = self._json_response({'report_run_id': 'run_1'})
+        self.transport.get.return_value = self._json_response({'async_status': 'Job Failed'})
+
+        with self.assertRaises(RuntimeError):
+            list(self.source.iter_pages(
+                datetime(2023, 1, 1), datetime(2023, 1, 1), ['impressions'], ['ad_id']
+            ))
+
+    @patch('datahub.sources.facebook_ads.time.sleep')
+    def test_poll_interval_backs_off_while_stalled(self, mock_sleep):
+        self.config.settings.update({
+            'async_poll_interval': 1,
+            'async_max_poll_interval': 5
+        })
+        self.transport.get.side_effect = [
+            self._json_response({'async_status': 'Job Not Started'}) for _ in range(4)
+        ] + [self._json_response({'async_status': 'Job Completed'})]
+
+        self.source._wait_for_async_report('run_1', {})
+
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [2, 4, 5, 5])
+
+class TestGaqlPlanner(unittest.TestCase):
+    def setUp(self):
+        self.config = DataSourceConfig(
+            credentials={'customer_id': 'test_customer', 'access_token': 'test_token'},
+            settings={}
+        )
+        self.transport = Mock()
+        self.source = GoogleAdsSource(self.config, transport=self.transport)
+        self.source.token = 'test_token'
+
+    def test_choose_resource(self):
+        self.assertEqual(choose_resource(['segments.date', 'metrics.clicks']), 'customer')
+        self.assertEqual(choose_resource(['campaign.name', 'metrics.clicks']), 'campaign')
+        self.assertEqual(choose_resource(['campaign.id', 'ad_group.name', 'metrics.clicks']), 'ad_group')
+        self.assertEqual(choose_resource(['ad_group_ad.ad.id']), 'ad_group_ad')
+        self.assertEqual(choose_resource(['ad_group_criterion.keyword.text']), 'keyword_view')
+        self.assertEqual(choose_resource(['search_term_view.search_term', 'campaign.id']), 'search_term_view')
+        with self.assertRaises(ValueError):
+            choose_resource(['geographic_view.country_criterion_id', 'ad_group.id'])
+
+    def test_query_selects_from_narrowest_resource(self):
+        response = Mock()
+        response.json.return_value = {'results': []}
+        self.transport.post.return_value = response
+
+        list(self.source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 2),
+                                    ['metrics.clicks'], ['ad_group.name']))
+        self.assertEqual(
+            self.transport.post.call_args.kwargs['json']['query'],
+            "SELECT ad_group.name, metrics.clicks FROM ad_group "
+            "WHERE segments.date BETWEEN '2023-01-01' AND '2023-01-02'"
+        )
+
+        self.config.settings['gaql_resource'] = 'campaign'
+        list(self.source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 2),
+                                    ['metrics.clicks'], ['segments.date']))
+        self.assertIn('FROM campaign WHERE', self.transport.post.call_args.kwargs['json']['query'])
+
+    def test_forced_resource_is_part_of_cache_key(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(setattr, ResponseCache, '_shared', {})
+        response = Mock()
+        response.json.return_value = {'results': [{'campaign': {'id': '1'}}]}
+        self.transport.post.return_value = response
+        queries = []
+        for resource in ('campaign', 'ad_group', 'campaign'):
+            config = DataSourceConfig(self.config.credentials, {'cache_dir': cache_dir, 'gaql_resource': resource})
+            source = GoogleAdsSource(config, transport=self.transport)
+            source.token = 'test_token'
+            list(source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 2), ['metrics.clicks'], ['campaign.id']))
+            queries.append(self.transport.post.call_count)
+        # 更换资源后不会读到旧资源的缓存，切回原资源时命中缓存
+        self.assertEqual(queries, [1, 2, 2])
+
+    def test_plan_merges_requests_with_the_same_grain(self):
+        start, end = datetime(2023, 1, 1), datetime(2023, 1, 7)
+        plan = plan_queries([
+            (start, end, ['metrics.clicks'], ['campaign.id', 'segments.date']),
+            (start, end, ['metrics.cost_micros'], ['campaign.name', 'segments.date']),
+            # 分段不同，行粒度不同，不能合并
+            (start, end, ['metrics.clicks'], ['campaign.id']),
+            (start, datetime(2023, 1, 8), ['metrics.clicks'], ['campaign.id', 'segments.date']),
+            (start, end, ['metrics.impressions'], ['ad_group.id', 'segments.date']),
+        ])
+
+        self.assertEqual(len(plan), 4)
+        merged = plan[0]
+        self.assertEqual(merged.resource, 'campaign')
+        self.assertEqual(merged.fields, ['campaign.id', 'segments.date', 'campaign.name',
+                                         'metrics.clicks', 'metrics.cost_micros'])
+        self.assertEqual([index for index, _ in merged.members], [0, 1])
+        self.assertEqual([query.resource for query in plan[1:]], ['campaign', 'campaign', 'ad_group'])
+
+    def test_split_rows(self):
+        rows = [{'campaign.id': 1, 'metrics.clicks': 5, 'metrics.cost_micros': 2000000,
+                 'metrics.cost': Decimal('2')}]
+        self.assertEqual(split_rows(rows, ['campaign.id', 'metrics.cost_micros']),
+                         [{'campaign.id': 1, 'metrics.cost_micros': 2000000, 'metrics.cost': Decimal('2')}])
+
+    def test_fetch_many_issues_one_query_per_grain(self):
+        response = Mock()
+        response.json.return_value = {'results': [
+            {'campaign': {'id': '1', 'name': 'A'}, 'metrics': {'clicks': '3', 'impressions': '30'}},
+            {'campaign': {'id': '2', 'name': 'B'}, 'metrics': {'clicks': '4', 'impressions': '40'}},
+        ]}
+        self.transport.post.return_value = response
+        start, end = datetime(2023, 1, 1), datetime(2023, 1, 1)
+
+        clicks, impressions = self.source.fetch_many([
+            (start, end, ['metrics.clicks'], ['campaign.id']),
+            (start, end, ['metrics.impressions'], ['campaign.name']),
+        ])
+
+        self.assertEqual(self.transport.post.call_count, 1)
+        self.assertIn('SELECT campaign.id, campaign.name, metrics.clicks, metrics.impressions FROM campaign',
+                      self.transport.post.call_args.kwargs['json']['query'])
+        self.assertEqual(clicks, [{'campaign.id': 1, 'metrics.clicks': 3}, {'campaign.id': 2, 'metrics.clicks': 4}])
+        self.assertEqual(impressions, [{'campaign.name': 'A', 'metrics.impressions': 30},
+                                       {'campaign.name': 'B', 'metrics.impressions': 40}])
+
+class TestFacebookBatchInsights(unittest.TestCase):
+    def setUp(self):
+        self.config = DataSourceConfig(
+            credentials={
+                'ad_account_ids': ['act_%d' % index for index in range(60)],
+                'access_token': 'test_token'
+            },
+            settings={
+                'insights_mode': 'sync',
+                'throttle_account_rate': 1e6,
+                'throttle_app_rate': 1e6,
+                'throttle_burst': 1e6,
+                'throttle_pause': 0
+            }
+        )
+        self.transport = Mock()
+        self.source = FacebookAdsSource(self.config, transport=self.transport)
+        self.source.token = 'test_token'
+
+    def _batch_response(self, results):
+        response = Mock()
+        response.status_code = 200
+        response.headers = {}
+        response.json.return_value = results
+        return response
+
+    def _page(self, rows, next_url=None):
+        body = {'data': rows, 'paging': {'next': next_url} if next_url else {}}
+        return {'code': 200, 'body': json.dumps(body)}
+
+    def _sent_batch(self, call):
+        return [item['relative_url'] for item in json.loads(call.kwargs['data']['batch'])]
+
+    def test_accounts_are_batched_and_paginated(self):
+        def respond(url, **kwargs):
+            results = []
+            for relative_url in [item['relative_url'] for item in json.loads(kwargs['data']['batch'])]:
+                account = relative_url.split('/', 1)[0]
+                if 'after=' in relative_url:
+                    results.append(self._page([{'ad_id': account + '-2'}]))
+                elif account == 'act_0':
+                    # 只有第一个账户有第二页
+                    results.append(self._page([{'ad_id': account + '-1'}],
+                                              'https://graph.facebook.com/v12.0/act_0/insights?after=c1'))
+                else:
+                    results.append(self._page([{'ad_id': account + '-1', 'account_id': '42'}]))
+            return self._batch_response(results)
+        self.transport.post.side_effect = respond
+
+        pages = list(self.source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id']))
+
+        calls = self.transport.post.call_args_list
+        # 第二页搭上剩余账户的批次，共两次调用
+        self.assertEqual([len(self._sent_batch(call)) for call in calls], [50, 11])
+        self.assertTrue(all(call.args[0] == 'https://graph.facebook.com/v12.0/' for call in calls))
+        self.assertEqual(self._sent_batch(calls[1])[-1], 'act_0/insights?after=c1')
+        self.assertEqual(len(pages), 61)
+        self.assertEqual(pages[0], [{'ad_id': 'act_0-1', 'account_id': 'act_0'}])
+        self.assertEqual(pages[1], [{'ad_id': 'act_1-1', 'account_id': '42'}])
+        self.transport.get.assert_not_called()
+
+    def test_levels_and_rate_limited_sub_requests(self):
+        rate_limited = {'code': 400, 'body': json.dumps({'error': {'code': 17, 'message': 'limit'}})}
+        self.transport.post.side_effect = [
+            # 第三个子请求超时（null），第四个结果缺失
+            self._batch_response([self._page([{'n': 1}]), rate_limited, None]),
+            self._batch_response([self._page([{'n': 2}]), self._page([{'n': 3}]), self._page([{'n': 4}])]),
+        ]
+
+        pages = list(self.source.iter_account_pages(
+            datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], [],
+            account_ids=['act_1', 'act_2'], levels=['campaign', 'ad']
+        ))
+
+        self.assertEqual([(account, level) for account, level, _ in pages], [
+            ('act_1', 'campaign'), ('act_1', 'ad'), ('act_2', 'campaign'), ('act_2', 'ad')
+        ])
+        first_batch = self._sent_batch(self.transport.post.call_args_list[0])
+        self.assertEqual(len(first_batch), 4)
+        self.assertTrue(first_batch[1].startswith('act_1/insights?'))
+        self.assertIn('level=ad', first_batch[1])
+        self.assertEqual(self._sent_batch(self.transport.post.call_args_list[1]), first_batch[1:])
+
+    def test_failed_sub_request_raises(self):
+        self.transport.post.return_value = self._batch_response([
+            {'code': 400, 'body': json.dumps({'error': {'code': 100, 'message': 'Invalid field'}})}
+        ])
+        with self.assertRaises(RuntimeError):
+            list(self.source.iter_account_pages(
+                datetime(2023, 1, 1), datetime(2023, 1, 1), ['bogus'], [], account_ids=['act_1']
+            ))
+
+class TestCheckpointResume(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.transport = Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        CheckpointStore._shared = {}
+
+    def _json_response(self, payload):
+        response = Mock()
+        response.status_code = 200
+        response.headers = {}
+        response.json.return_value = payload
+        return response
+
+    def _facebook(self, **settings):
+        config = DataSourceConfig(
+            {'ad_account_id': 'act_1', 'access_token': 'test_token'},
+            dict({'checkpoint_dir': self.directory}, **settings)
+        )
+        source = FacebookAdsSource(config, transport=self.transport)
+        source.token = 'test_token'
+        return source
+
+    def test_facebook_resumes_from_paging_next(self):
+        source = self._facebook(insights_mode='sync')
+        self.transport.get.side_effect = [
+            self._json_response({'data': [{'ad_id': '1'}], 'paging': {'next': 'https://graph/act_1/insights?after=a'}}),
+            self._json_response({'data': [{'ad_id': '2'}], 'paging': {'next': 'https://graph/act_1/insights?after=b'}}),
+            ConnectionError('connection reset'),
+        ]
+        # fetch_data 失败时返回空列表，但进度已保存
+        self.assertEqual(source.fetch_data(datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id']), [])
+
+        self.transport.get.reset_mock()
+        self.transport.get.side_effect = [self._json_response({'data': [{'ad_id': '3'}], 'paging': {}})]
+        rows = self._facebook(insights_mode='sync').fetch_data(
+            datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id'])
+
+        self.assertEqual([row['ad_id'] for row in rows], ['1', '2', '3'])
+        self.assertEqual(self.transport.get.call_args.args[0], 'https://graph/act_1/insights?after=b')
+        self.assertEqual(self.transport.get.call_count, 1)
+
+    @patch('datahub.sources.facebook_ads.time.sleep')
+    def test_facebook_async_resume_reuses_report_run(self, mock_sleep):
+        source = self._facebook(insights_mode='async')
+        self.transport.post.return_value = self._json_response({'report_run_id': 'run_1'})
+        self.transport.get.side_effect = ConnectionError('connection reset')
+        with self.assertRaises(ConnectionError):
+            list(source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id']))
+
+        self.transport.post.reset_mock()
+        self.transport.get.side_effect = [
+            self._json_response({'async_status': 'Job Completed'}),
+            self._json_response({'data': [{'ad_id': '1'}], 'paging': {}}),
+        ]
+        pages = list(self._facebook(insights_mode='async').iter_pages(
+            datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id']))
+
+        self.assertEqual(pages, [[{'ad_id': '1'}]])
+        self.transport.post.assert_not_called()
+        self.assertTrue(self.transport.get.call_args.args[0].endswith('/run_1/insights'))
+
+    def test_google_resumes_from_page_token(self):
+        config = DataSourceConfig({'customer_id': 'c1', 'access_token': 't'}, {'checkpoint_dir': self.directory})
+        source = GoogleAdsSource(config, transport=self.transport)
+        source.token = 't'
+        self.transport.post.side_effect = [
+            self._json_response({'results': [{'campaign': {'id': '1'}}], 'nextPageToken': 'token-2'}),
+            ConnectionError('connection reset'),
+        ]
+        with self.assertRaises(ConnectionError):
+            list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 1), [], ['campaign.id']))
+
+        self.transport.post.reset_mock()
+        self.transport.post.side_effect = [self._json_response({'results': [{'campaign': {'id': '2'}}]})]
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 1), [], ['campaign.id']))
+
+        self.assertEqual(rows, [{'campaign.id': 1}, {'campaign.id': 2}])
+        self.assertEqual(self.transport.post.call_args.kwargs['json']['pageToken'], 'token-2')
+
+    def test_facebook_overlapping_lookbacks(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = KeyedRowStore(os.path.join(directory, 'rows.db'))
+        self.addCleanup(store.close)
+        restated = {}
+
+        def insights(url, **kwargs):
+            # 按 time_increment=1 返回每天每个广告一行
+            params = kwargs['params']
+            self.assertEqual(params['time_increment'], 1)
+            time_range = json.loads(params['time_range'])
+            day, last = (datetime.strptime(time_range[key], '%Y-%m-%d') for key in ('start_date', 'end_date'))
+            rows = []
+            while day <= last:
+                date = day.strftime('%Y-%m-%d')
+                rows.append({'date_start': date, 'date_stop': date, 'ad_id': '1',
+                             'clicks': restated.get(date, '1')})
+                day += timedelta(days=1)
+            response = Mock()
+            response.status_code = 200
+            response.headers = {}
+            response.json.return_value = {'data': rows, 'paging': {}}
+            return response
+
+        facebook = FacebookAdsSource(DataSourceConfig({'ad_account_id': 'act_1'},
+                                                      {'insights_mode': 'sync', 'time_increment': 1}),
+                                     transport=self.transport)
+        facebook.token = 'test_token'
+        self.transport.get.side_effect = insights
+        first = facebook.fetch_changes(store, datetime(2023, 1, 1), datetime(2023, 1, 7), ['clicks'], ['ad_id'],
+                                       namespace='fb')
+        self.assertEqual(first.inserted, 7)
+
+        # 第二个回溯窗口与第一个重叠 3 天，其中 1 月 5 日的数据被修正
+        restated['2023-01-05'] = '9'
+        second = facebook.fetch_changes(store, datetime(2023, 1, 5), datetime(2023, 1, 10), ['clicks'], ['ad_id'],
+                                        namespace='fb')
+        self.assertEqual((second.inserted, second.updated, second.unchanged), (3, 1, 2))
+        self.assertEqual([row['date_start'] for row in second.changed],
+                         ['2023-01-05', '2023-01-08', '2023-01-09', '2023-01-10'])
+        self.assertEqual(store.count('fb'), 10)
+
+        # 未设置 time_increment 时行是整个区间的合计，拒绝按天去重
+        aggregated = FacebookAdsSource(DataSourceConfig({'ad_account_id': 'act_1'}, {}), transport=self.transport)
+        with self.assertRaises(ValueError):
+            aggregated.fetch_changes(store, datetime(2023, 1, 1), datetime(2023, 1, 7), ['clicks'], ['ad_id'])
+
+    def test_natural_keys(self):
+        facebook = FacebookAdsSource(DataSourceConfig({'ad_account_id': 'act_1'}, {'level': 'campaign'}))
+        self.assertEqual(facebook.natural_key(['spend'], ['campaign_id', 'campaign_name']),
+                         ['date_start', 'campaign_id'])
+        # 未请求层级 ID 时退回到全部维度
+        self.assertEqual(facebook.natural_key(['spend'], ['campaign_name']), ['date_start', 'campaign_name'])
+
+        google = GoogleAdsSource(DataSourceConfig({'customer_id': '1'}, {}))
+        self.assertEqual(google.natural_key(['metrics.clicks'], ['segments.date', 'ad_group.id', 'ad_group.name',
+                                                                 'segments.device']),
+                         ['ad_group.id', 'segments.date', 'segments.device'])
+        self.assertEqual(google.natural_key(['metrics.clicks'], ['campaign.name']),
+                         ['segments.date', 'campaign.name'])
+
+class TestResponseDecoding(unittest.TestCase):
+    def setUp(self):
+        self.transport = Mock()
+
+    def _streamed(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        response = Mock()
+        response.status_code = 200
+        response.headers = {}
+        response.iter_content.return_value = [body[i:i + 16] for i in range(0, len(body), 16)]
+        return response
+
+    def test_raw_body_uses_configured_decoder(self):
+        config = DataSourceConfig({'ad_account_id': 'act_1'}, {'insights_mode': 'sync', 'json_decoder': 'json'})
+        source = FacebookAdsSource(config, transport=self.transport)
+        source.token = 'test_token'
+        response = Mock(status_code=200, headers={})
+        response.content = json.dumps({'data': [{'ad_id': '1'}], 'paging': {}}).encode('utf-8')
+        self.transport.get.return_value = response
+        with patch.object(source.decoder, 'loads', wraps=source.decoder.loads) as loads:
+            rows = source.fetch_data(datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id'])
+        self.assertEqual(rows, [{'ad_id': '1'}])
+        loads.assert_called_once_with(response.content)
+        response.json.assert_not_called()
+
+    def test_facebook_incremental_mode(self):
+        config = DataSourceConfig({'ad_account_id': 'act_1'}, {'insights_mode': 'sync', 'decode_mode': 'incremental'})
+        source = FacebookAdsSource(config, transport=self.transport)
+        source.token = 'test_token'
+        self.transport.get.side_effect = [
+            self._streamed({'data': [{'ad_id': '1'}, {'ad_id': '2'}], 'paging': {'next': 'https://graph/next'}}),
+            self._streamed({'data': [{'ad_id': '3'}], 'paging': {}}),
+        ]
+        pages = list(source.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 1), ['clicks'], ['ad_id']))
+        self.assertEqual(pages, [[{'ad_id': '1'}, {'ad_id': '2'}], [{'ad_id': '3'}]])
+        self.assertTrue(self.transport.get.call_args_list[0].kwargs['stream'])
+        self.assertEqual(self.transport.get.call_args_list[1].args[0], 'https://graph/next')
+
+    def test_google_incremental_mode_flattens_streamed_rows(self):
+        config = DataSourceConfig({'customer_id': 'c1'}, {'decode_mode': 'incremental'})
+        source = GoogleAdsSource(config, transport=self.transport)
+        source.token = 't'
+        first = self._streamed({'results': [{'campaign': {'id': '1'}, 'metrics': {'costMicros': '1500000'}}],
+                                'nextPageToken': 'token-2'})
+        self.transport.post.side_effect = [
+            first,
+            self._streamed({'results': [{'campaign': {'id': '2'}}]}),
+        ]
+        rows = list(source.iter_rows(datetime(2023, 1, 1), datetime(2023, 1, 1),
+                                     ['metrics.cost_micros'], ['campaign.id']))
+        self.assertEqual(rows, [
+            {'campaign.id': 1, 'metrics.cost_micros': 1500000, 'metrics.cost': Decimal('1.5')},
+            {'campaign.id': 2, 'metrics.cost_micros': 0, 'metrics.cost': Decimal('0')},
+        ])
+        self.assertEqual(self.transport.post.call_args.kwargs['json']['pageToken'], 'token-2')
+        first.close.assert_called_once()
+
+class TestSchemaNormalizer(unittest.TestCase):
+    def test_facebook_and_google_pages_merge_into_one_schema(self):
+        facebook_page = [
+            {'date_start': '2023-01-01', 'campaign_id': '11', 'campaign_name': 'FB',
+             'impressions': '1000', 'clicks': '10', 'spend': '12.50'},
+        ]
+        google_page = [
+            {'segments.date': '2023-01-01', 'campaign.id': 22, 'campaign.name': 'G',
+             'metrics.impressions': 500, 'metrics.clicks': 5, 'metrics.cost_micros': 2500000},
+            {'segments.date': '2023-01-02', 'campaign.id': 22, 'campaign.name': 'G',
+             'metrics.impressions': 300, 'metrics.clicks': 0, 'metrics.cost_micros': 0},
+        ]
+        facebook = next(SchemaNormalizer.normalize_pages(
+            'facebook_ads', [facebook_page], dimensions=['campaign_id']))
+        google = next(SchemaNormalizer.normalize_pages('google_ads', [google_page]))
+
+        merged = ColumnarBatch.concat([facebook, google])
+        rows = merged.to_rows()
+        self.assertEqual(set(merged.field_names), set(CANONICAL_SCHEMA) | {'source_type'})
+        self.assertEqual([row['campaign_id'] for row in rows], ['11', '22', '22'])
+        self.assertEqual([row['impressions'] for row in rows], [1000, 500, 300])
+        self.assertEqual([row['cost'] for row in rows], [12.5, 2.5, 0.0])
+        self.assertEqual([row['source_type'] for row in rows], ['facebook_ads', 'google_ads', 'google_ads'])
+        self.assertIsNone(rows[0]['ad_id'])
+        self.assertEqual(merged.field_type('clicks'), 'int64')
+
+    def test_fallback_without_numpy(self):
+        page = [{'segments.date': '2023-01-01', 'campaign.id': 7, 'metrics.cost_micros': 1500000}]
+        with patch('datahub.core.columnar.np', None), patch('datahub.core.normalization.np', None):
+            batch = next(SchemaNormalizer.normalize_pages('google_ads', [page]))
+        self.assertEqual(batch.column('campaign_id'), ['7'])
+        self.assertEqual(batch.column('cost'), [1.5])
+
+    def test_unknown_source_type(self):
+        with self.assertRaises(ValueError):
+            SchemaNormalizer.normalize_batch('unknown_source', ColumnarBatch.from_rows([]))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from unittest.mock import patch
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from datahub.core.data_source import DataSource, DataSourceConfig
+from datahub.sinks import create_sink, JsonLinesSink, CsvSink
+
+def make_rows(count, days=2):
+    return [
+        {'date_start': f'2023-01-0{index % days + 1}', 'campaign_id': str(index),
+         'clicks': index, 'spend': Decimal('1.25')}
+        for index in range(count)
+    ]
+
+class PagedSource(DataSource):
+    def connect(self) -> bool:
+        return True
+
+    def validate_credentials(self) -> bool:
+        return True
+
+    def fetch_data(self, start_date, end_date, metrics, dimensions):
+        return []
+
+    def _iter_api_pages(self, start_date, end_date, metrics, dimensions):
+        for page in range(3):
+            yield make_rows(4)
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _files(self):
+        found = []
+        for directory, _, names in os.walk(self.root):
+            found.extend(os.path.relpath(os.path.join(directory, name), self.root) for name in names)
+        return sorted(found)
+
+    def test_jsonl_partitions_by_source_and_day(self):
+        with JsonLinesSink(self.root, chunk_rows=2) as sink:
+            sink.write_page(make_rows(6), 'fb_main')
+        self.assertEqual(sink.rows_written, 6)
+        self.assertEqual([os.path.dirname(path) for path in self._files()], [
+            'source=fb_main/date=2023-01-01', 'source=fb_main/date=2023-01-02'
+        ])
+        with gzip.open(sink.committed_files[0], 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['clicks'] for row in rows], [0, 2, 4])
+        self.assertEqual(rows[0]['spend'], 1.25)
+
+    def test_files_are_hidden_until_close(self):
+        sink = CsvSink(self.root, chunk_rows=1)
+        sink.write_page(make_rows(2), 'fb')
+        # 关闭前只有隐藏的临时文件
+        self.assertTrue(all(os.path.basename(path).startswith('.') for path in self._files()))
+        sink.close()
+        self.assertEqual(len(self._files()), 2)
+        self.assertFalse(any(os.path.basename(path).startswith('.') for path in self._files()))
+
+    def test_abort_removes_partial_output(self):
+        with self.assertRaises(RuntimeError):
+            with JsonLinesSink(self.root, chunk_rows=1) as sink:
+                sink.write_page(make_rows(3), 'fb')
+                raise RuntimeError('fetch failed')
+        self.assertEqual(self._files(), [])
+
+    def test_buffered_rows_are_bounded(self):
+        sink = JsonLinesSink(self.root, chunk_rows=4, max_buffered_rows=5, compression=None)
+        rows = make_rows(12, days=3)
+        with patch.object(sink, '_write', wraps=sink._write) as write:
+            for start in range(0, 12, 3):
+                sink.write_page(rows[start:start + 3], 'fb')
+                # 三个分区各自未满一个 chunk，但总缓冲行数受限
+                self.assertLessEqual(sink._buffered_rows, 5)
+            self.assertTrue(write.called)
+        sink.close()
+        lines = sum(1 for path in sink.committed_files for _ in open(path))
+        self.assertEqual(lines, 12)
+
+    def test_csv_new_fields_start_a_new_file(self):
+        with CsvSink(self.root, chunk_rows=2, max_open_files=1) as sink:
+            sink.write_page([{'date': '2023-01-01', 'clicks': 1}, {'date': '2023-01-01', 'clicks': 2}], 'g')
+            sink.write_page([{'date': '2023-01-01', 'clicks': 3, 'cost': 1.5},
+                             {'date': '2023-01-01', 'clicks': 4, 'cost': 2.5}], 'g')
+        headers = []
+        for path in sink.committed_files:
+            with open(path, newline='') as f:
+                headers.append(next(csv.reader(f)))
+        self.assertEqual(headers, [['date', 'clicks'], ['date', 'clicks', 'cost']])
+
+    def test_max_rows_per_file(self):
+        with JsonLinesSink(self.root, chunk_rows=10, max_rows_per_file=4) as sink:
+            sink.write_page(make_rows(10, days=1), 'fb')
+        self.assertEqual(len(sink.committed_files), 3)
+
+    def test_parquet_row_groups(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow not installed')
+        with create_sink('parquet', self.root, row_group_size=2, dimensions=['campaign_id']) as sink:
+            sink.write_page(make_rows(8, days=1), 'fb')
+        self.assertEqual(len(sink.committed_files), 1)
+        parquet_file = pq.ParquetFile(sink.committed_files[0])
+        self.assertEqual(parquet_file.metadata.num_row_groups, 4)
+        table = parquet_file.read()
+        self.assertEqual(table.column('campaign_id').to_pylist(), [str(i) for i in range(8)])
+        self.assertEqual(table.column('clicks').to_pylist(), list(range(8)))
+
+    def test_unwritten_parquet_part_is_not_committed(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow not installed')
+        with create_sink('parquet', self.root) as sink:
+            sink.write_page(make_rows(2, days=1), 'fb')
+            # 打开后从未写入的文件不会以零字节文件提交
+            sink._open_part(('fb', '2023-01-02'))
+        self.assertEqual(len(sink.committed_files), 1)
+        self.assertEqual(self._files(), [os.path.relpath(sink.committed_files[0], self.root)])
+        self.assertEqual(pq.read_table(sink.committed_files[0]).num_rows, 2)
+
+    def test_source_export(self):
+        source = PagedSource(DataSourceConfig({}, {}))
+        with create_sink('jsonl', self.root) as sink:
+            rows = source.export(datetime(2023, 1, 1), datetime(2023, 1, 2), ['clicks'], [], sink, 'paged')
+        self.assertEqual(rows, 12)
+        self.assertEqual(sink.rows_written, 12)
+        self.assertTrue(all(path.startswith('source=paged/') for path in self._files()))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            create_sink('xml', self.root)
+
+if __name__ == '__main__':
+    unittest.main()